@@ -0,0 +1,123 @@
+"""Паритет и скорость бэкендов TrOCR (eager, int8, compile, onnx) и способов декодирования
+(generate, greedy) на одних и тех же кропах.
+
+По умолчанию берутся кропы с разметкой из benchmarks/fixtures/words (labels.tsv: имя файла
+и текст через табуляцию, см. make_word_fixtures). Для каждой комбинации считаются CER и доля
+точных совпадений относительно разметки, а также паритет с эталоном - первой комбинацией,
+по умолчанию eager/generate. Скрипт завершается с кодом 1, если что-то совпало с эталоном
+реже --min-match или CER по разметке хуже эталонного больше чем на --max-cer-increase.
+
+    python -m benchmarks.bench_backends --backends eager int8 onnx
+    python -m benchmarks.bench_backends --images path/to/word_crops --backends eager --decoders generate greedy
+
+--synthetic - синтетические штрихи из bench_batching: только скорость, паритет на них мало что значит.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import torch
+from PIL import Image
+from rapidfuzz.distance import Levenshtein
+from transformers import TrOCRProcessor
+from bot_utils.resize import resize_with_aspect_and_padding
+from recognizer_service import config
+from recognizer_service.backends import BACKENDS, DECODERS, load_backend
+from benchmarks.bench_batching import synthetic_crops
+from benchmarks.make_word_fixtures import FIXTURES_DIR
+
+
+def load_crops(images_dir, limit):
+    """Кропы и ожидаемые тексты. Тексты берутся из labels.tsv, без него - None"""
+    labels_path = os.path.join(images_dir, "labels.tsv")
+    if os.path.exists(labels_path):
+        with open(labels_path, encoding="utf-8") as f:
+            labelled = [line.rstrip("\n").split("\t", 1) for line in f if line.strip()]
+        names, labels = [name for name, _ in labelled], [text for _, text in labelled]
+    else:
+        names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith((".png", ".jpg", ".jpeg")))
+        labels = None
+    crops = [Image.open(os.path.join(images_dir, n)).convert("RGB") for n in names[:limit]]
+    return crops, labels[:limit] if labels else None
+
+
+def cer(texts, expected):
+    return sum(Levenshtein.distance(a, b) for a, b in zip(texts, expected)) / max(1, sum(map(len, expected)))
+
+
+def recognize(backend, processor, images, batch_size):
+    texts, timings = [], []
+    for start in range(0, len(images), batch_size):
+        pixel_values = processor(images=images[start:start + batch_size], return_tensors="pt").pixel_values
+        begin = time.perf_counter()
+        generated_ids = backend.generate(pixel_values, config.max_length)
+        timings.append(time.perf_counter() - begin)
+        texts.extend(processor.batch_decode(generated_ids, skip_special_tokens=True))
+    return texts, timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=FIXTURES_DIR, help="папка с кропами слов и labels.tsv")
+    parser.add_argument("--synthetic", action="store_true", help="синтетические кропы вместо --images")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--decoders", nargs="+", default=["generate"], choices=DECODERS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--min-match", type=float, default=0.95)
+    parser.add_argument("--max-cer-increase", type=float, default=0.02,
+                        help="допустимый рост CER по разметке относительно эталона")
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    processor = TrOCRProcessor.from_pretrained(config.processor_dir)
+    if args.synthetic:
+        crops, labels = synthetic_crops(args.limit)[0], None
+    else:
+        crops, labels = load_crops(args.images, args.limit)
+    images = [resize_with_aspect_and_padding(c) for c in crops]
+
+    reference = None
+    failed = False
+    for name in args.backends:
+        for decoder in (["generate"] if name == "onnx" else args.decoders):
+            label = f"{name}/{decoder}"
+            start = time.perf_counter()
+            try:
+                backend = load_backend(name, config.model_dir, device, config.onnx_dir, config.compile_mode,
+                                       decoder, config.repeat_stop)
+            except (RuntimeError, ValueError) as e:
+                print(f"{label:16s} пропущен: {e}")
+                continue
+            load_time = time.perf_counter() - start
+
+            # прогрев: для compile и onnx первые вызовы включают компиляцию
+            recognize(backend, processor, images[:max(args.batch_sizes)], max(args.batch_sizes))
+
+            print(f"{label:16s} загрузка {load_time:6.1f} с")
+            for batch_size in args.batch_sizes:
+                texts, timings = recognize(backend, processor, images, batch_size)
+                print(f"  батч {batch_size:3d}: p50 {statistics.median(timings) * 1000:8.1f} мс, "
+                      f"{len(images) / sum(timings):7.1f} кропов/с")
+
+            if labels is not None:
+                label_cer = cer(texts, labels)
+                exact = sum(a.strip() == b for a, b in zip(texts, labels)) / len(labels)
+                print(f"  по разметке: CER {label_cer:.2%}, точных совпадений {exact:.1%}")
+
+            if reference is None:
+                reference, reference_label = texts, label
+                reference_cer = label_cer if labels is not None else None
+                continue
+            match = sum(a == b for a, b in zip(texts, reference)) / len(reference)
+            print(f"  паритет с {reference_label}: совпадений {match:.1%}, CER {cer(texts, reference):.2%}")
+            failed |= match < args.min_match
+            if labels is not None:
+                failed |= label_cer > reference_cer + args.max_cer_increase
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Микробенчмарк постобработки рамок: списочный API против векторного на синтетических страницах.
+Перед замерами проверяется, что удаление дублей не теряет соседние слова.
+
+    python -m benchmarks.bench_crop --sizes 10 100 1000 5000
+"""
+import argparse
+import time
+import numpy as np
+from bot_utils import crop
+
+
+def synthetic_page(n_boxes, width=2480, height=3508, seed=0):
+    """Страница с рукописными «словами»: строки с небольшим разбросом по высоте"""
+    rng = np.random.default_rng(seed)
+    words_per_line = 10
+    n_lines = max(1, -(-n_boxes // words_per_line))
+    line_height = 1 / (n_lines + 1)
+
+    line = np.repeat(np.arange(n_lines), words_per_line)[:n_boxes]
+    column = np.tile(np.arange(words_per_line), n_lines)[:n_boxes]
+
+    boxes = np.empty((n_boxes, 6), dtype=np.float32)
+    boxes[:, 0] = 0
+    boxes[:, 1] = (column + 0.5) / words_per_line + rng.normal(0, 0.005, n_boxes)
+    boxes[:, 2] = (line + 1) * line_height + rng.normal(0, line_height * 0.08, n_boxes)
+    boxes[:, 3] = rng.uniform(0.04, 0.09, n_boxes)
+    boxes[:, 4] = line_height * rng.uniform(0.5, 0.8, n_boxes)
+    boxes[:, 5] = rng.uniform(0.7, 1.0, n_boxes)
+    return boxes, width, height
+
+
+def run_list(boxes, width, height):
+    pixel_coords = crop.convert_to_pixel_coords(boxes.tolist(), width, height)
+    return crop.sort_coords(pixel_coords)
+
+
+def run_array(boxes, width, height, dedupe=False):
+    pixel_boxes = crop.to_pixel_boxes(boxes, width, height)
+    if dedupe:
+        pixel_boxes = pixel_boxes[crop.deduplicate_boxes(pixel_boxes, boxes[:, 5], 0.7, "iou")]
+    return crop.group_lines_array(pixel_boxes)
+
+
+def check_dedupe():
+    """Удаление дублей в режиме iou убирает повторные рамки одного слова,
+    но оставляет соседние слова, даже если их рамки заметно перекрываются"""
+    boxes = np.array([
+        [100, 100, 500, 160],   # длинное слово
+        [104, 102, 498, 161],   # его дубль
+        [470, 105, 540, 158],   # короткий предлог, налезает на длинное слово
+        [550, 100, 700, 160],   # следующее слово вплотную
+        [300, 90, 360, 170],    # высокая короткая рамка внутри длинного слова
+    ])
+    scores = np.array([0.9, 0.8, 0.85, 0.9, 0.7])
+    keep = crop.deduplicate_boxes(boxes, scores, 0.7, "iou").tolist()
+    assert keep == [0, 2, 3, 4], keep
+
+
+def measure(fn, *args, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    check_dedupe()
+    print(f"{'рамок':>6} | {'списки, мс':>11} | {'numpy, мс':>10} | {'numpy+NMS, мс':>13}")
+    for size in args.sizes:
+        page = synthetic_page(size)
+        print(f"{size:>6} | {measure(run_list, *page, repeat=args.repeat):>11.3f} | "
+              f"{measure(run_array, *page, repeat=args.repeat):>10.3f} | "
+              f"{measure(run_array, *page, True, repeat=args.repeat):>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Сравнение задержки детекции YOLOv5 в режимах inprocess и subprocess.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_detector path/to/image.jpg --runs 10
+"""
+import argparse
+import statistics
+import time
+from PIL import Image
+from recognizer_service import config
+from recognizer_service.detector import load_detector
+
+
+def measure(detector, image, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        detector.detect(image)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings, load_time):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<11} загрузка {load_time * 1000:8.1f} мс | "
+          f"среднее {statistics.mean(timings) * 1000:8.1f} мс | "
+          f"p50 {statistics.median(timings) * 1000:8.1f} мс | "
+          f"p95 {p95 * 1000:8.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=["inprocess", "subprocess"])
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert("RGB")
+
+    for mode in args.modes:
+        start = time.perf_counter()
+        detector = load_detector(mode, config.yolo_dir, config.yolo_weights, config.yolo_conf)
+        load_time = time.perf_counter() - start
+
+        # первый вызов прогревает модель и не учитывается
+        detector.detect(image)
+        report(mode, measure(detector, image, args.runs), load_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Стоимость одной проверки LanguageTool: новый экземпляр на каждый вызов
+(как было раньше) против долгоживущего пула.
+
+    python -m benchmarks.bench_language_tool --runs 5
+"""
+import argparse
+import statistics
+import time
+from bot_utils.grammar_pool import LanguageToolPool
+
+TEXT = "Вчера мы ходили в магазин и купили малако, хлеб и много других продуктов."
+
+
+def per_call(text):
+    import language_tool_python
+    tool = language_tool_python.LanguageTool("ru-RU")
+    try:
+        return tool.check(text)
+    finally:
+        tool.close()
+
+
+def measure(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(TEXT)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<10} среднее {statistics.mean(timings) * 1000:9.1f} мс | "
+          f"p50 {statistics.median(timings) * 1000:9.1f} мс | "
+          f"макс {max(timings) * 1000:9.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    report("per-call", measure(per_call, args.runs))
+
+    pool = LanguageToolPool(size=1, health_interval=0)
+    start = time.perf_counter()
+    pool.start()
+    print(f"прогрев пула: {(time.perf_counter() - start) * 1000:.1f} мс")
+    report("pool", measure(pool.check, args.runs))
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Точность и скорость группировки слов в строки на синтетических раскладках.
+
+Сравнивает простую группировку crop.group_lines_array с layout.analyze_layout
+на ровных, наклонных, разномасштабных и двухколоночных страницах.
+
+    python -m benchmarks.bench_layout --pages 20 --sizes 100 1000 5000
+"""
+import argparse
+import time
+import numpy as np
+from bot_utils import crop, layout
+
+
+def synthetic_layout(kind, n_words, seed=0, width=2480, height=3508):
+    """Возвращает рамки N×4 и эталонные строки (списки индексов в порядке чтения)"""
+    rng = np.random.default_rng(seed)
+    columns = 2 if kind == "columns" else 1
+    words_per_line = 6 if columns == 2 else 10
+    n_lines = max(1, -(-n_words // words_per_line))
+    lines_per_column = -(-n_lines // columns)
+    column_width = width / columns
+    line_step = height / (lines_per_column + 1)
+    skew = rng.choice([-1, 1]) * rng.uniform(0.04, 0.12) if kind == "skewed" else 0.0
+
+    boxes, truth = [], []
+    placed = 0
+    for line in range(n_lines):
+        column, row = divmod(line, lines_per_column)
+        base_height = line_step * (rng.uniform(0.35, 0.6) if kind == "mixed" else 0.45)
+        x = column * column_width + column_width * 0.05
+        y = (row + 1) * line_step
+        words = []
+        for _ in range(min(words_per_line, n_words - placed)):
+            word_width = rng.uniform(0.5, 0.8) * column_width * 0.85 / words_per_line
+            if kind == "mixed":
+                # слова разного размера выровнены по базовой линии, а не по центру
+                word_height = base_height * rng.uniform(0.5, 1.4)
+                y_center = y + base_height / 2 - word_height / 2 + rng.normal(0, base_height * 0.08)
+            else:
+                word_height = base_height * rng.uniform(0.8, 1.2)
+                y_center = y + skew * x + rng.normal(0, base_height * 0.08)
+            boxes.append((x, y_center - word_height / 2, x + word_width, y_center + word_height / 2))
+            words.append(placed)
+            placed += 1
+            x += word_width + column_width * 0.85 / words_per_line * rng.uniform(0.2, 0.4)
+        truth.append(words)
+
+    return np.array(boxes), truth
+
+
+def line_accuracy(predicted, truth):
+    """Доля эталонных строк, восстановленных точно (те же слова в том же порядке)"""
+    predicted = {tuple(line.tolist()) for line in predicted}
+    return sum(tuple(line) in predicted for line in truth) / len(truth)
+
+
+def order_accuracy(predicted, truth):
+    """Совпадает ли полный порядок чтения страницы"""
+    flat_predicted = np.concatenate(predicted).tolist() if predicted else []
+    return float(flat_predicted == [word for line in truth for word in line])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words", type=int, default=120)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    engines = {
+        "simple": lambda boxes: crop.group_lines_array(boxes),
+        "layout": lambda boxes: layout.analyze_layout(boxes).lines,
+    }
+
+    print("Точность (строки / порядок чтения):")
+    for kind in ["straight", "skewed", "mixed", "columns"]:
+        row = []
+        for name, engine in engines.items():
+            lines_score = order_score = 0
+            for seed in range(args.pages):
+                boxes, truth = synthetic_layout(kind, args.words, seed)
+                predicted = engine(boxes)
+                lines_score += line_accuracy(predicted, truth)
+                order_score += order_accuracy(predicted, truth)
+            row.append(f"{name}: {lines_score / args.pages:5.1%} / {order_score / args.pages:5.1%}")
+        print(f"  {kind:<9} " + " | ".join(row))
+
+    print("Время, мс:")
+    for size in args.sizes:
+        boxes, _ = synthetic_layout("skewed", size)
+        row = []
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            engine(boxes)
+            row.append(f"{name}: {(time.perf_counter() - start) * 1000:8.2f}")
+        print(f"  {size:>5} слов  " + " | ".join(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Сквозная проверка асинхронного бота против фейкового Bot API и заглушки распознавания.
+
+Поднимает обе заглушки, запускает bot_async.py отдельным процессом, присылает
+фото из нескольких чатов одновременно и ждёт итоговых ответов.
+
+    python -m benchmarks.bot_e2e --chats 20 --delay 1.0
+    python -m benchmarks.bot_e2e --mode webhook
+    python -m benchmarks.bot_e2e --album 5
+    python -m benchmarks.bot_e2e --queue --workers 4
+
+С --queue бот работает в режиме очереди заданий (RECOGNIZER_MODE=queue), а задания
+выполняют воркеры-заглушки в этом процессе через общий файл SQLite.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import tempfile
+import threading
+import subprocess
+import aiohttp
+from aiohttp import web
+from bot_utils.messages import PHOTO_DONE_TEXT, ALBUM_DONE_TEXT
+from bot_utils.job_queue import SQLiteJobQueue
+from benchmarks.stubs import FakeTelegram, make_telegram_app, make_recognizer_app
+
+
+def stub_worker(path, delay, stop):
+    """Воркер очереди без моделей: отвечает фиксированным текстом через delay секунд"""
+    queue = SQLiteJobQueue(path)
+    while not stop.is_set():
+        job = queue.claim("stub")
+        if job is None:
+            stop.wait(0.05)
+            continue
+        time.sleep(delay)
+        text = f"{job.kind}: {len(job.files)} файл(ов)"
+        queue.complete(job, {"recognized_text": text, "corrected_text": text, "errors": ""})
+
+
+async def start_app(app, port):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run(args):
+    telegram = FakeTelegram()
+    runners = [
+        await start_app(make_telegram_app(telegram), args.telegram_port),
+        await start_app(make_recognizer_app(args.delay), args.recognizer_port),
+    ]
+
+    webhook_url = f"http://127.0.0.1:{args.webhook_port}/telegram"
+    queue_dir = tempfile.TemporaryDirectory()
+    queue_path = os.path.join(queue_dir.name, "jobs.sqlite3")
+    stop_workers = threading.Event()
+    workers = []
+    if args.queue:
+        SQLiteJobQueue(queue_path)
+        workers = [threading.Thread(target=stub_worker, args=(queue_path, args.delay, stop_workers))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+
+    env = dict(os.environ,
+               RECOGNIZER_MODE="queue" if args.queue else "http",
+               JOB_QUEUE_BACKEND="sqlite",
+               JOB_QUEUE_PATH=queue_path,
+               bot="123:fake",
+               BOT_MODE=args.mode,
+               WEBHOOK_URL=webhook_url,
+               WEBHOOK_HOST="127.0.0.1",
+               WEBHOOK_PORT=str(args.webhook_port),
+               TELEGRAM_API_URL=f"http://127.0.0.1:{args.telegram_port}",
+               RECOGNIZER_URL=f"http://127.0.0.1:{args.recognizer_port}")
+    bot_process = subprocess.Popen([sys.executable, "bot_async.py"], env=env)
+
+    try:
+        await asyncio.sleep(args.startup)
+        sent_at = {}
+        async with aiohttp.ClientSession() as session:
+            for chat_id in range(1, args.chats + 1):
+                # альбом - несколько фото с общим media_group_id, бот должен ответить на него один раз
+                group = f"album{chat_id}" if args.album > 1 else None
+                for _ in range(max(1, args.album)):
+                    update = telegram.inject(chat_id, "photo", media_group_id=group)
+                    if args.mode == "webhook":
+                        telegram.updates.remove(update)
+                        async with session.post(webhook_url, json=update) as response:
+                            response.raise_for_status()
+                sent_at[chat_id] = time.time()
+
+        done_text = ALBUM_DONE_TEXT if args.album > 1 else PHOTO_DONE_TEXT
+        done_at = {}
+        deadline = time.time() + args.timeout
+        while len(done_at) < args.chats and time.time() < deadline:
+            for item in telegram.sent:
+                if item["method"] == "sendMessage" and item["text"] == done_text:
+                    done_at.setdefault(item["chat_id"], item["time"])
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(args.album_wait)
+        answers = sum(1 for item in telegram.sent if item["method"] == "sendMessage" and item["text"] == done_text)
+    finally:
+        bot_process.terminate()
+        bot_process.wait()
+        stop_workers.set()
+        for worker in workers:
+            worker.join()
+        queue_dir.cleanup()
+        for runner in runners:
+            await runner.cleanup()
+
+    latencies = [done_at[chat_id] - sent_at[chat_id] for chat_id in done_at]
+    typing_threads = sum(1 for item in telegram.sent if item["method"] == "sendChatAction")
+    print(f"чатов: {args.chats}, ответили: {len(done_at)}, "
+          f"задержка распознавания заглушки: {args.delay:.2f} с, статусов набора: {typing_threads}")
+    if latencies:
+        print(f"задержка ответа: среднее {statistics.mean(latencies):.2f} с, "
+              f"макс {max(latencies):.2f} с")
+    if answers != len(done_at):
+        print(f"лишних итоговых ответов: {answers - len(done_at)}")
+    return len(done_at) == args.chats and answers == args.chats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--startup", type=float, default=2.0)
+    parser.add_argument("--album", type=int, default=1, help="фото в альбоме от каждого чата")
+    parser.add_argument("--queue", action="store_true", help="режим очереди заданий с воркерами-заглушками")
+    parser.add_argument("--workers", type=int, default=2, help="воркеров-заглушек в режиме очереди")
+    parser.add_argument("--album-wait", type=float, default=1.5, help="сколько ждать повторных ответов, с")
+    parser.add_argument("--telegram-port", type=int, default=8082)
+    parser.add_argument("--recognizer-port", type=int, default=8083)
+    parser.add_argument("--webhook-port", type=int, default=8084)
+    args = parser.parse_args()
+
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
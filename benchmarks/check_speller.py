@@ -0,0 +1,113 @@
+"""Проверка асинхронного клиента Яндекс-спеллера (bot_utils/speller.py) против заглушки
+из benchmarks.stubs: ответы checkText и checkTexts, группировка checkTexts по лимиту
+размера запроса, повторы с экспоненциальной задержкой при 5xx и 429, таймауты.
+
+    python -m benchmarks.check_speller
+
+Код возврата 1, если какая-то проверка не прошла.
+"""
+import sys
+import time
+import asyncio
+import logging
+from aiohttp import web
+from bot_utils.speller import YandexSpeller, SpellerError, MAX_REQUEST_CHARS
+from benchmarks.stubs import make_speller_app
+
+
+async def start_stub(**kwargs):
+    app = make_speller_app(**kwargs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return app, runner, f"http://127.0.0.1:{port}/services/spellservice.json"
+
+
+async def with_speller(check, backoff=0.05, timeout=5, **stub_kwargs):
+    app, runner, url = await start_stub(**stub_kwargs)
+    speller = YandexSpeller(url, timeout=timeout, retries=3, backoff=backoff)
+    try:
+        return await check(app, speller)
+    finally:
+        await speller.close()
+        await runner.cleanup()
+
+
+async def check_text(app, speller):
+    result = await speller.check_text("Я пил малако")
+    assert [(item["word"], item["s"], item["pos"]) for item in result] == [("малако", ["молоко"], 6)], result
+    assert len(app["requests"]) == 1
+
+
+async def check_texts_grouping(app, speller):
+    # 30 текстов по 1000 символов: в лимит MAX_REQUEST_CHARS помещается 10, значит 3 запроса
+    texts = [f"{index} малако " + "слово " * 165 for index in range(30)]
+    results = await speller.check_texts(texts)
+    assert len(results) == len(texts)
+    assert all(items and items[0]["word"] == "малако" for items in results), "порядок ответов нарушен"
+    sizes = [sum(map(len, group)) for method, group in app["requests"]]
+    assert all(size <= MAX_REQUEST_CHARS for size in sizes), sizes
+    assert len(sizes) == -(-sum(map(len, texts)) // MAX_REQUEST_CHARS), sizes
+    assert sorted(text for _, group in app["requests"] for text in group) == sorted(texts)
+
+
+async def check_retry(app, speller):
+    start = time.perf_counter()
+    result = await speller.check_text("малако")
+    elapsed = time.perf_counter() - start
+    assert result and result[0]["s"] == ["молоко"]
+    assert len(app["requests"]) == 3, app["requests"]
+    # две ошибки подряд: задержки backoff и 2 * backoff
+    assert elapsed >= speller.backoff * 3, elapsed
+
+
+async def check_retries_exhausted(app, speller):
+    try:
+        await speller.check_text("малако")
+    except SpellerError:
+        assert len(app["requests"]) == speller.retries + 1, app["requests"]
+        return
+    raise AssertionError("ожидалась SpellerError после исчерпания повторов")
+
+
+async def check_timeout(app, speller):
+    try:
+        await speller.check_text("малако")
+    except asyncio.TimeoutError:
+        assert len(app["requests"]) == speller.retries + 1, app["requests"]
+        return
+    raise AssertionError("ожидался таймаут")
+
+
+CHECKS = [
+    ("checkText", check_text, {}),
+    ("checkTexts и группировка", check_texts_grouping, {}),
+    ("повтор после 503", check_retry, {"failures": 2}),
+    ("повтор после 429", check_retry, {"failures": 2, "failure_status": 429}),
+    ("повторы исчерпаны", check_retries_exhausted, {"failures": 10}),
+    ("таймаут", check_timeout, {"delay": 0.3, "timeout": 0.1, "backoff": 0.01}),
+]
+
+
+async def run_checks():
+    failed = 0
+    for name, check, kwargs in CHECKS:
+        try:
+            await with_speller(check, **kwargs)
+        except Exception as e:
+            failed += 1
+            print(f"FAIL  {name}: {e!r}")
+        else:
+            print(f"ok    {name}")
+    return failed
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    sys.exit(1 if asyncio.run(run_checks()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""Сквозной нагрузочный замер сервиса распознавания и микробенчмарки этапов.
+
+Поднимает заглушки Яндекс-спеллера и LanguageTool, запускает сервис
+(benchmarks.stub_service с детектором-заглушкой или настоящий recognizer_service.main:app
+с --detector yolo) и отправляет в /process/ синтетические рукописные страницы
+с разным числом слов при разной конкурентности. Для каждой конфигурации считаются
+задержки p50/p95/p99, страниц и кропов в секунду, отказы 503 и пиковый RSS сервиса
+вместе с дочерними процессами. Результаты пишутся в JSON, --compare сравнивает
+с прошлым прогоном и завершается с кодом 1 при регрессии больше --max-regression.
+
+    python -m benchmarks.load_test --words 20 100 300 --concurrency 1 4 16 64
+    python -m benchmarks.load_test --output before.json
+    python -m benchmarks.load_test --output after.json --compare before.json
+    python -m benchmarks.load_test --target http://127.0.0.1:8000 --pid 12345
+    python -m benchmarks.load_test --micro-only
+
+С --target сервис не запускается, кэш результатов в нём лучше отключить (RESULT_CACHE=none).
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+import numpy as np
+import psutil
+import aiohttp
+from aiohttp import web
+from PIL import Image, ImageDraw
+from bot_utils import crop, layout
+from bot_utils.resize import resize_with_aspect_and_padding
+from benchmarks.stubs import StubDetector, make_speller_app, make_languagetool_app
+
+SYLLABLES = ["ка", "ро", "ми", "ле", "на", "ту", "со", "вы", "ба", "де", "жи", "по", "ры", "ще", "ль", "ют"]
+
+
+def render_page(n_words, seed=0, width=1240, height=1754):
+    """Страница A4 при 150 dpi с «рукописными» словами из штрихов, по строкам слева направо"""
+    rng = np.random.default_rng(seed)
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    margin, line_height, word_gap = 60, 52, 24
+    x, y = margin, margin
+    placed = 0
+    while placed < n_words:
+        word_height = int(rng.integers(24, 33))
+        word_width = int(word_height * rng.uniform(0.4, 0.5) * rng.integers(2, 8))
+        if x + word_width > width - margin:
+            x, y = margin, y + line_height
+            if y + line_height > height - margin:
+                break
+        top = y + int(rng.integers(0, 5))
+        middle = top + word_height // 2
+        # сплошная «пропись» внутри слова, чтобы детектор-заглушка не делил его на части
+        draw.line((x, middle, x + word_width, middle), fill=(20, 20, 60), width=2)
+        for _ in range(word_width // 5):
+            sx = x + int(rng.integers(0, word_width))
+            sy = top + int(rng.integers(0, word_height))
+            ex = min(max(sx + int(rng.integers(-6, 7)), x), x + word_width)
+            draw.line((sx, sy, ex, middle), fill=(20, 20, 60), width=3)
+        x += word_width + word_gap + int(rng.integers(0, 12))
+        placed += 1
+    return image, placed
+
+
+def encode_jpeg(image):
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def process_tree(pid):
+    try:
+        process = psutil.Process(pid)
+        return [process] + process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+
+
+async def watch_rss(pid, peak, interval=0.1):
+    """Пиковый RSS процесса и всех его потомков, опрашивается до отмены задачи"""
+    while True:
+        rss = 0
+        for process in process_tree(pid):
+            try:
+                rss += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        peak[0] = max(peak[0], rss)
+        await asyncio.sleep(interval)
+
+
+async def crops_total(session, target):
+    """Сумма гистограммы ocr_crops_per_page из /metrics сервиса, None если метрик нет"""
+    try:
+        async with session.get(f"{target}/metrics") as response:
+            if response.status != 200:
+                return None
+            for line in (await response.text()).splitlines():
+                if line.startswith("ocr_crops_per_page_sum"):
+                    return float(line.split()[-1])
+    except aiohttp.ClientError:
+        return None
+    return None
+
+
+async def send_page(session, target, page, latencies, statuses, multipart=False):
+    if multipart:
+        data = aiohttp.FormData()
+        data.add_field("file", page, filename="page.jpg", content_type="image/jpeg")
+        headers = None
+    else:
+        data, headers = page, {"Content-Type": "image/jpeg"}
+    start = time.perf_counter()
+    try:
+        async with session.post(f"{target}/process/", data=data, headers=headers) as response:
+            await response.read()
+            status = response.status
+    except aiohttp.ClientError:
+        status = "error"
+    if status == 200:
+        latencies.append(time.perf_counter() - start)
+    statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+
+async def run_config(session, target, pid, pages, words, concurrency, requests, multipart=False):
+    latencies, statuses, peak = [], {}, [0]
+    semaphore = asyncio.Semaphore(concurrency)
+    crops_before = await crops_total(session, target)
+    watcher = asyncio.create_task(watch_rss(pid, peak)) if pid else None
+
+    async def one(index):
+        async with semaphore:
+            await send_page(session, target, pages[index % len(pages)], latencies, statuses, multipart)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    if watcher:
+        watcher.cancel()
+    crops_after = await crops_total(session, target)
+    if crops_before is not None and crops_after is not None:
+        crops = crops_after - crops_before
+    else:
+        crops = words * len(latencies)
+
+    return {
+        "words": words,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "statuses": statuses,
+        "seconds": elapsed,
+        "latency": percentiles(latencies),
+        "pages_per_sec": len(latencies) / elapsed,
+        "crops_per_sec": crops / elapsed,
+        "peak_rss_mb": peak[0] / 2 ** 20 if pid else None,
+    }
+
+
+async def wait_ready(session, target, timeout, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Сервис завершился с кодом {process.returncode}")
+        try:
+            async with session.get(f"{target}/ready") as response:
+                if response.status == 200:
+                    return
+                body = await response.json()
+                if body.get("status") == "failed":
+                    raise RuntimeError(f"Сервис не загрузил модели: {body}")
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(1)
+    raise RuntimeError(f"Сервис не стал готов за {timeout:.0f} с")
+
+
+async def start_app(app, port):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def stub_env(args):
+    return {
+        "YANDEX_SPELLER_URL": f"http://127.0.0.1:{args.speller_port}/services/spellservice.json",
+        "LANGUAGETOOL_URL": f"http://127.0.0.1:{args.languagetool_port}",
+        "LANGUAGETOOL_HEALTH_INTERVAL": "0",
+    }
+
+
+def start_service(args):
+    env = dict(os.environ, **stub_env(args))
+    env.setdefault("RESULT_CACHE", "none")
+    # иначе на высокой конкурентности большая часть запросов получит 503
+    env.setdefault("INFERENCE_QUEUE_SIZE", str(max(args.concurrency)))
+    if args.detector == "stub":
+        command = [sys.executable, "-m", "benchmarks.stub_service", "--port", str(args.port)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "recognizer_service.main:app",
+                   "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"]
+    return subprocess.Popen(command, env=env)
+
+
+async def run_load(args, pages):
+    results = []
+    process = None
+    target = args.target
+    pid = args.pid
+    if not target:
+        process = start_service(args)
+        target, pid = f"http://127.0.0.1:{args.port}", process.pid
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=max(args.concurrency))
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await wait_ready(session, target, args.startup_timeout, process)
+            for words in args.words:
+                # прогрев: первые запросы включают ленивые инициализации и компиляцию
+                await run_config(session, target, None, pages[words], words, 1, 1)
+                for concurrency in args.concurrency:
+                    requests = max(args.requests, concurrency * 2)
+                    result = await run_config(session, target, pid, pages[words], words, concurrency, requests,
+                                              args.multipart)
+                    results.append(result)
+                    latency = result["latency"]
+                    rss = f"{result['peak_rss_mb']:7.0f} МБ" if result["peak_rss_mb"] is not None else "      -"
+                    print(f"слов {words:4d} | конк. {concurrency:3d} | "
+                          f"p50 {fmt_ms(latency['p50'])} p95 {fmt_ms(latency['p95'])} p99 {fmt_ms(latency['p99'])} | "
+                          f"{result['pages_per_sec']:6.2f} стр/с {result['crops_per_sec']:8.1f} кропов/с | "
+                          f"RSS {rss} | ответы {result['statuses']}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return results
+
+
+def fmt_ms(seconds):
+    return f"{seconds * 1000:8.1f} мс" if seconds is not None else "       - мс"
+
+
+def measure(fn, repeat):
+    timings = []
+    for index in range(repeat):
+        start = time.perf_counter()
+        fn(index)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def random_text(n_words, seed):
+    rng = random.Random(seed)
+    return " ".join("".join(rng.choices(SYLLABLES, k=rng.randint(1, 4))) for _ in range(n_words))
+
+
+def micro_benchmarks(args, images):
+    """Этапы отдельно: постобработка рамок и нарезка, подготовка кропов, проверка текста.
+    Проверка текста идёт в заглушки, поэтому меряется накладной расход клиента, а не сервисов"""
+    from recognizer_service import config
+    from bot_utils.check_spelling import check_spelling_and_grammar
+    from bot_utils.speller import close_speller
+
+    detector = StubDetector()
+    results = []
+
+    def report(name, words, timings, items):
+        stats = percentiles(timings)
+        results.append({"name": name, "words": words, "repeat": len(timings), "latency": stats,
+                        "items_per_sec": items * len(timings) / sum(timings)})
+        print(f"{name:10s} | слов {words:4d} | p50 {fmt_ms(stats['p50'])} p95 {fmt_ms(stats['p95'])} | "
+              f"{items * len(timings) / sum(timings):9.1f} в секунду")
+
+    for words in args.words:
+        image = images[words]
+        boxes = detector.detect(image)
+
+        def crop_stage(_):
+            pixel_boxes = crop.to_pixel_boxes(boxes, *image.size)
+            pixel_boxes = pixel_boxes[crop.deduplicate_boxes(pixel_boxes, boxes[:, 5], config.dedupe_threshold,
+                                                             config.dedupe_mode)]
+            lines = layout.analyze_layout(pixel_boxes, config.layout_columns).lines
+            return crop.crop_images(image, [tuple(pixel_boxes[i].tolist()) for line in lines for i in line])
+
+        report("crop", words, measure(crop_stage, args.micro_repeat), 1)
+
+        crops = crop_stage(0)
+        report("resize", words, measure(
+            lambda _: [resize_with_aspect_and_padding(c, resample=config.resample, reducing_gap=config.reducing_gap)
+                       for c in crops], args.micro_repeat), len(crops))
+
+        # новый текст на каждом повторе, чтобы пословный кэш спеллера не срабатывал
+        report("spelling", words, measure(
+            lambda index: check_spelling_and_grammar(random_text(words, index)), args.micro_repeat), 1)
+    close_speller()
+    return results
+
+
+async def run(args):
+    # клиенты спеллера и LanguageTool читают адреса при импорте, поэтому окружение задаётся заранее
+    os.environ.update(stub_env(args))
+    runners = [
+        await start_app(make_speller_app(), args.speller_port),
+        await start_app(make_languagetool_app(), args.languagetool_port),
+    ]
+
+    images = {words: render_page(words, seed=words)[0] for words in args.words}
+    # несколько разных страниц на каждое число слов, чтобы не упираться в совпадающие входы
+    pages = {words: [encode_jpeg(render_page(words, seed=words * 100 + i)[0]) for i in range(args.variants)]
+             for words in args.words}
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "detector": args.detector,
+            "target": args.target,
+        },
+        "micro": [],
+        "load": [],
+    }
+    try:
+        # синхронная проверка текста ждёт заглушки из этого же event loop, поэтому уходит в поток
+        report["micro"] = await asyncio.to_thread(micro_benchmarks, args, images)
+        if not args.micro_only:
+            report["load"] = await run_load(args, pages)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, max_regression):
+    """Печатает изменения p95 и пропускной способности, возвращает True, если регрессий нет"""
+    ok = True
+    old = {(r["words"], r["concurrency"]): r for r in baseline.get("load", [])}
+    for result in report["load"]:
+        previous = old.get((result["words"], result["concurrency"]))
+        if not previous or not previous["ok"] or not result["ok"]:
+            continue
+        p95 = result["latency"]["p95"] / previous["latency"]["p95"] - 1
+        throughput = result["pages_per_sec"] / previous["pages_per_sec"] - 1
+        regressed = p95 > max_regression or -throughput > max_regression
+        ok &= not regressed
+        print(f"слов {result['words']:4d} | конк. {result['concurrency']:3d} | p95 {p95:+7.1%} | "
+              f"стр/с {throughput:+7.1%}{'  <- регрессия' if regressed else ''}")
+
+    old_micro = {(r["name"], r["words"]): r for r in baseline.get("micro", [])}
+    for result in report["micro"]:
+        previous = old_micro.get((result["name"], result["words"]))
+        if previous:
+            p50 = result["latency"]["p50"] / previous["latency"]["p50"] - 1
+            regressed = p50 > max_regression
+            ok &= not regressed
+            print(f"{result['name']:10s} | слов {result['words']:4d} | p50 {p50:+7.1%}"
+                  f"{'  <- регрессия' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, nargs="+", default=[20, 100, 300], help="слов на странице")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--requests", type=int, default=16, help="минимум запросов на конфигурацию")
+    parser.add_argument("--variants", type=int, default=4, help="разных страниц на каждое число слов")
+    parser.add_argument("--detector", choices=["stub", "yolo"], default="stub")
+    parser.add_argument("--multipart", action="store_true", help="отправлять страницы формой, а не телом запроса")
+    parser.add_argument("--target", help="адрес уже запущенного сервиса вместо запуска своего")
+    parser.add_argument("--pid", type=int, help="PID сервиса для замера RSS при --target")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--speller-port", type=int, default=8091)
+    parser.add_argument("--languagetool-port", type=int, default=8092)
+    parser.add_argument("--timeout", type=float, default=600, help="таймаут одного запроса, с")
+    parser.add_argument("--startup-timeout", type=float, default=600, help="ожидание загрузки моделей, с")
+    parser.add_argument("--micro-repeat", type=int, default=20)
+    parser.add_argument("--micro-only", action="store_true", help="только микробенчмарки этапов")
+    parser.add_argument("--output", default="load_test.json")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        sys.exit(0 if compare(report, baseline, args.max_regression) else 1)
+
+
+if __name__ == "__main__":
+    main()
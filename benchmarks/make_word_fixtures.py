@@ -0,0 +1,59 @@
+"""Генерирует набор кропов слов с разметкой для bench_backends: benchmarks/fixtures/words.
+
+Слова русского текста разной длины набираются шрифтами DejaVu с небольшим наклоном,
+разной толщиной и шумом бумаги. Это печатный текст, а не рукопись: набор нужен, чтобы
+сравнивать бэкенды по CER относительно известного текста, а не только друг с другом.
+Кропы настоящих рукописных слов можно положить в ту же папку, дописав их в labels.tsv.
+
+    python -m benchmarks.make_word_fixtures --fonts /usr/share/fonts/truetype/dejavu
+"""
+import os
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "words")
+
+WORDS = [
+    "и", "в", "на", "не", "он", "мы", "дом", "кот", "лес", "мир", "окно", "река", "школа", "город",
+    "книга", "письмо", "молоко", "собака", "учитель", "вечером", "тетрадь", "красивый", "здоровье",
+    "задание", "решение", "ответить", "предложение", "упражнение", "обязательно", "подготовиться",
+    "внимательно", "Москва", "Россия", "Привет,", "сегодня.", "2024", "12:30", "ёлка", "щука", "объявление",
+]
+FONTS = ["DejaVuSerif.ttf", "DejaVuSans.ttf", "DejaVuSerif-Bold.ttf", "DejaVuSans-Bold.ttf"]
+
+
+def render_word(word, font, rng, height=64):
+    left, top, right, bottom = font.getbbox(word)
+    pad = 12
+    image = Image.new("L", (right - left + 2 * pad, height), 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((pad - left, (height - (bottom - top)) / 2 - top), word, font=font, fill=int(rng.integers(0, 60)))
+    image = image.rotate(float(rng.uniform(-3, 3)), resample=Image.BICUBIC, expand=True, fillcolor=255)
+    noise = rng.normal(0, 4, (image.height, image.width))
+    pixels = np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fonts", default="/usr/share/fonts/truetype/dejavu")
+    parser.add_argument("--output", default=FIXTURES_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(args.output, exist_ok=True)
+    lines = []
+    for index, word in enumerate(WORDS):
+        font = ImageFont.truetype(os.path.join(args.fonts, FONTS[index % len(FONTS)]), 40)
+        name = f"word_{index:03d}.png"
+        render_word(word, font, rng).save(os.path.join(args.output, name), optimize=True)
+        lines.append(f"{name}\t{word}\n")
+    with open(os.path.join(args.output, "labels.tsv"), "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    print(f"{len(WORDS)} кропов записано в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
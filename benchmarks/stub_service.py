@@ -0,0 +1,32 @@
+"""Сервис распознавания с детектором-заглушкой вместо YOLO: для нагрузочных замеров
+без весов YOLOv5. TrOCR, пакетирование и проверка текста работают как обычно.
+
+    python -m benchmarks.stub_service --port 8000
+
+Подмена делается в этом процессе, поэтому воркеры должны быть потоками
+(INFERENCE_WORKER_KIND=thread, по умолчанию).
+"""
+import argparse
+import uvicorn
+from recognizer_service import detector
+from benchmarks.stubs import StubDetector
+
+
+def load_stub_detector(mode, yolo_dir, yolo_weights, conf=0.69, device=None):
+    return StubDetector()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    # pipeline импортирует load_detector при загрузке, поэтому подменять нужно до импорта main
+    detector.load_detector = load_stub_detector
+    from recognizer_service.main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
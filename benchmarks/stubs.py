@@ -0,0 +1,361 @@
+"""Локальные заглушки внешних сервисов для бенчмарков и офлайн-проверок.
+
+    python -m benchmarks.stubs speller --port 8081
+    python -m benchmarks.stubs telegram --port 8082
+    python -m benchmarks.stubs recognizer --port 8083 --delay 0.5
+    python -m benchmarks.stubs languagetool --port 8085
+
+speller    - Яндекс-спеллер: YANDEX_SPELLER_URL=http://127.0.0.1:8081/services/spellservice.json
+languagetool - сервер LanguageTool без ошибок: LANGUAGETOOL_URL=http://127.0.0.1:8085
+telegram   - фейковый Bot API: TELEGRAM_API_URL=http://127.0.0.1:8082
+recognizer - заглушка сервиса распознавания: RECOGNIZER_URL=http://127.0.0.1:8083
+"""
+import io
+import re
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import parse_qsl
+import numpy as np
+from aiohttp import web
+
+WORD_RE = re.compile(r"\w+")
+
+# небольшой словарь типичных ошибок для имитации ответов спеллера
+MISSPELLINGS = {
+    "превет": "привет",
+    "малако": "молоко",
+    "сабака": "собака",
+    "жывот": "живот",
+    "шыповник": "шиповник",
+    "извените": "извините",
+    "класный": "классный",
+}
+
+
+def speller_errors(text):
+    errors = []
+    for match in WORD_RE.finditer(text):
+        suggestion = MISSPELLINGS.get(match.group().lower())
+        if suggestion:
+            errors.append({
+                "code": 1,
+                "pos": match.start(),
+                "row": 0,
+                "col": match.start(),
+                "len": len(match.group()),
+                "word": match.group(),
+                "s": [suggestion],
+            })
+    return errors
+
+
+async def read_params(request):
+    params = dict(request.query)
+    # клиенты Bot API передают параметры в теле даже у GET-запросов
+    if request.can_read_body:
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        elif request.content_type == "application/x-www-form-urlencoded":
+            params.update(parse_qsl(await request.text()))
+        else:
+            params.update(await request.post())
+    return params
+
+
+async def speller_fault(request, method, texts):
+    """Записывает запрос в app["requests"], выдерживает задержку и, пока не исчерпан
+    app["failures"], отвечает ошибкой app["failure_status"]"""
+    app = request.app
+    app["requests"].append((method, texts))
+    if app["delay"]:
+        await asyncio.sleep(app["delay"])
+    if app["failures"] > 0:
+        app["failures"] -= 1
+        return web.Response(status=app["failure_status"], text="stub failure")
+    return None
+
+
+async def check_text(request):
+    params = await read_params(request)
+    text = params.get("text", "")
+    failure = await speller_fault(request, "checkText", [text])
+    return failure or web.json_response(speller_errors(text))
+
+
+async def check_texts(request):
+    if request.method == "POST":
+        form = await request.post()
+    else:
+        form = request.query
+    texts = form.getall("text", [])
+    failure = await speller_fault(request, "checkTexts", texts)
+    return failure or web.json_response([speller_errors(text) for text in texts])
+
+
+def make_speller_app(failures=0, failure_status=503, delay=0.0):
+    """Яндекс-спеллер, знающий ошибки из MISSPELLINGS. Первые failures запросов
+    получают HTTP failure_status, каждый ответ задерживается на delay секунд"""
+    app = web.Application()
+    app["requests"] = []
+    app["failures"] = failures
+    app["failure_status"] = failure_status
+    app["delay"] = delay
+    for method in ("GET", "POST"):
+        app.router.add_route(method, "/services/spellservice.json/checkText", check_text)
+        app.router.add_route(method, "/services/spellservice.json/checkTexts", check_texts)
+    return app
+
+
+async def languagetool_languages(request):
+    return web.json_response([{"name": "Russian", "code": "ru", "longCode": "ru-RU"}])
+
+
+async def languagetool_check(request):
+    await read_params(request)
+    return web.json_response({"matches": []})
+
+
+def make_languagetool_app():
+    """Удалённый сервер LanguageTool (API v2), не находящий ошибок"""
+    # language_tool_python передаёт текст в строке GET-запроса
+    app = web.Application(handler_args={"max_line_size": 1024 * 1024})
+    app.router.add_get("/v2/languages", languagetool_languages)
+    for method in ("GET", "POST"):
+        app.router.add_route(method, "/v2/check", languagetool_check)
+    return app
+
+
+def ink_runs(mask, min_gap):
+    """Отрезки [начало, конец) подряд идущих True, разрывы короче min_gap склеиваются"""
+    runs = []
+    for index in np.flatnonzero(mask):
+        if runs and index - runs[-1][1] < min_gap:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return runs
+
+
+class StubDetector:
+    """Детектор слов без YOLO для синтетических страниц: строки и слова находятся
+    по проекциям тёмных пикселей. Формат ответа как у InProcessDetector"""
+
+    def __init__(self, line_gap=12, word_gap=20, threshold=128):
+        self.line_gap = line_gap
+        self.word_gap = word_gap
+        self.threshold = threshold
+
+    def detect(self, image):
+        ink = np.asarray(image.convert("L")) < self.threshold
+        height, width = ink.shape
+        boxes = []
+        for top, bottom in ink_runs(ink.any(axis=1), self.line_gap):
+            for left, right in ink_runs(ink[top:bottom].any(axis=0), self.word_gap):
+                boxes.append((0, (left + right) / 2 / width, (top + bottom) / 2 / height,
+                              (right - left) / width, (bottom - top) / height, 0.9))
+        return np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+
+
+def fake_photo(width=64, height=32):
+    from PIL import Image
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 255, 255)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+class FakeTelegram:
+    """Фейковый Bot API: выдаёт подложенные апдейты через getUpdates и webhook,
+    записывает все исходящие сообщения бота"""
+
+    def __init__(self):
+        self.updates = []
+        self.sent = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.new_update = asyncio.Event()
+        self.files = {}
+
+    def inject(self, chat_id, kind="photo", text=None, file_name="scan.jpg", data=None, media_group_id=None):
+        message = {
+            "message_id": self.next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+        }
+        self.next_message_id += 1
+        if media_group_id:
+            message["media_group_id"] = media_group_id
+
+        file_id = f"file{self.next_update_id}"
+        self.files[file_id] = data if data is not None else fake_photo()
+        if kind == "photo":
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id,
+                                 "width": 64, "height": 32, "file_size": len(self.files[file_id])}]
+        elif kind == "document":
+            message["document"] = {"file_id": file_id, "file_unique_id": file_id,
+                                   "file_name": file_name, "file_size": len(self.files[file_id])}
+        else:
+            message["text"] = text or ""
+
+        update = {"update_id": self.next_update_id, "message": message}
+        self.next_update_id += 1
+        self.updates.append(update)
+        self.new_update.set()
+        return update
+
+    def reply(self, result):
+        return web.json_response({"ok": True, "result": result})
+
+    def message(self, chat_id, text):
+        result = {
+            "message_id": self.next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text,
+        }
+        self.next_message_id += 1
+        return result
+
+    async def api(self, request):
+        method = request.match_info["method"]
+        params = await read_params(request)
+
+        if method == "getMe":
+            return self.reply({"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"})
+
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            timeout = float(params.get("timeout") or 0)
+            pending = [u for u in self.updates if u["update_id"] >= offset]
+            if not pending and timeout:
+                self.new_update.clear()
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), min(timeout, 5))
+                except asyncio.TimeoutError:
+                    pass
+                pending = [u for u in self.updates if u["update_id"] >= offset]
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            return self.reply(pending)
+
+        if method == "getFile":
+            file_id = params.get("file_id")
+            return self.reply({"file_id": file_id, "file_unique_id": file_id,
+                               "file_size": len(self.files.get(file_id, b"")),
+                               "file_path": f"photos/{file_id}.jpg"})
+
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = params.get("chat_id")
+            self.sent.append({"time": time.time(), "method": method, "chat_id": int(chat_id),
+                              "text": params.get("text")})
+            result = self.message(chat_id, params.get("text"))
+            if method == "editMessageText":
+                result["message_id"] = int(params.get("message_id"))
+            return self.reply(result)
+
+        if method == "sendChatAction":
+            self.sent.append({"time": time.time(), "method": method, "chat_id": int(params.get("chat_id"))})
+            return self.reply(True)
+
+        # setWebhook, deleteWebhook, close и прочие служебные методы
+        return self.reply(True)
+
+    async def download(self, request):
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].split(".")[0]
+        if file_id not in self.files:
+            return web.Response(status=404)
+        return web.Response(body=self.files[file_id], content_type="image/jpeg")
+
+    async def inject_handler(self, request):
+        params = await request.json()
+        return web.json_response(self.inject(**params))
+
+    async def sent_handler(self, request):
+        return web.json_response(self.sent)
+
+
+def make_telegram_app(telegram=None):
+    telegram = telegram or FakeTelegram()
+    app = web.Application()
+    app["telegram"] = telegram
+    app.router.add_route("*", "/bot{token}/{method}", telegram.api)
+    app.router.add_get("/file/bot{token}/{path:.*}", telegram.download)
+    app.router.add_post("/_inject", telegram.inject_handler)
+    app.router.add_get("/_sent", telegram.sent_handler)
+    return app
+
+
+def make_recognizer_app(delay=0.5, lines=3):
+    """Заглушка сервиса распознавания с фиксированной задержкой на страницу"""
+
+    def result():
+        text = "\n".join(f"строка {i + 1}" for i in range(lines))
+        return {"recognized_text": text, "corrected_text": text, "errors": ""}
+
+    async def process(request):
+        await request.read()
+        await asyncio.sleep(delay)
+        return web.json_response(result())
+
+    async def process_stream(request):
+        await request.read()
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for i in range(lines):
+            await asyncio.sleep(delay / lines)
+            event = {"type": "line", "index": i, "text": f"строка {i + 1}"}
+            await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode())
+        event = dict(result(), type="result")
+        await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def process_batch_stream(request):
+        form = await request.post()
+        pages = len(form.getall("files", []))
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for page in range(pages):
+            for i in range(lines):
+                await asyncio.sleep(delay / lines)
+                event = {"type": "line", "page": page, "index": i, "text": f"страница {page + 1}, строка {i + 1}"}
+                await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode())
+        text = "\n\n".join(result()["recognized_text"] for _ in range(pages))
+        event = {"type": "result", "recognized_text": text, "corrected_text": text, "errors": "", "pages": []}
+        await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def ready(request):
+        return web.json_response({"status": "ready"})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/ready", ready)
+    app.router.add_post("/process/", process)
+    app.router.add_post("/process/stream", process_stream)
+    app.router.add_post("/process/batch/stream", process_batch_stream)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("service", choices=["speller", "telegram", "recognizer", "languagetool"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.5, help="задержка заглушки распознавания, с")
+    args = parser.parse_args()
+
+    if args.service == "speller":
+        app = make_speller_app()
+    elif args.service == "telegram":
+        app = make_telegram_app()
+    elif args.service == "languagetool":
+        app = make_languagetool_app()
+    else:
+        app = make_recognizer_app(args.delay)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,24 @@
-import io
+import json
 import logging
 import threading
 import requests
 import time
 import os
-import re
 import telebot
 from dotenv import load_dotenv
-from PIL import Image
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton
+from telebot.apihelper import ApiTelegramException
+from bot_utils.messages import (
+    START_TEXT, HELP_TEXT, UNKNOWN_TEXT, NO_DATA_TEXT, BLOCKED_TEXT, INJECTION_TEXT, NO_ERRORS_TEXT,
+    PHOTO_DONE_TEXT, PHOTO_FAILED_TEXT, DOCUMENT_DONE_TEXT, DOCUMENT_FAILED_TEXT, WRONG_DOCUMENT_TEXT,
+    ALBUM_DONE_TEXT, ALBUM_FAILED_TEXT, QUEUED_TEXT, REPLY_TEXTS,
+    GET_RAW_BUTTON, GET_CORRECTED_BUTTON, GET_ALL_BUTTON, IMAGE_EXTENSIONS, DOCUMENT_EXTENSIONS,
+    raw_text_message, corrected_text_message, errors_message, progress_message,
+    is_sql_injection, sanitize_input, start_keyboard, text_action_keyboard
+)
+from bot_utils.state import store, is_blacklisted
+from bot_utils.rate_limit import check_rate_limit
+from bot_utils.metrics import timed_handler, update_timer, start_bot_metrics_server
+from bot_utils.job_queue import get_job_queue, DONE, PRIORITY_IMAGE, PRIORITY_DOCUMENT
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,101 +26,290 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
-user_data = {}
-user_request_times = {}
-blacklist = set()
-rate_limit = 5
-
 load_dotenv()
 bot = telebot.TeleBot(os.getenv('bot'))
+recognizer_url = os.getenv('RECOGNIZER_URL', 'http://localhost:8000')
+album_wait = float(os.getenv('ALBUM_WAIT', '1.0'))
+# http - запрос к сервису распознавания, queue - задание в очередь для воркеров
+recognizer_mode = os.getenv('RECOGNIZER_MODE', 'http')
+result_poll_interval = float(os.getenv('JOB_RESULT_POLL_INTERVAL', '0.5'))
 
-def is_sql_injection(text):
-    """Проверка на SQL-инъекции"""
-    sql_keywords = [
-        'select', 'insert', 'update', 'delete', 'drop',
-        'truncate', 'union', '--', ';', '/*', '*/'
-    ]
-    pattern = re.compile('|'.join(re.escape(keyword) for keyword in sql_keywords), re.IGNORECASE)
-    return bool(pattern.search(text))
-
-def is_blacklisted(user_id):
-    """Проверка на наличие в черном списке"""
-    return user_id in blacklist
-
-def check_rate_limit(user_id):
-    """Проверка ограничения запросов"""
-    current_time = time.time()
-    if user_id not in user_request_times:
-        user_request_times[user_id] = []
-
-    user_request_times[user_id] = [
-        t for t in user_request_times[user_id]
-        if current_time - t < 5
-    ]
-
-    if len(user_request_times[user_id]) >= rate_limit:
-        blacklist.add(user_id)
-        logging.warning(f"User {user_id} добавлен в черный список за превышение лимита запросов")
-        return False
-
-    user_request_times[user_id].append(current_time)
-    return True
-
-
-def sanitize_input(text):
-    """Очистка входных данных"""
-    if not text:
-        return text
-    return re.sub(r'[;\'"\\/*]', '', text)
-
-
-def send_image_to_pipeline(image: Image.Image):
-    with io.BytesIO() as output:
-        image.save(output, format="JPEG")
-        output.seek(0)
-        files = {"file": ("image.jpg", output, "image/jpeg")}
-        try:
-            response = requests.post("http://localhost:8000/process/", files=files)
+
+# файл из Telegram уходит в сервис как есть, телом запроса: без перекодирования и multipart
+RAW_HEADERS = {"Content-Type": "application/octet-stream"}
+
+
+def read_event_stream(response, on_line):
+    """Разбирает NDJSON-ответ потокового эндпоинта, вызывая on_line для каждой строки"""
+    for raw_event in response.iter_lines():
+        if not raw_event:
+            continue
+        event = json.loads(raw_event)
+        if event["type"] == "line":
+            on_line(event["text"])
+        elif event["type"] == "result":
+            return event["recognized_text"], event["corrected_text"], event["errors"]
+        elif event["type"] == "error":
+            raise RuntimeError(event["detail"])
+
+    raise RuntimeError("Микросервис не вернул итоговый результат")
+
+
+def stream_image_to_pipeline(image_bytes, on_line):
+    """Отправляет изображение в потоковый эндпоинт и вызывает on_line для каждой распознанной строки"""
+    try:
+        with requests.post(f"{recognizer_url}/process/stream", data=image_bytes, headers=RAW_HEADERS,
+                           stream=True) as response:
             response.raise_for_status()
-            data = response.json()
-            return data["recognized_text"], data["corrected_text"], data["errors"]
-        except requests.RequestException as e:
-            logging.error(f"[ERROR] Ошибка запроса к микросервису: {e}")
-            raise
+            return read_event_stream(response, on_line)
+    except requests.RequestException as e:
+        logging.error(f"[ERROR] Ошибка запроса к микросервису: {e}")
+        raise
 
 
-def show_typing(bot, chat_id, stop_event):
-    while not stop_event.is_set():
-        bot.send_chat_action(chat_id, action='typing')
-        time.sleep(1.5)
+def stream_documents_to_pipeline(documents, on_line):
+    """Несколько изображений, PDF или TIFF одним заданием через /process/batch/stream.
+    documents - список пар (имя файла, содержимое)"""
+    files = [("files", (file_name, contents, "application/octet-stream")) for file_name, contents in documents]
+    try:
+        with requests.post(f"{recognizer_url}/process/batch/stream", files=files, stream=True) as response:
+            response.raise_for_status()
+            return read_event_stream(response, on_line)
+    except requests.RequestException as e:
+        logging.error(f"[ERROR] Ошибка запроса к микросервису: {e}")
+        raise
+
+
+class AlbumCollector:
+    """Собирает сообщения одного альбома: Telegram присылает их отдельными апдейтами.
+    Альбом передаётся в on_album одним списком, когда wait секунд не было новых сообщений.
+    Ожидание идёт в таймере, а не в обработчике: у TeleBot всего несколько потоков
+    обработчиков, и ждущий альбом не должен занимать их."""
+
+    def __init__(self, wait=1.0):
+        self.wait = wait
+        self.lock = threading.Lock()
+        self.albums = {}
+        self.last_seen = {}
+
+    def add(self, message, on_album):
+        group = message.media_group_id
+        with self.lock:
+            self.last_seen[group] = time.monotonic()
+            if group in self.albums:
+                self.albums[group].append(message)
+                return
+            self.albums[group] = [message]
+        self._schedule(group, self.wait, on_album)
+
+    def _schedule(self, group, delay, on_album):
+        timer = threading.Timer(delay, self._flush, args=(group, on_album))
+        timer.daemon = True
+        timer.start()
+
+    def _flush(self, group, on_album):
+        with self.lock:
+            remaining = self.wait - (time.monotonic() - self.last_seen[group])
+            if remaining > 0:
+                self._schedule(group, remaining, on_album)
+                return
+            self.last_seen.pop(group)
+            messages = sorted(self.albums.pop(group), key=lambda m: m.message_id)
+        # альбом распознаётся в потоке таймера
+        with update_timer("album"):
+            on_album(messages)
+
+
+albums = AlbumCollector(album_wait)
+
+
+class ProgressMessage:
+    """Одно сообщение, которое дополняется строками по мере распознавания.
+    Telegram ограничивает частоту редактирования, поэтому правки не чаще interval секунд."""
+
+    def __init__(self, bot, chat_id, interval=1.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.lines = []
+        self.message_id = None
+        self.last_edit = 0
+
+    def add_line(self, text):
+        self.lines.append(text)
+        if time.time() - self.last_edit >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+        text = progress_message(self.lines)
+        try:
+            if self.message_id is None:
+                self.message_id = self.bot.send_message(self.chat_id, text).message_id
+            else:
+                self.bot.edit_message_text(text, self.chat_id, self.message_id)
+        except ApiTelegramException as e:
+            if "message is not modified" not in str(e):
+                logging.warning(f"Не удалось обновить сообщение с прогрессом: {e}")
+        self.last_edit = time.time()
+
 
+def recognize_with_progress(chat_id, image_bytes, stop_typing):
+    """Распознаёт изображение, показывая строки в чате по мере готовности"""
+    progress = ProgressMessage(bot, chat_id)
 
-def start_keyboard():
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    start_button = KeyboardButton("Старт")
-    help_button = KeyboardButton("Помощь")
-    markup.add(start_button, help_button)
-    return markup
+    def on_line(text):
+        stop_typing.set()
+        progress.add_line(text)
 
+    result = stream_image_to_pipeline(image_bytes, on_line)
+    progress.flush()
+    return result
 
-def text_action_keyboard():
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    get_text = KeyboardButton("Получить распознанный текст")
-    get_corrected_text = KeyboardButton("Получить исправленный текст")
-    get_all = KeyboardButton("Получить все сразу")
-    markup.add(get_text)
-    markup.add(get_corrected_text)
-    markup.add(get_all)
-    return markup
+
+def recognize_documents_with_progress(chat_id, documents, stop_typing):
+    """Распознаёт несколько страниц одним заданием, показывая строки по мере готовности"""
+    progress = ProgressMessage(bot, chat_id)
+
+    def on_line(text):
+        stop_typing.set()
+        progress.add_line(text)
+
+    result = stream_documents_to_pipeline(documents, on_line)
+    progress.flush()
+    return result
+
+
+def message_file(message):
+    """file_id и имя файла из фото или документа"""
+    if message.photo:
+        return message.photo[-1].file_id, "image.jpg"
+    return message.document.file_id, message.document.file_name or "document"
+
+
+def is_supported(message):
+    return bool(message.photo) or (message.document.file_name or "").lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def enqueue_files(message, files, reply):
+    """Режим очереди: скачанные файлы уходят воркерам, ответ отправит deliver_results.
+    files - список пар (file_id, имя файла), reply - тип ответа из REPLY_TEXTS"""
+    try:
+        documents = []
+        for file_id, file_name in files:
+            file_info = bot.get_file(file_id)
+            documents.append((file_name, bot.download_file(file_info.file_path)))
+
+        if len(documents) == 1 and documents[0][0].lower().endswith(IMAGE_EXTENSIONS):
+            kind, priority = "image", PRIORITY_IMAGE
+        else:
+            kind, priority = "document", PRIORITY_DOCUMENT
+        job_id = get_job_queue().enqueue(kind, documents, {"chat_id": message.chat.id, "reply": reply}, priority)
+    except Exception as e:
+        bot.send_message(message.chat.id, REPLY_TEXTS[reply][1])
+        logging.error(f"[ERROR] Не удалось поставить задание в очередь: {e}")
+        return
+
+    logging.info(f"Задание {job_id} ({kind}) поставлено в очередь для чата {message.chat.id}")
+    bot.send_message(message.chat.id, QUEUED_TEXT)
+
+
+def deliver(queue, job):
+    """Отправляет результат задания в чат. Результат подтверждается только после отправки,
+    поэтому при сбое он будет доставлен повторно"""
+    chat_id = job.meta["chat_id"]
+    done_text, failed_text = REPLY_TEXTS[job.meta["reply"]]
+    try:
+        if job.status == DONE:
+            result = job.result
+            store.set_result(chat_id, result["recognized_text"], result["corrected_text"], result["errors"])
+            bot.send_message(chat_id, done_text, reply_markup=text_action_keyboard(), parse_mode="Markdown")
+        else:
+            logging.error(f"[ERROR] Задание {job.id} не выполнено: {job.error}")
+            bot.send_message(chat_id, failed_text)
+    except ApiTelegramException as e:
+        # чат недоступен (бот заблокирован и т.п.), повторная отправка не поможет
+        logging.warning(f"Не удалось отправить результат задания {job.id}: {e}")
+    except Exception as e:
+        logging.error(f"[ERROR] Не удалось отправить результат задания {job.id}: {e}")
+        return
+    queue.ack(job.id)
+
+
+def deliver_results():
+    """Режим очереди: забирает результаты, записанные воркерами, и отправляет их пользователям"""
+    queue = get_job_queue()
+    while True:
+        try:
+            jobs = queue.take_results()
+        except Exception as e:
+            logging.error(f"[ERROR] Ошибка чтения результатов из очереди: {e}")
+            jobs = []
+        for job in jobs:
+            deliver(queue, job)
+        if not jobs:
+            time.sleep(result_poll_interval)
+
+
+def recognize_album(messages):
+    """Все страницы альбома распознаются одним заданием, лимит запросов списывается один раз"""
+    message = messages[0]
+    if not check_rate_limit(message.from_user.id, "image"):
+        return
+
+    files = [message_file(item) for item in messages if is_supported(item)]
+    if not files:
+        bot.send_message(message.chat.id, WRONG_DOCUMENT_TEXT)
+        return
+
+    if recognizer_mode == "queue":
+        enqueue_files(message, files, "album")
+        return
+
+    stop_typing = threading.Event()
+    typing_thread = threading.Thread(target=show_typing, args=(bot, message.chat.id, stop_typing))
+    typing_thread.start()
+    try:
+        documents = []
+        for file_id, file_name in files:
+            file_info = bot.get_file(file_id)
+            documents.append((file_name, bot.download_file(file_info.file_path)))
+
+        raw_text, corrected_text, errors = recognize_documents_with_progress(message.chat.id, documents, stop_typing)
+
+        store.set_result(message.chat.id, raw_text, corrected_text, errors)
+
+        stop_typing.set()
+        typing_thread.join()
+
+        bot.send_message(message.chat.id,
+                         ALBUM_DONE_TEXT,
+                         reply_markup=text_action_keyboard(),
+                         parse_mode="Markdown")
+
+    except Exception as e:
+        stop_typing.set()
+        typing_thread.join()
+        bot.send_message(message.chat.id,
+                         ALBUM_FAILED_TEXT)
+        logging.error(f"[ERROR] Ошибка: {e}")
+
+
+def show_typing(bot, chat_id, stop_event):
+    while not stop_event.is_set():
+        bot.send_chat_action(chat_id, action='typing')
+        time.sleep(1.5)
 
 
 @bot.message_handler(func=lambda message: is_blacklisted(message.from_user.id))
 def handle_blacklisted(message):
-    bot.send_message(message.chat.id, "⛔️ Вы заблокированы за превышение лимита запросов.")
+    bot.send_message(message.chat.id, BLOCKED_TEXT)
     logging.warning(f"Заблокированный пользователь {message.from_user.id} попытался отправить сообщение")
 
 
 @bot.message_handler(content_types=['text'])
+@timed_handler("text")
 def handle_text(message):
     if not check_rate_limit(message.from_user.id):
         return
@@ -118,76 +317,75 @@ def handle_text(message):
     sanitized_text = sanitize_input(message.text)
     if is_sql_injection(message.text):
         logging.warning(f"Обнаружена попытка SQL-инъекции от пользователя {message.from_user.id}")
-        bot.send_message(message.chat.id, "⚠️ Обнаружена недопустимая команда.")
+        bot.send_message(message.chat.id, INJECTION_TEXT)
         return
 
     if message.text.lower() == "старт":
         bot.send_message(message.chat.id,
-                         "👋 Привет! Я бот, который умеет распознавать *русский рукописный текст* с изображений.\n\n"
-                         "📸 Просто отправь мне фото, я извлеку текст, распознаю его и проверю орфографию, грамматику и стиль.\n\n"
-                         "Для справки нажми *Помощь*.",
+                         START_TEXT,
                          reply_markup=start_keyboard(),
                          parse_mode="Markdown")
 
     elif message.text.lower() == "помощь":
         bot.send_message(message.chat.id,
-                         "🆘 *Помощь по боту*\n\n"
-                         "Вот что я умею:\n"
-                         "1️⃣ Распознаю *рукописный текст* с изображений\n"
-                         "2️⃣ Проверяю *орфографию, грамматику и стиль написания*\n"
-                         "3️⃣ Даю исправленный текст\n\n"
-                         "📌 Советы:\n"
-                         "— Делай чёткие фото\n"
-                         "— Лучше загружай изображение-документ (без сжатия)\n"
-                         "📥 Просто отправь фото, и я начну работать!",
+                         HELP_TEXT,
                          reply_markup=start_keyboard(),
                          parse_mode="Markdown")
 
-    elif message.text == "Получить распознанный текст":
-        data = user_data.get(message.chat.id)
+    elif message.text == GET_RAW_BUTTON:
+        data = store.get_result(message.chat.id)
         if data:
             bot.send_message(message.chat.id,
-                             f"📝 *Распознанный текст:*\n```\n{data['raw_text']}\n```",
+                             raw_text_message(data.raw_text),
                              parse_mode="Markdown")
         else:
-            bot.send_message(message.chat.id, "❌ Нет данных. Сначала отправьте изображение.")
+            bot.send_message(message.chat.id, NO_DATA_TEXT)
 
-    elif message.text == "Получить исправленный текст":
-        data = user_data.get(message.chat.id)
+    elif message.text == GET_CORRECTED_BUTTON:
+        data = store.get_result(message.chat.id)
         if data:
             bot.send_message(message.chat.id,
-                             f"✅ *Исправленный текст:*\n```\n{data['corrected_text']}\n```",
+                             corrected_text_message(data.corrected_text),
                              parse_mode="Markdown")
         else:
-            bot.send_message(message.chat.id, "❌ Нет данных. Сначала отправьте изображение.")
+            bot.send_message(message.chat.id, NO_DATA_TEXT)
 
-    elif message.text == "Получить все сразу":
-        data = user_data.get(message.chat.id)
+    elif message.text == GET_ALL_BUTTON:
+        data = store.get_result(message.chat.id)
         if data:
             bot.send_message(message.chat.id,
-                             f"📝 *Распознанный текст:*\n```\n{data['raw_text']}\n```",
+                             raw_text_message(data.raw_text),
                              parse_mode="Markdown")
             bot.send_message(message.chat.id,
-                             f"✅ *Исправленный текст:*\n```\n{data['corrected_text']}\n```",
+                             corrected_text_message(data.corrected_text),
                              parse_mode="Markdown")
-            if data["errors"]:
+            if data.errors:
                 bot.send_message(message.chat.id,
-                                 f"🔍 *Обнаружены ошибки:*\n{data['errors']}",
+                                 errors_message(data.errors),
                                  parse_mode="HTML")
             else:
-                bot.send_message(message.chat.id, "🎉 Ошибок не найдено!")
+                bot.send_message(message.chat.id, NO_ERRORS_TEXT)
         else:
-            bot.send_message(message.chat.id, "❌ Нет данных. Сначала отправьте изображение.")
+            bot.send_message(message.chat.id, NO_DATA_TEXT)
 
     else:
         bot.send_message(message.chat.id,
-                         "🤔 Прости, я не понимаю тебя...\nНажми *Помощь*, чтобы узнать, что я умею.",
+                         UNKNOWN_TEXT,
                          reply_markup=start_keyboard(),
                          parse_mode="Markdown")
 
 @bot.message_handler(content_types=['photo'])
+@timed_handler("photo")
 def handle_photo(message):
-    if not check_rate_limit(message.from_user.id):
+    if message.media_group_id:
+        albums.add(message, recognize_album)
+        return
+
+    if not check_rate_limit(message.from_user.id, "image"):
+        return
+
+    if recognizer_mode == "queue":
+        enqueue_files(message, [message_file(message)], "photo")
         return
 
     stop_typing = threading.Event()
@@ -196,21 +394,16 @@ def handle_photo(message):
     try:
         file_info = bot.get_file(message.photo[-1].file_id)
         downloaded = bot.download_file(file_info.file_path)
-        image = Image.open(io.BytesIO(downloaded)).convert("RGB")
 
-        raw_text, corrected_text, errors = send_image_to_pipeline(image)
+        raw_text, corrected_text, errors = recognize_with_progress(message.chat.id, downloaded, stop_typing)
 
-        user_data[message.chat.id] = {
-            "raw_text": raw_text,
-            "corrected_text": corrected_text,
-            "errors": errors
-        }
+        store.set_result(message.chat.id, raw_text, corrected_text, errors)
 
         stop_typing.set()
         typing_thread.join()
 
         bot.send_message(message.chat.id,
-                         "✅ Изображение успешно обработано.\nЧто вы хотите сделать дальше?",
+                         PHOTO_DONE_TEXT,
                          reply_markup=text_action_keyboard(),
                          parse_mode="Markdown")
 
@@ -218,12 +411,24 @@ def handle_photo(message):
         stop_typing.set()
         typing_thread.join()
         bot.send_message(message.chat.id,
-                         "❌ Произошла ошибка при обработке изображения. Попробуйте ещё раз.")
+                         PHOTO_FAILED_TEXT)
         logging.error(f"Ошибка: {e}")
 
 @bot.message_handler(content_types=['document'])
+@timed_handler("document")
 def handle_image_document(message):
-    if not check_rate_limit(message.from_user.id):
+    if message.media_group_id:
+        albums.add(message, recognize_album)
+        return
+
+    if not check_rate_limit(message.from_user.id, "image"):
+        return
+
+    if recognizer_mode == "queue":
+        if is_supported(message):
+            enqueue_files(message, [message_file(message)], "document")
+        else:
+            bot.send_message(message.chat.id, WRONG_DOCUMENT_TEXT)
         return
 
     stop_typing = threading.Event()
@@ -231,31 +436,31 @@ def handle_image_document(message):
     typing_thread.start()
 
     try:
-        file_name = message.document.file_name.lower()
-        if not file_name.endswith((".jpg", ".jpeg", ".png")):
+        file_name = (message.document.file_name or "").lower()
+        if not file_name.endswith(DOCUMENT_EXTENSIONS):
             stop_typing.set()
             typing_thread.join()
             bot.send_message(message.chat.id,
-                             "⚠️ Пожалуйста, отправьте изображение (JPG, PNG).")
+                             WRONG_DOCUMENT_TEXT)
             return
 
         file_info = bot.get_file(message.document.file_id)
         downloaded = bot.download_file(file_info.file_path)
-        image = Image.open(io.BytesIO(downloaded)).convert("RGB")
 
-        raw_text, corrected_text, errors = send_image_to_pipeline(image)
+        if file_name.endswith(IMAGE_EXTENSIONS):
+            raw_text, corrected_text, errors = recognize_with_progress(message.chat.id, downloaded, stop_typing)
+        else:
+            # PDF и TIFF могут содержать несколько страниц
+            raw_text, corrected_text, errors = recognize_documents_with_progress(
+                message.chat.id, [(file_name, downloaded)], stop_typing)
 
-        user_data[message.chat.id] = {
-            "raw_text": raw_text,
-            "corrected_text": corrected_text,
-            "errors": errors
-        }
+        store.set_result(message.chat.id, raw_text, corrected_text, errors)
 
         stop_typing.set()
         typing_thread.join()
 
         bot.send_message(message.chat.id,
-                         "✅ Документ успешно обработан.\nЧто вы хотите сделать дальше?",
+                         DOCUMENT_DONE_TEXT,
                          reply_markup=text_action_keyboard(),
                          parse_mode="Markdown")
 
@@ -263,8 +468,12 @@ def handle_image_document(message):
         stop_typing.set()
         typing_thread.join()
         bot.send_message(message.chat.id,
-                         "❌ Ошибка при обработке изображения-документа.")
+                         DOCUMENT_FAILED_TEXT)
         logging.error(f"[ERROR] Ошибка: {e}")
 
+start_bot_metrics_server()
+if recognizer_mode == "queue":
+    threading.Thread(target=deliver_results, name="job-results", daemon=True).start()
+    logging.info("Режим очереди: задания распознают воркеры recognizer_service.queue_worker")
 logging.info("Бот запущен. Ожидаю изображения...")
 bot.polling(none_stop=True)
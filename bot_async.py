@@ -0,0 +1,460 @@
+import json
+import time
+import asyncio
+import logging
+import os
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+from telebot.types import Update
+from bot_utils.messages import (
+    START_TEXT, HELP_TEXT, UNKNOWN_TEXT, NO_DATA_TEXT, BLOCKED_TEXT, INJECTION_TEXT, NO_ERRORS_TEXT,
+    WRONG_DOCUMENT_TEXT, QUEUED_TEXT, REPLY_TEXTS,
+    GET_RAW_BUTTON, GET_CORRECTED_BUTTON, GET_ALL_BUTTON, IMAGE_EXTENSIONS, DOCUMENT_EXTENSIONS,
+    raw_text_message, corrected_text_message, errors_message, progress_message,
+    is_sql_injection, start_keyboard, text_action_keyboard
+)
+from bot_utils.state import store, is_blacklisted
+from bot_utils.rate_limit import check_rate_limit
+from bot_utils.metrics import timed_handler, start_bot_metrics_server
+from bot_utils.job_queue import get_job_queue, DONE, PRIORITY_IMAGE, PRIORITY_DOCUMENT
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+
+load_dotenv()
+
+# адрес Bot API можно подменить, например на локальный фейковый сервер
+telegram_api_url = os.getenv('TELEGRAM_API_URL')
+if telegram_api_url:
+    asyncio_helper.API_URL = telegram_api_url.rstrip('/') + "/bot{0}/{1}"
+    asyncio_helper.FILE_URL = telegram_api_url.rstrip('/') + "/file/bot{0}/{1}"
+
+bot = AsyncTeleBot(os.getenv('bot'))
+recognizer_url = os.getenv('RECOGNIZER_URL', 'http://localhost:8000')
+recognizer_timeout = float(os.getenv('RECOGNIZER_TIMEOUT', '300'))
+# http - запрос к сервису распознавания, queue - задание в очередь для воркеров
+recognizer_mode = os.getenv('RECOGNIZER_MODE', 'http')
+result_poll_interval = float(os.getenv('JOB_RESULT_POLL_INTERVAL', '0.5'))
+# сколько ждать следующие сообщения альбома, с
+album_wait = float(os.getenv('ALBUM_WAIT', '1.0'))
+
+# polling или webhook
+bot_mode = os.getenv('BOT_MODE', 'polling')
+webhook_url = os.getenv('WEBHOOK_URL')
+webhook_host = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+webhook_port = int(os.getenv('WEBHOOK_PORT', '8443'))
+webhook_path = os.getenv('WEBHOOK_PATH', '/telegram')
+webhook_secret = os.getenv('WEBHOOK_SECRET')
+
+recognizer_session = None
+
+
+class TypingScheduler:
+    """Один таймер, который показывает «печатает...» во всех чатах с активной обработкой.
+    Статус в Telegram живёт около 5 секунд, поэтому обновляется каждые interval секунд."""
+
+    def __init__(self, bot, interval=4.0):
+        self.bot = bot
+        self.interval = interval
+        self.active = {}
+        self._task = None
+        self._pending = set()
+
+    def start(self, chat_id):
+        if chat_id not in self.active:
+            # новый чат получает статус сразу, не дожидаясь следующего тика
+            task = asyncio.create_task(self._send(chat_id))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        self.active[chat_id] = self.active.get(chat_id, 0) + 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self, chat_id):
+        count = self.active.get(chat_id, 0) - 1
+        if count > 0:
+            self.active[chat_id] = count
+        else:
+            self.active.pop(chat_id, None)
+
+    async def _send(self, chat_id):
+        try:
+            await self.bot.send_chat_action(chat_id, action='typing')
+        except Exception as e:
+            logging.warning(f"Не удалось отправить статус набора в чат {chat_id}: {e}")
+
+    async def _run(self):
+        while self.active:
+            await asyncio.sleep(self.interval)
+            await asyncio.gather(*(self._send(chat_id) for chat_id in list(self.active)))
+
+
+typing = TypingScheduler(bot)
+
+
+class ProgressMessage:
+    """Одно сообщение, которое дополняется строками по мере распознавания.
+    Telegram ограничивает частоту редактирования, поэтому правки не чаще interval секунд."""
+
+    def __init__(self, bot, chat_id, interval=1.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.lines = []
+        self.message_id = None
+        self.last_edit = 0
+
+    async def add_line(self, text):
+        self.lines.append(text)
+        if time.time() - self.last_edit >= self.interval:
+            await self.flush()
+
+    async def flush(self):
+        if not self.lines:
+            return
+        text = progress_message(self.lines)
+        try:
+            if self.message_id is None:
+                self.message_id = (await self.bot.send_message(self.chat_id, text)).message_id
+            else:
+                await self.bot.edit_message_text(text, self.chat_id, self.message_id)
+        except ApiTelegramException as e:
+            if "message is not modified" not in str(e):
+                logging.warning(f"Не удалось обновить сообщение с прогрессом: {e}")
+        self.last_edit = time.time()
+
+
+class AlbumCollector:
+    """Собирает сообщения одного альбома: Telegram присылает их отдельными апдейтами.
+    Альбом передаётся в on_album одним списком, когда wait секунд не было новых сообщений."""
+
+    def __init__(self, wait=1.0):
+        self.wait = wait
+        self.albums = {}
+        self.last_seen = {}
+
+    async def add(self, message, on_album):
+        group = message.media_group_id
+        self.last_seen[group] = time.monotonic()
+        if group in self.albums:
+            self.albums[group].append(message)
+            return
+
+        # обработкой всего альбома занимается вызов для первого сообщения
+        self.albums[group] = [message]
+        while (remaining := self.wait - (time.monotonic() - self.last_seen[group])) > 0:
+            await asyncio.sleep(remaining)
+        messages = self.albums.pop(group)
+        self.last_seen.pop(group)
+        await on_album(sorted(messages, key=lambda m: m.message_id))
+
+
+albums = AlbumCollector(album_wait)
+
+
+async def stream_to_pipeline(path, data, on_line, headers=None):
+    """Отправляет файлы в потоковый эндпоинт и вызывает on_line для каждой распознанной строки"""
+    try:
+        async with recognizer_session.post(f"{recognizer_url}{path}", data=data, headers=headers) as response:
+            response.raise_for_status()
+            async for raw_event in response.content:
+                if not raw_event.strip():
+                    continue
+                event = json.loads(raw_event)
+                if event["type"] == "line":
+                    await on_line(event["text"])
+                elif event["type"] == "result":
+                    return event["recognized_text"], event["corrected_text"], event["errors"]
+                elif event["type"] == "error":
+                    raise RuntimeError(event["detail"])
+    except aiohttp.ClientError as e:
+        logging.error(f"[ERROR] Ошибка запроса к микросервису: {e}")
+        raise
+
+    raise RuntimeError("Микросервис не вернул итоговый результат")
+
+
+async def stream_image_to_pipeline(image_bytes, on_line):
+    """Одно изображение через /process/stream: файл из Telegram уходит телом запроса как есть,
+    без перекодирования и multipart"""
+    return await stream_to_pipeline("/process/stream", image_bytes, on_line,
+                                    {"Content-Type": "application/octet-stream"})
+
+
+async def stream_documents_to_pipeline(documents, on_line):
+    """Несколько изображений, PDF или TIFF одним заданием через /process/batch/stream.
+    documents - список пар (имя файла, содержимое)"""
+    data = aiohttp.FormData()
+    for file_name, contents in documents:
+        data.add_field("files", contents, filename=file_name, content_type="application/octet-stream")
+    return await stream_to_pipeline("/process/batch/stream", data, on_line)
+
+
+async def download(file_id, file_name):
+    file_info = await bot.get_file(file_id)
+    return file_name, await bot.download_file(file_info.file_path)
+
+
+def message_file(message):
+    """file_id и имя файла из фото или документа"""
+    if message.photo:
+        return message.photo[-1].file_id, "image.jpg"
+    return message.document.file_id, message.document.file_name or "document"
+
+
+def is_supported(message):
+    return bool(message.photo) or (message.document.file_name or "").lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def job_kind(documents):
+    """Тип задания очереди и его приоритет"""
+    if len(documents) == 1 and documents[0][0].lower().endswith(IMAGE_EXTENSIONS):
+        return "image", PRIORITY_IMAGE
+    return "document", PRIORITY_DOCUMENT
+
+
+async def enqueue_files(message, files, reply):
+    """Режим очереди: скачанные файлы уходят воркерам, ответ отправит deliver_results"""
+    chat_id = message.chat.id
+    try:
+        documents = await asyncio.gather(*(download(file_id, file_name) for file_id, file_name in files))
+        kind, priority = job_kind(documents)
+        job_id = await asyncio.to_thread(get_job_queue().enqueue, kind, documents,
+                                         {"chat_id": chat_id, "reply": reply}, priority)
+    except Exception as e:
+        await bot.send_message(chat_id, REPLY_TEXTS[reply][1])
+        logging.error(f"[ERROR] Не удалось поставить задание в очередь: {e}")
+        return
+
+    logging.info(f"Задание {job_id} ({kind}) поставлено в очередь для чата {chat_id}")
+    typing.start(chat_id)
+    await bot.send_message(chat_id, QUEUED_TEXT)
+
+
+async def deliver(queue, job):
+    """Отправляет результат задания в чат. Результат подтверждается только после отправки,
+    поэтому при сбое он будет доставлен повторно"""
+    chat_id = job.meta["chat_id"]
+    done_text, failed_text = REPLY_TEXTS[job.meta["reply"]]
+    typing.stop(chat_id)
+    try:
+        if job.status == DONE:
+            result = job.result
+            store.set_result(chat_id, result["recognized_text"], result["corrected_text"], result["errors"])
+            await bot.send_message(chat_id, done_text, reply_markup=text_action_keyboard(), parse_mode="Markdown")
+        else:
+            logging.error(f"[ERROR] Задание {job.id} не выполнено: {job.error}")
+            await bot.send_message(chat_id, failed_text)
+    except ApiTelegramException as e:
+        # чат недоступен (бот заблокирован и т.п.), повторная отправка не поможет
+        logging.warning(f"Не удалось отправить результат задания {job.id}: {e}")
+    except Exception as e:
+        logging.error(f"[ERROR] Не удалось отправить результат задания {job.id}: {e}")
+        return
+    await asyncio.to_thread(queue.ack, job.id)
+
+
+async def deliver_results():
+    """Режим очереди: забирает результаты, записанные воркерами, и отправляет их пользователям"""
+    queue = get_job_queue()
+    while True:
+        try:
+            jobs = await asyncio.to_thread(queue.take_results)
+        except Exception as e:
+            logging.error(f"[ERROR] Ошибка чтения результатов из очереди: {e}")
+            jobs = []
+        await asyncio.gather(*(deliver(queue, job) for job in jobs))
+        if not jobs:
+            await asyncio.sleep(result_poll_interval)
+
+
+async def recognize_files(message, files, reply):
+    """Скачивает файлы из Telegram, распознаёт их одним заданием и сохраняет результат для чата.
+    files - список пар (file_id, имя файла), reply - тип ответа из REPLY_TEXTS"""
+    if recognizer_mode == "queue":
+        await enqueue_files(message, files, reply)
+        return
+
+    done_text, failed_text = REPLY_TEXTS[reply]
+    chat_id = message.chat.id
+    typing.start(chat_id)
+    progress = ProgressMessage(bot, chat_id)
+
+    async def on_line(text):
+        if not progress.lines:
+            typing.stop(chat_id)
+        await progress.add_line(text)
+
+    try:
+        documents = await asyncio.gather(*(download(file_id, file_name) for file_id, file_name in files))
+
+        if job_kind(documents)[0] == "image":
+            raw_text, corrected_text, errors = await stream_image_to_pipeline(documents[0][1], on_line)
+        else:
+            raw_text, corrected_text, errors = await stream_documents_to_pipeline(documents, on_line)
+        await progress.flush()
+
+        store.set_result(chat_id, raw_text, corrected_text, errors)
+
+        await bot.send_message(chat_id, done_text,
+                               reply_markup=text_action_keyboard(),
+                               parse_mode="Markdown")
+
+    except Exception as e:
+        await bot.send_message(chat_id, failed_text)
+        logging.error(f"[ERROR] Ошибка: {e}")
+
+    finally:
+        if not progress.lines:
+            typing.stop(chat_id)
+
+
+async def recognize_album(messages):
+    """Все страницы альбома распознаются одним заданием, лимит запросов списывается один раз"""
+    first = messages[0]
+    if not check_rate_limit(first.from_user.id, "image"):
+        return
+
+    files = [message_file(message) for message in messages if is_supported(message)]
+    if not files:
+        await bot.send_message(first.chat.id, WRONG_DOCUMENT_TEXT)
+        return
+
+    await recognize_files(first, files, "album")
+
+
+@bot.message_handler(func=lambda message: is_blacklisted(message.from_user.id))
+async def handle_blacklisted(message):
+    await bot.send_message(message.chat.id, BLOCKED_TEXT)
+    logging.warning(f"Заблокированный пользователь {message.from_user.id} попытался отправить сообщение")
+
+
+@bot.message_handler(content_types=['text'])
+@timed_handler("text")
+async def handle_text(message):
+    if not check_rate_limit(message.from_user.id):
+        return
+
+    if is_sql_injection(message.text):
+        logging.warning(f"Обнаружена попытка SQL-инъекции от пользователя {message.from_user.id}")
+        await bot.send_message(message.chat.id, INJECTION_TEXT)
+        return
+
+    chat_id = message.chat.id
+    if message.text.lower() == "старт":
+        await bot.send_message(chat_id, START_TEXT, reply_markup=start_keyboard(), parse_mode="Markdown")
+
+    elif message.text.lower() == "помощь":
+        await bot.send_message(chat_id, HELP_TEXT, reply_markup=start_keyboard(), parse_mode="Markdown")
+
+    elif message.text in (GET_RAW_BUTTON, GET_CORRECTED_BUTTON, GET_ALL_BUTTON):
+        data = store.get_result(chat_id)
+        if not data:
+            await bot.send_message(chat_id, NO_DATA_TEXT)
+            return
+
+        if message.text in (GET_RAW_BUTTON, GET_ALL_BUTTON):
+            await bot.send_message(chat_id, raw_text_message(data.raw_text), parse_mode="Markdown")
+        if message.text in (GET_CORRECTED_BUTTON, GET_ALL_BUTTON):
+            await bot.send_message(chat_id, corrected_text_message(data.corrected_text), parse_mode="Markdown")
+        if message.text == GET_ALL_BUTTON:
+            if data.errors:
+                await bot.send_message(chat_id, errors_message(data.errors), parse_mode="HTML")
+            else:
+                await bot.send_message(chat_id, NO_ERRORS_TEXT)
+
+    else:
+        await bot.send_message(chat_id, UNKNOWN_TEXT, reply_markup=start_keyboard(), parse_mode="Markdown")
+
+
+@bot.message_handler(content_types=['photo'])
+@timed_handler("photo")
+async def handle_photo(message):
+    if message.media_group_id:
+        await albums.add(message, recognize_album)
+        return
+
+    if not check_rate_limit(message.from_user.id, "image"):
+        return
+
+    await recognize_files(message, [message_file(message)], "photo")
+
+
+@bot.message_handler(content_types=['document'])
+@timed_handler("document")
+async def handle_image_document(message):
+    if message.media_group_id:
+        await albums.add(message, recognize_album)
+        return
+
+    if not check_rate_limit(message.from_user.id, "image"):
+        return
+
+    if not is_supported(message):
+        await bot.send_message(message.chat.id, WRONG_DOCUMENT_TEXT)
+        return
+
+    await recognize_files(message, [message_file(message)], "document")
+
+
+async def handle_webhook(request):
+    if webhook_secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != webhook_secret:
+        return web.Response(status=403)
+
+    update = Update.de_json(await request.json())
+    # обработка идёт в фоне, Telegram сразу получает ответ
+    task = asyncio.create_task(bot.process_new_updates([update]))
+    request.app["tasks"].add(task)
+    task.add_done_callback(request.app["tasks"].discard)
+    return web.Response()
+
+
+async def run_webhook():
+    app = web.Application()
+    app["tasks"] = set()
+    app.router.add_post(webhook_path, handle_webhook)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, webhook_host, webhook_port).start()
+    await bot.set_webhook(url=webhook_url, secret_token=webhook_secret)
+    logging.info(f"Бот запущен в режиме webhook на {webhook_host}:{webhook_port}{webhook_path}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def main():
+    global recognizer_session
+    start_bot_metrics_server()
+    timeout = aiohttp.ClientTimeout(total=recognizer_timeout)
+    recognizer_session = aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=100))
+    if recognizer_mode == "queue":
+        delivery = asyncio.create_task(deliver_results())
+        logging.info("Режим очереди: задания распознают воркеры recognizer_service.queue_worker")
+
+    try:
+        if bot_mode == "webhook":
+            await run_webhook()
+        else:
+            logging.info("Бот запущен. Ожидаю изображения...")
+            await bot.delete_webhook()
+            await bot.infinity_polling()
+    finally:
+        if recognizer_mode == "queue":
+            delivery.cancel()
+        await recognizer_session.close()
+        await bot.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
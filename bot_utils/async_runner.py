@@ -0,0 +1,22 @@
+import asyncio
+import threading
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """Общий фоновый event loop для вызова асинхронных клиентов из синхронного кода.
+    Живёт всё время работы процесса, поэтому HTTP-соединения переиспользуются."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="async-runner", daemon=True)
+            thread.start()
+        return _loop
+
+
+def run_sync(coro, timeout=None):
+    """Выполняет корутину в фоновом loop и ждёт результат"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
@@ -1,60 +1,218 @@
-import requests, logging
-
-def check_yandex_spelling(text):
-    """Проверяет орфографию с помощью Яндекс-спеллера."""
-    try:
-        response = requests.get(
-            "https://speller.yandex.net/services/spellservice.json/checkText",
-            params={"text": text, "lang": "ru"}
-        )
-        results = response.json()
-        corrected_text = text
-        log = ""
-
-        for item in reversed(results):
-            if item["s"]:
-                suggestion = item["s"][0]
-                start = item["pos"]
-                end = start + item["len"]
-                corrected_text = corrected_text[:start] + suggestion + corrected_text[end:]
-                log += f"• <code>{item['word']}</code> → <b>{suggestion}</b>\n"
-
-        return corrected_text, log
-
-    except Exception as e:
-        logging.error(f"[ERROR] Yandex Speller error: {e}")
-        return text, "⚠️ <i>Не удалось проверить орфографию через Яндекс.</i>\n"
-
-
-def check_grammar_tool(text):
-    """Проверяет грамматику и стиль с помощью LanguageTool."""
-    import language_tool_python
-    try:
-        tool = language_tool_python.LanguageTool('ru-RU')
-        matches = tool.check(text)
-        corrected_text = language_tool_python.utils.correct(text, matches)
-
-        log = ""
-        for match in matches:
-            context = match.context.replace('\n', ' ')
-            log += f"• <b>{match.message}</b>\n  ⤷ <code>{context.strip()}</code>\n"
-
-        tool.close()
-        return corrected_text, log
-
-    except Exception as e:
-        logging.error(f"[ERROR] LanguageTool error: {e}")
-        return text, "⚠️ <i>Не удалось проверить грамматику через LanguageTool.</i>"
+import os, re, asyncio, logging
+from bot_utils.async_runner import run_sync
+from bot_utils.ttl_cache import TTLCache
+from bot_utils.speller import get_speller
+from bot_utils.grammar_pool import get_grammar_pool
+from bot_utils import metrics
 
-def check_spelling_and_grammar(text):
-    """Использует Яндекс-спеллер и LanguageTool для проверки орфографии и грамматики."""
-    yandex_corrected, yandex_log = check_yandex_spelling(text)
-    final_text, lt_log = check_grammar_tool(yandex_corrected)
+YANDEX_FAILED_LOG = "⚠️ <i>Не удалось проверить орфографию через Яндекс.</i>\n"
+GRAMMAR_FAILED_LOG = "⚠️ <i>Не удалось проверить грамматику через LanguageTool.</i>"
+
+WORD_RE = re.compile(r"\w+")
+# предложение или строка: до конца предложения или перевода строки, без пробелов по краям
+SENTENCE_RE = re.compile(r"[^\s].*?(?:[.!?…]+(?=\s|$)|(?=\n)|$)", re.S)
+
+CHUNK_MAX_CHARS = int(os.getenv("SPELLING_CHUNK_MAX_CHARS", "1000"))
+
+# исправления спеллера по отдельным словам: слово -> исправление ("" - ошибки нет)
+word_cache = TTLCache(int(os.getenv("SPELLER_WORD_CACHE_SIZE", "50000")))
+# исправления по фрагментам текста (см. split_chunks): фрагмент -> список исправлений
+chunk_cache = TTLCache(int(os.getenv("SPELLING_CHUNK_CACHE_SIZE", "5000")))
+
+
+def apply_edits(text, edits):
+    """Применяет правки (start, end, replacement) за один проход.
+    Правка, пересекающаяся с уже применённой, пропускается"""
+    parts = []
+    position = 0
+    for start, end, replacement in sorted(edits):
+        if start < position:
+            logging.warning(f"Пропущена пересекающаяся правка {start}-{end}: {replacement!r}")
+            continue
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+async def speller_results(text, speller):
+    """Ответ спеллера в формате checkText, собранный из пословного кэша.
+    Спеллеру отправляются только слова, которых ещё нет в кэше."""
+    if not word_cache.max_items:
+        return await speller.check_text(text)
+
+    matches = list(WORD_RE.finditer(text))
+    known = {}
+    for match in matches:
+        word = match.group()
+        if word not in known:
+            known[word] = word_cache.get(word)
+
+    unknown = [word for word, suggestion in known.items() if suggestion is None]
+    if unknown:
+        for word, items in zip(unknown, await speller.check_texts(unknown)):
+            suggestion = items[0]["s"][0] if items and items[0]["s"] else ""
+            word_cache.set(word, suggestion)
+            known[word] = suggestion
+
+    return [
+        {"pos": match.start(), "len": len(match.group()), "word": match.group(), "s": [known[match.group()]]}
+        for match in matches if known[match.group()]
+    ]
+
+
+def grammar_matches(text):
+    """Возвращает список ошибок LanguageTool для текста"""
+    return get_grammar_pool().check(text)
+
+
+async def timed(name, awaitable):
+    with metrics.stage(name):
+        return await awaitable
+
+
+def split_chunks(text, max_chars=CHUNK_MAX_CHARS):
+    """Делит текст на фрагменты по границам предложений и строк.
+    Возвращает пары (смещение, фрагмент); фрагменты не длиннее max_chars,
+    слишком длинные предложения режутся по пробелам."""
+    chunks = []
+    for match in SENTENCE_RE.finditer(text):
+        start, end = match.start(), match.start() + len(match.group().rstrip())
+        while end - start > max_chars:
+            cut = text.rfind(" ", start + 1, start + max_chars + 1)
+            if cut == -1:
+                cut = start + max_chars
+            chunks.append((start, text[start:cut]))
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+        if start < end:
+            chunks.append((start, text[start:end]))
+    return chunks
+
+
+def speller_corrections(results):
+    """Исправления из ответа Яндекс-спеллера"""
+    return [
+        {"offset": item["pos"], "length": item["len"], "original": item["word"],
+         "replacement": item["s"][0], "source": "yandex"}
+        for item in results if item["s"]
+    ]
+
+
+def grammar_corrections(chunk, matches, taken):
+    """Исправления LanguageTool, не пересекающиеся с исправлениями спеллера и друг с другом.
+    replacement равен None, если LanguageTool только указывает на ошибку."""
+    taken = list(taken)
+    corrections = []
+    for match in matches:
+        start, end = match.offset, match.offset + match.errorLength
+        if any(start < c["offset"] + c["length"] and c["offset"] < end for c in taken):
+            continue
+        corrections.append({
+            "offset": start, "length": match.errorLength, "original": chunk[start:end],
+            "replacement": match.replacements[0] if match.replacements else None,
+            "source": "languagetool", "message": match.message,
+            "context": match.context.replace("\n", " ").strip(),
+        })
+        taken.append(corrections[-1])
+    return corrections
+
+
+def _failed(service, results):
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        metrics.EXTERNAL_ERRORS.labels(service).inc()
+        logging.error(f"[ERROR] {service} error: {failed[0]}")
+    return bool(failed)
+
+
+async def find_corrections_async(text, speller=None):
+    """Находит ошибки в тексте по фрагментам (см. split_chunks).
+
+    Фрагменты, уже встречавшиеся раньше, берутся из chunk_cache, остальные проверяются
+    Яндекс-спеллером и LanguageTool параллельно. Правки LanguageTool, пересекающиеся
+    с правками спеллера, отбрасываются. Возвращает исправления, отсортированные по offset
+    (смещения относительно text), и список сервисов, которые не ответили."""
+    speller = speller or get_speller()
+    loop = asyncio.get_running_loop()
+
+    chunks = split_chunks(text)
+    found = [chunk_cache.get(chunk) for _, chunk in chunks]
+    pending = [(index, chunk) for index, (_, chunk) in enumerate(chunks) if found[index] is None]
+
+    warnings = []
+    if pending:
+        yandex_task = timed("yandex", asyncio.gather(
+            *(speller_results(chunk, speller) for _, chunk in pending), return_exceptions=True))
+        grammar_task = timed("languagetool", asyncio.gather(
+            *(loop.run_in_executor(None, grammar_matches, chunk) for _, chunk in pending),
+            return_exceptions=True))
+        yandex_results, grammar_results = await asyncio.gather(yandex_task, grammar_task)
+        if _failed("yandex", yandex_results):
+            warnings.append("yandex")
+        if _failed("languagetool", grammar_results):
+            warnings.append("languagetool")
+
+        for (index, chunk), yandex_result, grammar_result in zip(pending, yandex_results, grammar_results):
+            corrections = [] if isinstance(yandex_result, Exception) else speller_corrections(yandex_result)
+            if not isinstance(grammar_result, Exception):
+                corrections += grammar_corrections(chunk, grammar_result, corrections)
+            # фрагмент, который не удалось проверить целиком, не кэшируем
+            if not isinstance(yandex_result, Exception) and not isinstance(grammar_result, Exception):
+                chunk_cache.set(chunk, corrections)
+            found[index] = corrections
+
+    corrections = [dict(correction, offset=correction["offset"] + start)
+                   for (start, _), chunk_corrections in zip(chunks, found)
+                   for correction in chunk_corrections]
+    corrections.sort(key=lambda correction: correction["offset"])
+    return corrections, warnings
+
+
+def apply_corrections(text, corrections):
+    """Текст с применёнными исправлениями, за один проход"""
+    return apply_edits(text, [
+        (c["offset"], c["offset"] + c["length"], c["replacement"])
+        for c in corrections if c["replacement"] is not None
+    ])
+
+
+def render_corrections(corrections, warnings=()):
+    """Отчёт об ошибках в HTML для Telegram"""
+    yandex_log = YANDEX_FAILED_LOG if "yandex" in warnings else ""
+    lt_log = GRAMMAR_FAILED_LOG if "languagetool" in warnings else ""
+    for c in corrections:
+        if c["source"] == "yandex":
+            yandex_log += f"• <code>{c['original']}</code> → <b>{c['replacement']}</b>\n"
+        else:
+            lt_log += f"• <b>{c['message']}</b>\n  ⤷ <code>{c['context']}</code>\n"
 
     full_log = ""
     if yandex_log.strip():
-        full_log +=  yandex_log + "\n"
+        full_log += yandex_log + "\n"
     if lt_log.strip():
         full_log += lt_log
+    return full_log.strip()
+
+
+async def correct_text_async(text, speller=None):
+    """Проверяет текст и возвращает (исправленный текст, исправления, отчёт об ошибках)"""
+    corrections, warnings = await find_corrections_async(text, speller)
+    return apply_corrections(text, corrections).strip(), corrections, render_corrections(corrections, warnings)
+
+
+def correct_text(text):
+    return run_sync(correct_text_async(text))
 
-    return final_text.strip(), full_log.strip()
+
+async def check_spelling_and_grammar_async(text, speller=None):
+    """Исправленный текст и отчёт об ошибках в HTML (см. correct_text_async)"""
+    corrected_text, _, errors = await correct_text_async(text, speller)
+    return corrected_text, errors
+
+
+def check_spelling_and_grammar(text):
+    """Использует Яндекс-спеллер и LanguageTool для проверки орфографии и грамматики."""
+    return run_sync(check_spelling_and_grammar_async(text))
@@ -1,4 +1,5 @@
 from PIL import Image
+import numpy as np
 import os, logging
 
 def read_coords(coords_path):
@@ -28,24 +29,87 @@ def read_coords(coords_path):
         logging.error("Ошибка: файл не найден")
 
 
+def to_pixel_boxes(boxes, image_width, image_height, clip=True):
+    """Векторно переводит массив N×6 (class, x_center, y_center, width, height, conf)
+    с нормализованными координатами в массив N×4 (x1, y1, x2, y2) в пикселях"""
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    centers = boxes[:, 1:3]
+    half_sizes = boxes[:, 3:5] / 2
+    scale = np.array([image_width, image_height], dtype=np.float64)
+
+    pixel_boxes = np.empty((len(boxes), 4), dtype=np.float64)
+    pixel_boxes[:, :2] = (centers - half_sizes) * scale
+    pixel_boxes[:, 2:] = (centers + half_sizes) * scale
+    pixel_boxes = np.trunc(pixel_boxes).astype(np.int32)
+
+    if clip:
+        np.clip(pixel_boxes[:, 0::2], 0, image_width, out=pixel_boxes[:, 0::2])
+        np.clip(pixel_boxes[:, 1::2], 0, image_height, out=pixel_boxes[:, 1::2])
+
+    return pixel_boxes
+
+
 def convert_to_pixel_coords(normalized_coords, image_width, image_height):
     """Преобразовывает каждый элемент списка с нормализованными координатами в пиксельные координаты"""
 
-    pixel_coords = []
-    for word in normalized_coords:
-        normalized_x_center = word[1]
-        normalized_y_center = word[2]
-        normalized_width = word[3]
-        normalized_height = word[4]
+    if normalized_coords is None or len(normalized_coords) == 0:
+        return []
+    return [tuple(bbox) for bbox in to_pixel_boxes(normalized_coords, image_width, image_height).tolist()]
+
 
-        x1 = int((normalized_x_center - normalized_width / 2) * image_width)
-        y1 = int((normalized_y_center - normalized_height / 2) * image_height)
-        x2 = int((normalized_x_center + normalized_width / 2) * image_width)
-        y2 = int((normalized_y_center + normalized_height / 2) * image_height)
+def box_overlaps(boxes_a, boxes_b, mode="iou"):
+    """Попарное перекрытие рамок (поэлементно, с broadcasting): iou - пересечение к объединению,
+    min - пересечение к площади меньшей рамки (ловит слово, вложенное в другое)"""
 
-        pixel_coords.append((x1, y1, x2, y2))
+    x1 = np.maximum(boxes_a[..., 0], boxes_b[..., 0])
+    y1 = np.maximum(boxes_a[..., 1], boxes_b[..., 1])
+    x2 = np.minimum(boxes_a[..., 2], boxes_b[..., 2])
+    y2 = np.minimum(boxes_a[..., 3], boxes_b[..., 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
 
-    return pixel_coords
+    areas_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    areas_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    if mode == "min":
+        denominator = np.minimum(areas_a, areas_b)
+    else:
+        denominator = areas_a + areas_b - intersection
+    return intersection / np.maximum(denominator, 1e-6)
+
+
+def deduplicate_boxes(pixel_boxes, scores, threshold=0.5, mode="iou"):
+    """Non-maximum suppression: из сильно перекрывающихся рамок остаётся самая уверенная.
+    Возвращает индексы оставленных рамок в исходном порядке."""
+
+    boxes = np.asarray(pixel_boxes, dtype=np.float64).reshape(-1, 4)
+    count = len(boxes)
+    if not count:
+        return np.empty(0, dtype=np.int64)
+
+    # сравниваются только пары, пересекающиеся по вертикали: рамки сортируются по верхнему краю,
+    # и для каждой берутся следующие за ней, чей верх выше её низа
+    by_top = np.argsort(boxes[:, 1], kind="stable")
+    ends = np.searchsorted(boxes[by_top, 1], boxes[by_top, 3], side="left")
+    counts = np.maximum(ends - np.arange(count) - 1, 0)
+    first = np.repeat(np.arange(count), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    first, second = by_top[first], by_top[second]
+
+    duplicate = box_overlaps(boxes[first], boxes[second], mode) > threshold
+    neighbours = [[] for _ in range(count)]
+    for a, b in zip(first[duplicate].tolist(), second[duplicate].tolist()):
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    suppressed = np.zeros(count, dtype=bool)
+    keep = []
+    for index in np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable").tolist():
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        suppressed[neighbours[index]] = True
+
+    return np.sort(np.array(keep, dtype=np.int64))
 
 
 def calculate_center(bbox):
@@ -64,43 +128,58 @@ def calculate_average_height(pixel_coords):
     return sum(heights) / len(heights) if heights else 0
 
 
-def sort_coords(pixel_coords):
-    """Сортирует bounding boxes слева-направо и сверху-вниз с адаптивным порогом для разделения строк."""
+def group_lines_array(pixel_boxes):
+    """Векторная группировка рамок N×4 в строки.
+    Возвращает список массивов индексов: строки сверху-вниз, слова слева-направо."""
+
+    pixel_boxes = np.asarray(pixel_boxes, dtype=np.float64).reshape(-1, 4)
+    if not len(pixel_boxes):
+        return []
+
+    average_height = float(np.mean(pixel_boxes[:, 3] - pixel_boxes[:, 1]))
+    y_threshold = max(10, int(average_height * 0.6))
+
+    x_centers = (pixel_boxes[:, 0] + pixel_boxes[:, 2]) / 2
+    y_centers = (pixel_boxes[:, 1] + pixel_boxes[:, 3]) / 2
+
+    by_y = np.argsort(y_centers, kind="stable")
+    # новая строка начинается там, где центр отстоит от предыдущего больше чем на порог
+    line_ids = np.empty(len(by_y), dtype=np.int64)
+    line_ids[by_y] = np.concatenate(([0], np.cumsum(np.diff(y_centers[by_y]) > y_threshold)))
+
+    # при равных x сохраняется порядок по y, как у устойчивой сортировки
+    order = by_y[np.lexsort((x_centers[by_y], line_ids[by_y]))]
+    boundaries = np.flatnonzero(np.diff(line_ids[order])) + 1
+    return np.split(order, boundaries)
+
+
+def group_lines(pixel_coords):
+    """Группирует bounding boxes в строки сверху-вниз, внутри строки слова идут слева-направо."""
 
     if not pixel_coords:
         return []
 
-    average_height = calculate_average_height(pixel_coords)
+    return [[pixel_coords[i] for i in line] for line in group_lines_array(pixel_coords)]
 
-    y_threshold = max(10, int(average_height * 0.6))
 
-    bboxes_with_center = [(bbox, calculate_center(bbox)) for bbox in pixel_coords]
-    bboxes_with_center.sort(key=lambda item: item[1][1])
-    lines = []
-    current_line = []
-
-    for bbox, center in bboxes_with_center:
-        if not current_line:
-            current_line.append((bbox, center))
-        else:
-            prev_center = current_line[-1][1]
-            if abs(center[1] - prev_center[1]) <= y_threshold:
-                current_line.append((bbox, center))
-            else:
-                lines.append(current_line)
-                current_line = [(bbox, center)]
-
-    if current_line:
-        lines.append(current_line)
+def sort_coords(pixel_coords):
+    """Сортирует bounding boxes слева-направо и сверху-вниз с адаптивным порогом для разделения строк."""
 
     sorted_coords = []
-    for line in lines:
-        line.sort(key=lambda item: item[1][0])
-        sorted_coords.extend([bbox for bbox, _ in line])
+    for line in group_lines(pixel_coords):
+        sorted_coords.extend(line)
 
     return sorted_coords
 
 
+def crop_images(image, sorted_pixel_coords):
+    """Вырезает слова из уже открытого изображения без сохранения на диск"""
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return [image.crop(bbox) for bbox in sorted_pixel_coords]
+
+
 def crop_and_save_images(image_path, sorted_pixel_coords, output_dir):
     image_original = Image.open(image_path).convert("RGB")
     c = 0
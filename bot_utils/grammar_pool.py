@@ -0,0 +1,139 @@
+import os
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+LANGUAGETOOL_POOL_SIZE = int(os.getenv("LANGUAGETOOL_POOL_SIZE", "1"))
+LANGUAGETOOL_URL = os.getenv("LANGUAGETOOL_URL")
+LANGUAGETOOL_HEALTH_INTERVAL = float(os.getenv("LANGUAGETOOL_HEALTH_INTERVAL", "60"))
+# сколько ждать свободный экземпляр; по истечении проверка грамматики считается недоступной
+LANGUAGETOOL_ACQUIRE_TIMEOUT = float(os.getenv("LANGUAGETOOL_ACQUIRE_TIMEOUT", "30"))
+
+HEALTH_CHECK_TEXT = "Проверка связи."
+
+
+class LanguageToolPool:
+    """Пул долгоживущих экземпляров LanguageTool.
+
+    Java-сервер запускается один раз при старте, а не на каждый запрос.
+    Экземпляр, упавший во время проверки или не прошедший проверку
+    здоровья, закрывается и перезапускается."""
+
+    def __init__(self, size=1, lang="ru-RU", remote_server=None, health_interval=60, acquire_timeout=30):
+        self.size = size
+        self.lang = lang
+        self.remote_server = remote_server
+        self.health_interval = health_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        self.restarts = 0
+
+    def _create_tool(self):
+        import language_tool_python
+        tool = language_tool_python.LanguageTool(self.lang, remote_server=self.remote_server)
+        tool.check(HEALTH_CHECK_TEXT)
+        return tool
+
+    def _restart(self, tool):
+        try:
+            tool.close()
+        except Exception as e:
+            logging.warning(f"LanguageTool: ошибка при закрытии экземпляра: {e}")
+        self.restarts += 1
+        logging.warning("LanguageTool: экземпляр перезапускается")
+        return self._create_tool()
+
+    def start(self):
+        """Запускает и прогревает все экземпляры пула. Если какой-то экземпляр не запустился,
+        уже созданные закрываются, а следующий вызов (в том числе из acquire) пробует снова"""
+        with self._lock:
+            if self._started:
+                return
+            tools = []
+            try:
+                for _ in range(self.size):
+                    tools.append(self._create_tool())
+            except Exception:
+                for tool in tools:
+                    try:
+                        tool.close()
+                    except Exception as e:
+                        logging.warning(f"LanguageTool: ошибка при закрытии экземпляра: {e}")
+                raise
+            for tool in tools:
+                self._idle.put(tool)
+            self._started = True
+
+        if self.health_interval:
+            threading.Thread(target=self._health_loop, name="languagetool-health", daemon=True).start()
+        logging.info(f"LanguageTool: запущено экземпляров: {self.size}")
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        self.start()
+        try:
+            tool = self._idle.get(timeout=self.acquire_timeout if timeout is None else timeout)
+        except queue.Empty:
+            raise TimeoutError("нет свободного экземпляра LanguageTool") from None
+        try:
+            yield tool
+        except Exception:
+            try:
+                tool = self._restart(tool)
+            except Exception as e:
+                logging.error(f"[ERROR] Не удалось перезапустить LanguageTool: {e}")
+            raise
+        finally:
+            self._idle.put(tool)
+
+    def check(self, text, timeout=None):
+        with self.acquire(timeout) as tool:
+            return tool.check(text)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            # проверяем только свободные экземпляры, занятые проверяются в acquire
+            for _ in range(self._idle.qsize()):
+                try:
+                    tool = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    tool.check(HEALTH_CHECK_TEXT)
+                except Exception as e:
+                    logging.error(f"[ERROR] LanguageTool не прошёл проверку здоровья: {e}")
+                    try:
+                        tool = self._restart(tool)
+                    except Exception as e:
+                        # экземпляр возвращается в пул, иначе пул уменьшается навсегда;
+                        # следующая проверка с ним упадёт, и acquire попробует перезапуск снова
+                        logging.error(f"[ERROR] Не удалось перезапустить LanguageTool: {e}")
+                self._idle.put(tool)
+
+    def close(self):
+        self._stop.set()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._started = False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_grammar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LanguageToolPool(LANGUAGETOOL_POOL_SIZE, remote_server=LANGUAGETOOL_URL,
+                                     health_interval=LANGUAGETOOL_HEALTH_INTERVAL,
+                                     acquire_timeout=LANGUAGETOOL_ACQUIRE_TIMEOUT)
+        return _pool
@@ -0,0 +1,378 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import itertools
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqlite")
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+
+# одиночные фото обгоняют многостраничные документы и альбомы
+PRIORITY_IMAGE = 10
+PRIORITY_DOCUMENT = 0
+
+PENDING, RUNNING, DONE, DEAD = "pending", "running", "done", "dead"
+
+
+@dataclass
+class Job:
+    """Задание распознавания. kind: image - одно изображение, document - изображения, PDF и TIFF
+    одним документом. files - список пар (имя, содержимое), meta - данные отправителя (чат и т.п.)"""
+    id: int
+    kind: str
+    files: list
+    meta: dict
+    priority: int = 0
+    status: str = PENDING
+    attempts: int = 0
+    max_attempts: int = 3
+    result: dict = None
+    error: str = None
+    available_at: float = 0.0
+    lease_until: float = None
+    delivery_until: float = None
+    delivered: bool = False
+    worker: str = None
+    created: float = field(default_factory=time.time)
+
+
+def retry_delay(base, attempts):
+    """Экспоненциальная задержка перед повтором: base, 2*base, 4*base..."""
+    return base * 2 ** max(0, attempts - 1)
+
+
+class MemoryJobQueue:
+    """Очередь заданий в памяти процесса: для бота и воркеров в одном процессе и для проверок.
+
+    Семантика «хотя бы один раз»: взятое задание арендуется на lease секунд, и если воркер
+    не отчитался и не продлил аренду (extend_lease) за это время, задание снова выдаётся.
+    complete, fail и extend_lease принимают задание, полученное от claim, и действуют только
+    для текущей попытки: опоздавший воркер, у которого задание уже забрали, ничего не меняет.
+    Результаты тоже выдаются в аренду и удаляются только после ack."""
+
+    def __init__(self, max_attempts=3, retry_delay=5):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def enqueue(self, kind, files, meta, priority=0, max_attempts=None):
+        with self._lock:
+            job = Job(next(self._ids), kind, list(files), dict(meta), priority,
+                      max_attempts=max_attempts or self.max_attempts)
+            self._jobs[job.id] = job
+            return job.id
+
+    def _expire_leases(self, now):
+        for job in self._jobs.values():
+            if job.status == RUNNING and job.lease_until <= now and job.attempts >= job.max_attempts:
+                job.status, job.error = DEAD, "Истекла аренда последней попытки"
+
+    def claim(self, worker, lease=300):
+        """Берёт задание с наибольшим приоритетом (при равном - самое старое) или возвращает None"""
+        now = time.time()
+        with self._lock:
+            self._expire_leases(now)
+            ready = [job for job in self._jobs.values()
+                     if (job.status == PENDING and job.available_at <= now)
+                     or (job.status == RUNNING and job.lease_until <= now)]
+            if not ready:
+                return None
+            job = min(ready, key=lambda j: (-j.priority, j.id))
+            job.status, job.worker, job.lease_until = RUNNING, worker, now + lease
+            job.attempts += 1
+            # воркер получает копию, чтобы по ней можно было узнать свою попытку
+            return replace(job, files=list(job.files))
+
+    def _owned(self, claimed):
+        """Задание в очереди, если оно всё ещё выполняется попыткой claimed, иначе None"""
+        job = self._jobs.get(claimed.id)
+        if job is not None and job.status == RUNNING and (job.worker, job.attempts) == (
+                claimed.worker, claimed.attempts):
+            return job
+        return None
+
+    def extend_lease(self, claimed, lease=300):
+        """Продлевает аренду выполняющегося задания. False - задание уже не принадлежит этой попытке"""
+        with self._lock:
+            job = self._owned(claimed)
+            if job is None:
+                return False
+            job.lease_until = time.time() + lease
+            return True
+
+    def complete(self, claimed, result):
+        with self._lock:
+            job = self._owned(claimed)
+            if job is not None:
+                job.status, job.result, job.error, job.files = DONE, result, None, []
+
+    def fail(self, claimed, error, retry=True):
+        """Неудачная попытка: задание возвращается в очередь с задержкой
+        или уходит в dead letter, если попытки кончились или retry=False"""
+        with self._lock:
+            job = self._owned(claimed)
+            if job is None:
+                return
+            job.error = error
+            if retry and job.attempts < job.max_attempts:
+                job.status = PENDING
+                job.available_at = time.time() + retry_delay(self.retry_delay, job.attempts)
+            else:
+                job.status = DEAD
+
+    def take_results(self, limit=100, lease=60):
+        """Готовые и окончательно упавшие задания, ещё не доставленные пользователю"""
+        now = time.time()
+        with self._lock:
+            self._expire_leases(now)
+            jobs = [job for job in self._jobs.values()
+                    if job.status in (DONE, DEAD) and not job.delivered
+                    and (job.delivery_until is None or job.delivery_until <= now)]
+            jobs.sort(key=lambda j: j.id)
+            for job in jobs[:limit]:
+                job.delivery_until = now + lease
+            return jobs[:limit]
+
+    def ack(self, job_id):
+        """Результат доставлен: выполненное задание удаляется, dead letter остаётся для разбора"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.status == DONE:
+                del self._jobs[job_id]
+            else:
+                job.delivered = True
+
+    def dead_letters(self, limit=100):
+        with self._lock:
+            return sorted((j for j in self._jobs.values() if j.status == DEAD), key=lambda j: j.id)[:limit]
+
+    def requeue(self, job_id):
+        """Возвращает задание из dead letter в очередь с нулевым счётчиком попыток"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != DEAD:
+                return False
+            job.status, job.attempts, job.available_at = PENDING, 0, 0.0
+            job.error, job.delivered, job.delivery_until = None, False, None
+            return True
+
+    def purge_dead(self):
+        with self._lock:
+            dead = [job_id for job_id, job in self._jobs.items() if job.status == DEAD and job.delivered]
+            for job_id in dead:
+                del self._jobs[job_id]
+            return len(dead)
+
+    def stats(self):
+        with self._lock:
+            counts = {status: 0 for status in (PENDING, RUNNING, DONE, DEAD)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+
+class SQLiteJobQueue:
+    """Очередь заданий в файле SQLite: бот и любое число воркеров на одной машине.
+
+    Семантика та же, что у MemoryJobQueue. Выдача задания - одна транзакция
+    BEGIN IMMEDIATE, поэтому два воркера не возьмут одно задание одновременно.
+    Попытка определяется парой (worker, attempts)."""
+
+    def __init__(self, path, max_attempts=3, retry_delay=5):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, meta TEXT NOT NULL, "
+            "priority INTEGER NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, "
+            "max_attempts INTEGER NOT NULL, available_at REAL NOT NULL, lease_until REAL, worker TEXT, "
+            "result TEXT, error TEXT, delivery_until REAL, delivered INTEGER NOT NULL DEFAULT 0, "
+            "created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            "job_id INTEGER NOT NULL, position INTEGER NOT NULL, name TEXT NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (job_id, position))"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку записи, чтобы выборка и обновление шли атомарно
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _job(self, row, files=()):
+        (job_id, kind, meta, priority, status, attempts, max_attempts, available_at, lease_until, worker,
+         result, error, delivery_until, delivered, created) = row
+        return Job(job_id, kind, list(files), json.loads(meta), priority, status, attempts, max_attempts,
+                   json.loads(result) if result else None, error, available_at, lease_until, delivery_until,
+                   bool(delivered), worker, created)
+
+    def _files(self, job_id):
+        return self._conn.execute(
+            "SELECT name, data FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+
+    def enqueue(self, kind, files, meta, priority=0, max_attempts=None):
+        with self._transaction():
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, meta, priority, status, attempts, max_attempts, available_at, created) "
+                "VALUES (?, ?, ?, ?, 0, ?, 0, ?)",
+                (kind, json.dumps(meta, ensure_ascii=False), priority, PENDING,
+                 max_attempts or self.max_attempts, time.time()))
+            job_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO job_files VALUES (?, ?, ?, ?)",
+                [(job_id, position, name, data) for position, (name, data) in enumerate(files)])
+            return job_id
+
+    def _expire_leases(self, now):
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, error = 'Истекла аренда последней попытки' "
+            "WHERE status = ? AND lease_until <= ? AND attempts >= max_attempts",
+            (DEAD, RUNNING, now))
+
+    def claim(self, worker, lease=300):
+        """Берёт задание с наибольшим приоритетом (при равном - самое старое) или возвращает None"""
+        now = time.time()
+        with self._transaction():
+            self._expire_leases(now)
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until <= ?) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (PENDING, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, worker, now + lease, row[0]))
+            job = self._job(row, self._files(row[0]))
+        job.status, job.worker, job.lease_until = RUNNING, worker, now + lease
+        job.attempts += 1
+        return job
+
+    # условие «задание всё ещё выполняется этой попыткой» для complete, fail и extend_lease
+    _OWNED = "id = ? AND status = ? AND worker = ? AND attempts = ?"
+
+    def _owned_args(self, claimed):
+        return claimed.id, RUNNING, claimed.worker, claimed.attempts
+
+    def extend_lease(self, claimed, lease=300):
+        """Продлевает аренду выполняющегося задания. False - задание уже не принадлежит этой попытке"""
+        with self._transaction():
+            cursor = self._conn.execute(f"UPDATE jobs SET lease_until = ? WHERE {self._OWNED}",
+                                        (time.time() + lease, *self._owned_args(claimed)))
+        return cursor.rowcount > 0
+
+    def complete(self, claimed, result):
+        with self._transaction():
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = ?, result = ?, error = NULL WHERE {self._OWNED}",
+                (DONE, json.dumps(result, ensure_ascii=False), *self._owned_args(claimed)))
+            if cursor.rowcount:
+                self._conn.execute("DELETE FROM job_files WHERE job_id = ?", (claimed.id,))
+
+    def fail(self, claimed, error, retry=True):
+        """Неудачная попытка: задание возвращается в очередь с задержкой
+        или уходит в dead letter, если попытки кончились или retry=False"""
+        with self._transaction():
+            row = self._conn.execute(f"SELECT max_attempts FROM jobs WHERE {self._OWNED}",
+                                     self._owned_args(claimed)).fetchone()
+            if row is not None:
+                attempts, max_attempts = claimed.attempts, row[0]
+                if retry and attempts < max_attempts:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, available_at = ? WHERE id = ?",
+                        (PENDING, error, time.time() + retry_delay(self.retry_delay, attempts), claimed.id))
+                else:
+                    self._conn.execute("UPDATE jobs SET status = ?, error = ? WHERE id = ?",
+                                       (DEAD, error, claimed.id))
+
+    def take_results(self, limit=100, lease=60):
+        """Готовые и окончательно упавшие задания, ещё не доставленные пользователю"""
+        now = time.time()
+        with self._transaction():
+            self._expire_leases(now)
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) AND delivered = 0 "
+                "AND (delivery_until IS NULL OR delivery_until <= ?) ORDER BY id LIMIT ?",
+                (DONE, DEAD, now, limit)).fetchall()
+            self._conn.executemany("UPDATE jobs SET delivery_until = ? WHERE id = ?",
+                                   [(now + lease, row[0]) for row in rows])
+        return [self._job(row) for row in rows]
+
+    def ack(self, job_id):
+        """Результат доставлен: выполненное задание удаляется, dead letter остаётся для разбора"""
+        with self._transaction():
+            self._conn.execute("DELETE FROM jobs WHERE id = ? AND status = ?", (job_id, DONE))
+            self._conn.execute("UPDATE jobs SET delivered = 1 WHERE id = ? AND status = ?", (job_id, DEAD))
+
+    def dead_letters(self, limit=100):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT ?",
+                                      (DEAD, limit)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def requeue(self, job_id):
+        """Возвращает задание из dead letter в очередь с нулевым счётчиком попыток"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = 0, error = NULL, delivered = 0, "
+                "delivery_until = NULL WHERE id = ? AND status = ?",
+                (PENDING, job_id, DEAD))
+        return cursor.rowcount > 0
+
+    def purge_dead(self):
+        with self._transaction():
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND delivered = 1", (DEAD,))]
+            self._conn.executemany("DELETE FROM job_files WHERE job_id = ?", [(i,) for i in ids])
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+        return len(ids)
+
+    def stats(self):
+        counts = {status: 0 for status in (PENDING, RUNNING, DONE, DEAD)}
+        with self._lock:
+            for status, count in self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+                counts[status] = count
+        return counts
+
+
+def make_job_queue(backend, path, max_attempts=3, retry_delay=5):
+    if backend == "memory":
+        return MemoryJobQueue(max_attempts, retry_delay)
+    if backend == "sqlite":
+        return SQLiteJobQueue(path, max_attempts, retry_delay)
+    raise ValueError(f"Неизвестный тип очереди заданий: {backend}")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Общая очередь процесса, создаётся при первом обращении"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = make_job_queue(JOB_QUEUE_BACKEND, JOB_QUEUE_PATH, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY)
+        return _queue
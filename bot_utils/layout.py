@@ -0,0 +1,153 @@
+import numpy as np
+from collections import namedtuple
+from bot_utils import crop
+
+# lines - массивы индексов рамок в порядке чтения, line_columns - номер колонки каждой строки,
+# columns - границы колонок по x, skew - наклон строк (dy/dx)
+Layout = namedtuple("Layout", ["lines", "line_columns", "columns", "skew"])
+
+MAX_SKEW = 0.2
+
+
+def estimate_skew(x_centers, y_centers, line_ids):
+    """Оценивает наклон строк по МНК внутри каждой предварительной строки.
+    Итог - медиана наклонов строк минимум из трёх слов, взвешенная по числу слов."""
+
+    count = np.bincount(line_ids).astype(np.float64)
+    sum_x = np.bincount(line_ids, x_centers)
+    sum_y = np.bincount(line_ids, y_centers)
+    sum_xx = np.bincount(line_ids, x_centers * x_centers)
+    sum_xy = np.bincount(line_ids, x_centers * y_centers)
+
+    denominator = count * sum_xx - sum_x * sum_x
+    usable = (count >= 3) & (denominator > 1e-6)
+    if not usable.any():
+        return 0.0
+
+    slopes = (count[usable] * sum_xy[usable] - sum_x[usable] * sum_y[usable]) / denominator[usable]
+    weights = count[usable]
+    order = np.argsort(slopes)
+    cumulative = np.cumsum(weights[order])
+    median = slopes[order][np.searchsorted(cumulative, cumulative[-1] / 2)]
+    return float(np.clip(median, -MAX_SKEW, MAX_SKEW))
+
+
+def detect_columns(pixel_boxes, min_gap):
+    """Ищет вертикальные просветы, которые не пересекает ни одно слово.
+    Широкие рамки (заголовки через всю страницу) не учитываются."""
+
+    left, right = pixel_boxes[:, 0], pixel_boxes[:, 2]
+    page_width = right.max() - left.min()
+    narrow = (right - left) < page_width * 0.5
+    if narrow.sum() < 2:
+        return [(float(left.min()), float(right.max()))]
+
+    order = np.argsort(left[narrow], kind="stable")
+    starts, ends = left[narrow][order], right[narrow][order]
+    # правый край объединения всех интервалов, начавшихся до текущего
+    reach = np.maximum.accumulate(ends)
+    gap_after = np.flatnonzero(starts[1:] - reach[:-1] >= min_gap)
+
+    # случайный просвет между парой слов - не колонка: с каждой стороны должна быть заметная часть слов
+    min_words = max(3, int(len(starts) * 0.1))
+    gap_after = gap_after[(gap_after + 1 >= min_words) & (len(starts) - gap_after - 1 >= min_words)]
+
+    bounds = [float(starts[0])]
+    for index in gap_after.tolist():
+        bounds.extend([float(reach[index]), float(starts[index + 1])])
+    bounds.append(float(reach[-1]))
+    return list(zip(bounds[0::2], bounds[1::2]))
+
+
+def cluster_lines(tops, bottoms, overlap_ratio=0.5):
+    """Группирует рамки в строки по перекрытию вертикальных интервалов.
+
+    Рамки обходятся сверху вниз, каждая присоединяется к открытой строке с наибольшим
+    перекрытием относительно меньшей из высот рамки и строки, поэтому порог свой для
+    каждой строки. Строка закрывается, когда рамки уходят ниже её нижней границы."""
+
+    count = len(tops)
+    line_ids = np.empty(count, dtype=np.int64)
+    top_sums, bottom_sums, sizes = [], [], []
+    open_lines = []
+
+    for index in np.argsort((tops + bottoms) / 2, kind="stable").tolist():
+        top, bottom = tops[index], bottoms[index]
+        height = bottom - top
+
+        best, best_score = -1, 0.0
+        still_open = []
+        for line in open_lines:
+            line_top = top_sums[line] / sizes[line]
+            line_bottom = bottom_sums[line] / sizes[line]
+            if line_bottom <= top:
+                continue
+            still_open.append(line)
+            overlap = min(bottom, line_bottom) - max(top, line_top)
+            score = overlap / max(min(height, line_bottom - line_top), 1e-6)
+            if score > best_score:
+                best, best_score = line, score
+        open_lines = still_open
+
+        if best < 0 or best_score < overlap_ratio:
+            best = len(sizes)
+            top_sums.append(0.0)
+            bottom_sums.append(0.0)
+            sizes.append(0)
+            open_lines.append(best)
+
+        line_ids[index] = best
+        top_sums[best] += top
+        bottom_sums[best] += bottom
+        sizes[best] += 1
+
+    return line_ids
+
+
+def analyze_layout(pixel_boxes, detect_columns_enabled=True, overlap_ratio=0.5):
+    """Разбирает страницу на колонки, строки и слова в порядке чтения"""
+
+    pixel_boxes = np.asarray(pixel_boxes, dtype=np.float64).reshape(-1, 4)
+    if not len(pixel_boxes):
+        return Layout([], [], [], 0.0)
+
+    x_centers = (pixel_boxes[:, 0] + pixel_boxes[:, 2]) / 2
+    y_centers = (pixel_boxes[:, 1] + pixel_boxes[:, 3]) / 2
+    heights = pixel_boxes[:, 3] - pixel_boxes[:, 1]
+
+    # наклон оцениваем по грубой разбивке, затем уточняем по выпрямленным строкам
+    rough_ids = np.empty(len(pixel_boxes), dtype=np.int64)
+    for line_id, line in enumerate(crop.group_lines_array(pixel_boxes)):
+        rough_ids[line] = line_id
+    skew = estimate_skew(x_centers, y_centers, rough_ids)
+    deskewed = y_centers - skew * x_centers
+    skew = float(np.clip(skew + estimate_skew(x_centers, deskewed, cluster_lines(
+        deskewed - heights / 2, deskewed + heights / 2, overlap_ratio)), -MAX_SKEW, MAX_SKEW))
+    deskewed = y_centers - skew * x_centers
+
+    if detect_columns_enabled:
+        columns = detect_columns(pixel_boxes, min_gap=float(np.median(heights)))
+    else:
+        columns = [(float(pixel_boxes[:, 0].min()), float(pixel_boxes[:, 2].max()))]
+    separators = np.array([(left_end + right_start) / 2
+                           for (_, left_end), (right_start, _) in zip(columns, columns[1:])])
+    column_ids = np.searchsorted(separators, x_centers) if len(separators) else np.zeros(len(x_centers), int)
+
+    lines, line_columns = [], []
+    for column in range(len(columns)):
+        members = np.flatnonzero(column_ids == column)
+        if not len(members):
+            continue
+        ids = cluster_lines(deskewed[members] - heights[members] / 2,
+                            deskewed[members] + heights[members] / 2, overlap_ratio)
+        line_y = np.bincount(ids, deskewed[members]) / np.bincount(ids)
+        rank = np.empty(len(line_y), dtype=np.int64)
+        rank[np.argsort(line_y, kind="stable")] = np.arange(len(line_y))
+
+        order = np.lexsort((x_centers[members], rank[ids]))
+        boundaries = np.flatnonzero(np.diff(rank[ids][order])) + 1
+        column_lines = np.split(members[order], boundaries)
+        lines.extend(column_lines)
+        line_columns.extend([column] * len(column_lines))
+
+    return Layout(lines, line_columns, columns, skew)
@@ -0,0 +1,106 @@
+import re
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton
+
+START_TEXT = (
+    "👋 Привет! Я бот, который умеет распознавать *русский рукописный текст* с изображений.\n\n"
+    "📸 Просто отправь мне фото, я извлеку текст, распознаю его и проверю орфографию, грамматику и стиль.\n\n"
+    "Для справки нажми *Помощь*."
+)
+
+HELP_TEXT = (
+    "🆘 *Помощь по боту*\n\n"
+    "Вот что я умею:\n"
+    "1️⃣ Распознаю *рукописный текст* с изображений\n"
+    "2️⃣ Проверяю *орфографию, грамматику и стиль написания*\n"
+    "3️⃣ Даю исправленный текст\n\n"
+    "📌 Советы:\n"
+    "— Делай чёткие фото\n"
+    "— Лучше загружай изображение-документ (без сжатия)\n"
+    "— Несколько страниц можно прислать альбомом, PDF или TIFF\n"
+    "📥 Просто отправь фото, и я начну работать!"
+)
+
+UNKNOWN_TEXT = "🤔 Прости, я не понимаю тебя...\nНажми *Помощь*, чтобы узнать, что я умею."
+NO_DATA_TEXT = "❌ Нет данных. Сначала отправьте изображение."
+BLOCKED_TEXT = "⛔️ Вы заблокированы за превышение лимита запросов."
+INJECTION_TEXT = "⚠️ Обнаружена недопустимая команда."
+NO_ERRORS_TEXT = "🎉 Ошибок не найдено!"
+PHOTO_DONE_TEXT = "✅ Изображение успешно обработано.\nЧто вы хотите сделать дальше?"
+PHOTO_FAILED_TEXT = "❌ Произошла ошибка при обработке изображения. Попробуйте ещё раз."
+DOCUMENT_DONE_TEXT = "✅ Документ успешно обработан.\nЧто вы хотите сделать дальше?"
+DOCUMENT_FAILED_TEXT = "❌ Ошибка при обработке изображения-документа."
+WRONG_DOCUMENT_TEXT = "⚠️ Пожалуйста, отправьте изображение (JPG, PNG), PDF или TIFF."
+ALBUM_DONE_TEXT = "✅ Все страницы обработаны.\nЧто вы хотите сделать дальше?"
+ALBUM_FAILED_TEXT = "❌ Ошибка при обработке страниц. Попробуйте отправить их ещё раз."
+QUEUED_TEXT = "📥 Задание принято в очередь. Пришлю результат, как только оно будет готово."
+
+# тексты ответа по типу задания: (готово, ошибка)
+REPLY_TEXTS = {
+    "photo": (PHOTO_DONE_TEXT, PHOTO_FAILED_TEXT),
+    "document": (DOCUMENT_DONE_TEXT, DOCUMENT_FAILED_TEXT),
+    "album": (ALBUM_DONE_TEXT, ALBUM_FAILED_TEXT),
+}
+
+GET_RAW_BUTTON = "Получить распознанный текст"
+GET_CORRECTED_BUTTON = "Получить исправленный текст"
+GET_ALL_BUTTON = "Получить все сразу"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# многостраничные документы распознаются через пакетный эндпоинт
+DOCUMENT_EXTENSIONS = IMAGE_EXTENSIONS + (".pdf", ".tif", ".tiff")
+
+
+def raw_text_message(raw_text):
+    return f"📝 *Распознанный текст:*\n```\n{raw_text}\n```"
+
+
+def corrected_text_message(corrected_text):
+    return f"✅ *Исправленный текст:*\n```\n{corrected_text}\n```"
+
+
+def errors_message(errors):
+    return f"🔍 *Обнаружены ошибки:*\n{errors}"
+
+
+def progress_message(lines):
+    """Текст сообщения с распознанными на данный момент строками"""
+    text = "📝 " + "\n".join(lines)
+    if len(text) > 4000:
+        text = "…" + text[-4000:]
+    return text
+
+
+def is_sql_injection(text):
+    """Проверка на SQL-инъекции"""
+    sql_keywords = [
+        'select', 'insert', 'update', 'delete', 'drop',
+        'truncate', 'union', '--', ';', '/*', '*/'
+    ]
+    pattern = re.compile('|'.join(re.escape(keyword) for keyword in sql_keywords), re.IGNORECASE)
+    return bool(pattern.search(text))
+
+
+def sanitize_input(text):
+    """Очистка входных данных"""
+    if not text:
+        return text
+    return re.sub(r'[;\'"\\/*]', '', text)
+
+
+def start_keyboard():
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    start_button = KeyboardButton("Старт")
+    help_button = KeyboardButton("Помощь")
+    markup.add(start_button, help_button)
+    return markup
+
+
+def text_action_keyboard():
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    get_text = KeyboardButton(GET_RAW_BUTTON)
+    get_corrected_text = KeyboardButton(GET_CORRECTED_BUTTON)
+    get_all = KeyboardButton(GET_ALL_BUTTON)
+    markup.add(get_text)
+    markup.add(get_corrected_text)
+    markup.add(get_all)
+    return markup
@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram
+
+# OTEL_TRACING=1 - дополнительно открывать span OpenTelemetry на каждый этап (нужен opentelemetry-api)
+tracing_enabled = os.getenv("OTEL_TRACING", "0") == "1"
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram("ocr_stage_seconds", "Длительность этапов пайплайна", ["stage"], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram("ocr_request_seconds", "Длительность запросов к сервису", ["endpoint"],
+                            buckets=STAGE_BUCKETS)
+CROPS_PER_PAGE = Histogram("ocr_crops_per_page", "Количество слов на странице",
+                           buckets=(0, 1, 5, 10, 25, 50, 100, 200, 400, 800))
+BATCH_SIZE = Histogram("ocr_batch_size", "Размер батчей TrOCR", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+CACHE_LOOKUPS = Counter("ocr_cache_lookups_total", "Обращения к кэшу результатов", ["result"])
+EXTERNAL_ERRORS = Counter("ocr_external_errors_total", "Ошибки внешних сервисов", ["service"])
+BOT_UPDATE_SECONDS = Histogram("bot_update_seconds", "Время обработки апдейта ботом от получения до ответа",
+                               ["kind"], buckets=STAGE_BUCKETS)
+
+_timings = ContextVar("timings", default=None)
+_tracer = None
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logging.warning("OTEL_TRACING=1, но opentelemetry-api не установлен, трассировка отключена")
+            return None
+        _tracer = trace.get_tracer("handwriting-ocr")
+    return _tracer
+
+
+@contextmanager
+def collect_timings():
+    """Собирает замеры этапов, выполненных в текущем контексте, в словарь {этап: секунды}"""
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def current_timings():
+    return _timings.get()
+
+
+@contextmanager
+def stage(name):
+    """Замер этапа: гистограмма Prometheus, разбивка текущего запроса и span OpenTelemetry"""
+    tracer = get_tracer() if tracing_enabled else None
+    span = tracer.start_as_current_span(name) if tracer is not None else nullcontext()
+    start = time.perf_counter()
+    try:
+        with span:
+            yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def record(name, seconds):
+    """Учитывает уже измеренную длительность этапа"""
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def add_timings(timings):
+    """Добавляет к разбивке текущего запроса этапы, замеренные в другом потоке.
+    Гистограммы по ним уже учтены там, где шёл замер"""
+    current = _timings.get()
+    if current is not None:
+        for name, seconds in timings.items():
+            current[name] = current.get(name, 0.0) + seconds
+
+
+def timing_header(timings):
+    """Разбивка в формате Server-Timing: detect;dur=12.3, recognize;dur=250.0"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+@contextmanager
+def update_timer(kind):
+    """Замер обработки апдейта ботом: гистограмма и строка в логе"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        BOT_UPDATE_SECONDS.labels(kind).observe(elapsed)
+        logging.info(f"Апдейт {kind} обработан за {elapsed:.2f} с")
+
+
+def timed_handler(kind):
+    """Декоратор обработчика бота (синхронного или асинхронного), замеряющий update_timer"""
+    def decorator(handler):
+        if asyncio.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def wrapper(*args, **kwargs):
+                with update_timer(kind):
+                    return await handler(*args, **kwargs)
+        else:
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                with update_timer(kind):
+                    return handler(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_bot_metrics_server():
+    """Отдаёт метрики бота на BOT_METRICS_PORT, если порт задан"""
+    port = os.getenv("BOT_METRICS_PORT")
+    if port:
+        from prometheus_client import start_http_server
+        start_http_server(int(port))
+        logging.info(f"Метрики бота доступны на порту {port}")
@@ -0,0 +1,127 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from bot_utils.ttl_cache import TTLCache
+from bot_utils.state import store, BLACKLIST_TTL
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "rate_limit.sqlite3")
+
+# (ёмкость корзины, пополнение в токенах в секунду)
+TEXT_LIMIT = (float(os.getenv("RATE_LIMIT_TEXT_BURST", "10")), float(os.getenv("RATE_LIMIT_TEXT_RATE", "1")))
+IMAGE_LIMIT = (float(os.getenv("RATE_LIMIT_IMAGE_BURST", "3")), float(os.getenv("RATE_LIMIT_IMAGE_RATE", "0.1")))
+# сколько отказов подряд допускается, прежде чем пользователь уйдёт на паузу
+STRIKE_LIMIT = (float(os.getenv("RATE_LIMIT_STRIKES", "10")), float(os.getenv("RATE_LIMIT_STRIKE_RATE", "0.1")))
+
+
+def refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryBucketBackend:
+    """Корзины токенов в памяти процесса.
+    Неактивные корзины полностью пополнены, поэтому их можно просто вытеснять."""
+
+    def __init__(self, max_keys=100000, idle_ttl=3600):
+        self._buckets = TTLCache(max_keys, idle_ttl)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        """Пытается взять один токен. Возвращает (разрешено, через сколько секунд появится токен)"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = capacity if bucket is None else refill(bucket[0], bucket[1], capacity, rate, now)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets.set(key, (tokens, now))
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class SQLiteBucketBackend:
+    """Корзины токенов в общем файле SQLite: несколько процессов бота на одном хосте
+    видят одни и те же лимиты. Обновление корзины атомарно за счёт BEGIN IMMEDIATE."""
+
+    def __init__(self, path, idle_ttl=3600):
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._takes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def take(self, key, capacity, rate, now):
+        key = ":".join(map(str, key))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = capacity if row is None else refill(row[0], row[1], capacity, rate, now)
+
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self._conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens, now))
+
+                self._takes += 1
+                if self._takes % 1000 == 0:
+                    self._conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_ttl,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class RateLimiter:
+    """Ограничение частоты запросов корзинами токенов с постоянным временем проверки.
+
+    У каждого вида запросов своя корзина: дешёвые текстовые команды
+    не расходуют лимит на распознавание изображений. Каждый отказ тратит
+    токен из корзины «штрафов»; когда она пуста, пользователь временно блокируется."""
+
+    def __init__(self, backend, limits, strikes=STRIKE_LIMIT, cooldown=BLACKLIST_TTL, store=store):
+        self.backend = backend
+        self.limits = limits
+        self.strikes = strikes
+        self.cooldown = cooldown
+        self.store = store
+
+    def allow(self, user_id, kind="text"):
+        now = time.time()
+        capacity, rate = self.limits[kind]
+        allowed, retry_after = self.backend.take((kind, user_id), capacity, rate, now)
+        if allowed:
+            return True
+
+        strike_capacity, strike_rate = self.strikes
+        has_strikes, _ = self.backend.take(("strike", user_id), strike_capacity, strike_rate, now)
+        if not has_strikes:
+            self.store.block(user_id, self.cooldown)
+            logging.warning(f"User {user_id} временно заблокирован на {self.cooldown:.0f} с за превышение лимита запросов")
+        else:
+            logging.info(f"User {user_id} превысил лимит '{kind}', повтор через {retry_after:.1f} с")
+        return False
+
+
+def make_backend(backend, path):
+    if backend == "memory":
+        return MemoryBucketBackend()
+    if backend == "sqlite":
+        return SQLiteBucketBackend(path)
+    raise ValueError(f"Неизвестный бэкенд лимитов: {backend}")
+
+
+limiter = RateLimiter(make_backend(RATE_LIMIT_BACKEND, RATE_LIMIT_PATH),
+                      {"text": TEXT_LIMIT, "image": IMAGE_LIMIT})
+
+
+def check_rate_limit(user_id, kind="text"):
+    """Проверка ограничения запросов"""
+    return limiter.allow(user_id, kind)
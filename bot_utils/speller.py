@@ -0,0 +1,100 @@
+import os
+import asyncio
+import logging
+import aiohttp
+
+YANDEX_SPELLER_URL = os.getenv("YANDEX_SPELLER_URL", "https://speller.yandex.net/services/spellservice.json")
+
+# ограничение Яндекс-спеллера на размер текста в одном запросе
+MAX_REQUEST_CHARS = 10000
+
+
+class SpellerError(Exception):
+    pass
+
+
+class YandexSpeller:
+    """Асинхронный клиент Яндекс-спеллера с постоянным пулом соединений,
+    таймаутами и повторными попытками с экспоненциальной задержкой."""
+
+    def __init__(self, base_url=YANDEX_SPELLER_URL, lang="ru", timeout=5, retries=3,
+                 backoff=0.3, max_connections=16):
+        self.base_url = base_url.rstrip("/")
+        self.lang = lang
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def _post(self, method, data):
+        url = f"{self.base_url}/{method}"
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._get_session().post(url, data=data) as response:
+                    if response.status == 429 or response.status >= 500:
+                        raise SpellerError(f"HTTP {response.status}")
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, SpellerError) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logging.warning(f"Яндекс-спеллер: ошибка {e!r}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+
+    async def check_text(self, text):
+        """Возвращает список ошибок для одного текста"""
+        return await self._post("checkText", {"text": text, "lang": self.lang})
+
+    async def check_texts(self, texts):
+        """Проверяет несколько текстов через checkTexts.
+        Тексты группируются так, чтобы запрос не превышал лимит размера,
+        группы отправляются параллельно."""
+        groups = []
+        current, size = [], 0
+        for text in texts:
+            if current and size + len(text) > MAX_REQUEST_CHARS:
+                groups.append(current)
+                current, size = [], 0
+            current.append(text)
+            size += len(text)
+        if current:
+            groups.append(current)
+
+        async def check_group(group):
+            data = [("text", text) for text in group] + [("lang", self.lang)]
+            return await self._post("checkTexts", data)
+
+        results = await asyncio.gather(*(check_group(group) for group in groups))
+        return [item for group in results for item in group]
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_default_speller = None
+
+
+def get_speller():
+    global _default_speller
+    if _default_speller is None:
+        _default_speller = YandexSpeller()
+    return _default_speller
+
+
+def close_speller():
+    """Закрывает пул соединений общего клиента при остановке сервиса"""
+    global _default_speller
+    if _default_speller is not None:
+        from bot_utils.async_runner import run_sync
+        run_sync(_default_speller.close())
+        _default_speller = None
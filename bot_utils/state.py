@@ -0,0 +1,111 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+from bot_utils.ttl_cache import TTLCache
+
+UserResult = namedtuple("UserResult", ["raw_text", "corrected_text", "errors"])
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_PATH = os.getenv("STATE_PATH", "bot_state.sqlite3")
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS", "10000"))
+RESULT_TTL = float(os.getenv("STATE_RESULT_TTL", "86400"))
+BLACKLIST_TTL = float(os.getenv("BLACKLIST_TTL", "300"))
+
+
+class MemoryStateStore:
+    """Состояние пользователей в памяти: последние результаты и блокировки.
+    Количество записей ограничено, старые вытесняются по LRU и TTL."""
+
+    def __init__(self, max_users=10000, result_ttl=86400):
+        self._results = TTLCache(max_users, result_ttl)
+        self._blocked = TTLCache(max_users)
+
+    def get_result(self, chat_id):
+        return self._results.get(chat_id)
+
+    def set_result(self, chat_id, raw_text, corrected_text, errors):
+        self._results.set(chat_id, UserResult(raw_text, corrected_text, errors))
+
+    def block(self, user_id, duration):
+        self._blocked.set(user_id, True, ttl=duration)
+
+    def is_blocked(self, user_id):
+        return self._blocked.get(user_id, False)
+
+
+class SQLiteStateStore:
+    """Состояние пользователей в SQLite, сохраняется между перезапусками бота"""
+
+    def __init__(self, path, max_users=10000, result_ttl=86400):
+        self.max_users = max_users
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "chat_id INTEGER PRIMARY KEY, raw_text TEXT, corrected_text TEXT, errors TEXT, "
+            "updated REAL NOT NULL, expires REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_updated ON results (updated)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blocked (user_id INTEGER PRIMARY KEY, until REAL NOT NULL)")
+        self._conn.commit()
+
+    def get_result(self, chat_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT raw_text, corrected_text, errors FROM results "
+                "WHERE chat_id = ? AND (expires IS NULL OR expires > ?)",
+                (chat_id, time.time())).fetchone()
+        return UserResult(*row) if row else None
+
+    def set_result(self, chat_id, raw_text, corrected_text, errors):
+        now = time.time()
+        expires = now + self.result_ttl if self.result_ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, raw_text, corrected_text, errors, now, expires))
+            self._writes += 1
+            # чистка раз в сотню записей, чтобы не платить за неё на каждом сообщении
+            if self._writes % 100 == 0:
+                self._cleanup(now)
+            self._conn.commit()
+
+    def _cleanup(self, now):
+        self._conn.execute("DELETE FROM results WHERE expires IS NOT NULL AND expires <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM results WHERE chat_id IN ("
+            "SELECT chat_id FROM results ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+            (self.max_users,))
+        self._conn.execute("DELETE FROM blocked WHERE until <= ?", (now,))
+
+    def block(self, user_id, duration):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO blocked VALUES (?, ?)", (user_id, time.time() + duration))
+            self._conn.commit()
+
+    def is_blocked(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM blocked WHERE user_id = ? AND until > ?", (user_id, time.time())).fetchone()
+        return row is not None
+
+
+def make_state_store(backend, path, max_users, result_ttl):
+    if backend == "memory":
+        return MemoryStateStore(max_users, result_ttl)
+    if backend == "sqlite":
+        return SQLiteStateStore(path, max_users, result_ttl)
+    raise ValueError(f"Неизвестный тип хранилища состояния: {backend}")
+
+
+store = make_state_store(STATE_BACKEND, STATE_PATH, STATE_MAX_USERS, RESULT_TTL)
+
+def is_blacklisted(user_id):
+    """Проверка на наличие в черном списке"""
+    return store.is_blocked(user_id)
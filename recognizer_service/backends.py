@@ -0,0 +1,113 @@
+import os
+import logging
+import torch
+from transformers import VisionEncoderDecoderModel
+from recognizer_service.decoding import greedy_decode
+
+BACKENDS = ("eager", "int8", "compile", "onnx")
+DECODERS = ("generate", "greedy")
+
+
+class EagerBackend:
+    """fp32 VisionEncoderDecoderModel в обычном режиме PyTorch.
+    decoder: generate - стандартный model.generate, greedy - собственный цикл
+    из decoding.greedy_decode с ранним выходом завершённых строк"""
+
+    name = "eager"
+
+    def __init__(self, model_dir, device, decoder="generate", repeat_stop=0, load_options=None):
+        if decoder not in DECODERS:
+            raise ValueError(f"Неизвестный декодер TrOCR: {decoder}")
+        self.device = device
+        self.decoder = decoder
+        self.repeat_stop = repeat_stop
+        self.model = VisionEncoderDecoderModel.from_pretrained(model_dir, **(load_options or {})).to(device)
+        self.model.eval()
+
+    def generate(self, pixel_values, max_length=256, row_max_lengths=None):
+        """Жадная генерация, возвращает идентификаторы токенов.
+        row_max_lengths - свой предел длины для каждого кропа (только для decoder=greedy)"""
+        if self.decoder == "greedy":
+            return greedy_decode(self.model, pixel_values.to(self.device), max_length,
+                                 row_max_lengths, self.repeat_stop)
+        with torch.inference_mode():
+            return self.model.generate(
+                pixel_values.to(self.device),
+                max_length=max_length,
+                num_beams=1,
+                do_sample=False
+            )
+
+
+class QuantizedBackend(EagerBackend):
+    """Динамическое int8-квантование всех линейных слоёв энкодера и декодера.
+    Веса хранятся в int8, активации квантуются на лету; работает только на CPU"""
+
+    name = "int8"
+
+    def __init__(self, model_dir, device, decoder="generate", repeat_stop=0, load_options=None):
+        if device != "cpu":
+            raise ValueError("Бэкенд int8 поддерживает только CPU")
+        super().__init__(model_dir, device, decoder, repeat_stop, load_options)
+        self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class CompiledBackend(EagerBackend):
+    """Энкодер и декодер, скомпилированные torch.compile. Размер батча и длина
+    последовательности меняются от вызова к вызову, поэтому формы динамические"""
+
+    name = "compile"
+
+    def __init__(self, model_dir, device, mode=None, decoder="generate", repeat_stop=0, load_options=None):
+        super().__init__(model_dir, device, decoder, repeat_stop, load_options)
+        # компилируются методы forward, а не модули целиком: generate смотрит на сигнатуру энкодера
+        for module in (self.model.encoder, self.model.decoder):
+            module.forward = torch.compile(module.forward, dynamic=True, mode=mode)
+
+
+class OnnxBackend:
+    """Энкодер и декодер с KV-кэшем, экспортированные в ONNX и исполняемые ONNX Runtime.
+    Экспорт выполняется при первом запуске и сохраняется в onnx_dir"""
+
+    name = "onnx"
+
+    def __init__(self, model_dir, device, onnx_dir=None):
+        try:
+            from optimum.onnxruntime import ORTModelForVision2Seq
+        except ImportError as e:
+            raise RuntimeError("Для бэкенда onnx установите optimum[onnxruntime]") from e
+
+        provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+        if onnx_dir and os.path.exists(os.path.join(onnx_dir, "config.json")):
+            self.model = ORTModelForVision2Seq.from_pretrained(onnx_dir, use_cache=True, provider=provider)
+        else:
+            logging.info(f"Экспорт TrOCR в ONNX из {model_dir}")
+            self.model = ORTModelForVision2Seq.from_pretrained(model_dir, export=True, use_cache=True,
+                                                               provider=provider)
+            if onnx_dir:
+                self.model.save_pretrained(onnx_dir)
+        self.device = self.model.device
+
+    def generate(self, pixel_values, max_length=256, row_max_lengths=None):
+        return self.model.generate(
+            pixel_values.to(self.device),
+            max_length=max_length,
+            num_beams=1,
+            do_sample=False
+        )
+
+
+def load_backend(name, model_dir, device, onnx_dir=None, compile_mode=None, decoder="generate", repeat_stop=0,
+                 load_options=None):
+    """Создаёт бэкенд TrOCR по названию: eager, int8, compile или onnx.
+    decoder, repeat_stop и load_options (аргументы from_pretrained) действуют на бэкенды
+    PyTorch, onnx всегда использует свой generate"""
+    if name == "eager":
+        return EagerBackend(model_dir, device, decoder, repeat_stop, load_options)
+    if name == "int8":
+        return QuantizedBackend(model_dir, device, decoder, repeat_stop, load_options)
+    if name == "compile":
+        return CompiledBackend(model_dir, device, compile_mode, decoder, repeat_stop, load_options)
+    if name == "onnx":
+        return OnnxBackend(model_dir, device, onnx_dir)
+    raise ValueError(f"Неизвестный бэкенд TrOCR: {name}")
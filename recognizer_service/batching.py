@@ -0,0 +1,135 @@
+import math
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, CancelledError
+from bot_utils import metrics
+
+
+def plan_micro_batches(aspects, micro_batch_size):
+    """Делит батч на микробатчи из кропов с близким соотношением сторон.
+    Возвращает списки индексов; внутри микробатча длина генерации определяется самым
+    широким кропом, поэтому короткие слова не ждут длинных"""
+    order = sorted(range(len(aspects)), key=aspects.__getitem__)
+    size = max(1, micro_batch_size)
+    return [order[start:start + size] for start in range(0, len(order), size)]
+
+
+def max_length_for(aspect, tokens_per_aspect=3.0, ceiling=256, floor=16):
+    """Оценка max_length генерации по соотношению сторон кропа (ширина / высота).
+    Опирается на допущение, что токенов не больше tokens_per_aspect на единицу ширины;
+    для BPE-токенизатора TrOCR на кириллице оно не проверено, поэтому в сервисе
+    оценка включается только явно (TROCR_TOKENS_PER_ASPECT)"""
+    return int(min(ceiling, max(floor, math.ceil(aspect * tokens_per_aspect) + 4)))
+
+
+def batch_timings(futures):
+    """Суммарные замеры этапов батчей, в которые попали кропы futures; общий батч учитывается один раз"""
+    batches = {id(future.timings): future.timings for future in futures if getattr(future, "timings", None)}
+    total = {}
+    for timings in batches.values():
+        for name, seconds in timings.items():
+            total[name] = total.get(name, 0.0) + seconds
+    return total
+
+
+class BatchingEngine:
+    """Собирает кропы слов из разных запросов в общие батчи для TrOCR.
+
+    Батч отправляется в модель, как только набралось max_batch_size кропов
+    или с момента прихода первого кропа прошло max_wait_ms миллисекунд.
+    Результаты раскладываются обратно по запросам в исходном порядке.
+    Замеры этапов батча кладутся в атрибут timings каждого Future (см. batch_timings)."""
+
+    def __init__(self, recognize_fn, max_batch_size=32, max_wait_ms=20):
+        self.recognize_fn = recognize_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._last_batch_size = 0
+
+        self._thread = threading.Thread(target=self._loop, name="trocr-batching", daemon=True)
+        self._thread.start()
+
+    def submit_nowait(self, images, cancel_event=None):
+        """Ставит кропы в очередь и сразу возвращает Future для каждого из них.
+        Если cancel_event установлен, ещё не распознанные кропы пропускаются."""
+        futures = []
+        for image in images:
+            future = Future()
+            self._queue.put((image, future, cancel_event))
+            futures.append(future)
+
+        return futures
+
+    def submit(self, images, cancel_event=None):
+        """Ставит кропы в очередь и блокируется до получения текстов"""
+        return [future.result() for future in self.submit_nowait(images, cancel_event)]
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = []
+            for image, future, cancel_event in self._collect_batch():
+                if cancel_event is not None and cancel_event.is_set():
+                    future.set_exception(CancelledError())
+                else:
+                    batch.append((image, future))
+            if not batch:
+                continue
+
+            images = [image for image, _ in batch]
+            metrics.BATCH_SIZE.observe(len(images))
+            try:
+                # поток батчера не знает о запросах, замеры раздаются им через Future
+                with metrics.collect_timings() as timings:
+                    texts = self.recognize_fn(images)
+            except Exception as e:
+                logging.error(f"[ERROR] Ошибка распознавания батча: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), text in zip(batch, texts):
+                future.timings = timings
+                future.set_result(text)
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._last_batch_size = len(batch)
+
+    def stats(self):
+        """Метрики очереди: глубина, количество батчей и средняя заполненность"""
+        with self._lock:
+            batches, items, last = self._batches, self._items, self._last_batch_size
+
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": batches,
+            "items": items,
+            "last_batch_size": last,
+            "avg_batch_size": items / batches if batches else 0,
+            "avg_batch_fill": items / (batches * self.max_batch_size) if batches else 0,
+        }
@@ -0,0 +1,133 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from bot_utils.ttl_cache import TTLCache
+
+# поля результата распознавания изображения, в порядке кортежа process_image_pipeline
+RESULT_FIELDS = ("recognized_text", "corrected_text", "errors", "corrections")
+
+
+def result_dict(result):
+    """Кортеж результата в виде словаря. Записи кэша, сохранённые до появления
+    поля corrections, отдаются без него"""
+    return dict(zip(RESULT_FIELDS, result))
+
+
+def image_key(data):
+    """Ключ по точному содержимому файла"""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def dhash(image, hash_size=8):
+    """dHash: устойчив к пережатию Telegram, одинаковые фото дают одинаковый хэш"""
+    pixels = image.convert("L").resize((hash_size + 1, hash_size)).tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def perceptual_key(image, fingerprint_size=32):
+    """Ключ для поиска пережатой копии изображения и отпечаток для проверки совпадения.
+
+    Ключ - размер изображения и грубый 64-битный dHash, по нему находится кандидат.
+    У похожих по раскладке рукописных страниц грубый хэш часто совпадает, поэтому
+    кандидат принимается, только если подробный отпечаток (dHash fingerprint_size²)
+    отличается не больше чем на допустимое число бит, см. fingerprint_distance."""
+    width, height = image.size
+    fingerprint = dhash(image, fingerprint_size)
+    return (f"dhash:{width}x{height}:{dhash(image):016x}",
+            f"{fingerprint:0{fingerprint_size * fingerprint_size // 4}x}")
+
+
+def fingerprint_distance(a, b):
+    """Расстояние Хэмминга между отпечатками perceptual_key; разного размера - бесконечность"""
+    if len(a) != len(b):
+        return float("inf")
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class MemoryResultCache:
+    """Кэш результатов распознавания в памяти процесса"""
+
+    def __init__(self, max_items=1024, ttl=None):
+        self._cache = TTLCache(max_items, ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def stats(self):
+        return {"backend": "memory", "size": len(self._cache),
+                "hits": self._cache.hits, "misses": self._cache.misses}
+
+
+class SQLiteResultCache:
+    """Кэш результатов в SQLite, переживает перезапуск сервиса.
+    При превышении max_items вытесняются давно не читавшиеся записи."""
+
+    def __init__(self, path, max_items=10000, ttl=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return tuple(json.loads(row[0]))
+
+    def set(self, key, value):
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires, now))
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_items,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"backend": "sqlite", "size": size, "hits": self.hits, "misses": self.misses}
+
+
+def make_result_cache(backend, max_items, ttl, path):
+    if backend == "memory":
+        return MemoryResultCache(max_items, ttl)
+    if backend == "sqlite":
+        return SQLiteResultCache(path, max_items, ttl)
+    if backend == "none":
+        return None
+    raise ValueError(f"Неизвестный тип кэша: {backend}")
@@ -0,0 +1,82 @@
+import os
+
+# пути считаются от корня проекта, а не от текущей папки, поэтому сервис можно
+# запускать из любого каталога; каждый путь можно переопределить переменной окружения
+root_dir = os.getenv("RECOGNIZER_ROOT", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+parent_root_dir = os.path.dirname(root_dir)
+models_dir = os.getenv("MODELS_DIR", os.path.join(root_dir, "models"))
+yolo_dir = os.getenv("YOLO_DIR", os.path.join(parent_root_dir, "yolo_v5", "yolov5"))
+yolo_weights = os.getenv("YOLO_WEIGHTS", os.path.join(models_dir, "yolov5", "best.pt"))
+model_dir = os.getenv("TROCR_MODEL_DIR", os.path.join(models_dir, "trocr", "v7", "model"))
+processor_dir = os.getenv("TROCR_PROCESSOR_DIR", os.path.join(models_dir, "trocr", "v7", "processor"))
+
+# загрузка весов: safetensors читаются через mmap, страницы делятся между процессами-воркерами;
+# auto - safetensors, если они есть в папке модели, 1 - только safetensors, 0 - только .bin
+use_safetensors = {"auto": None, "1": True, "0": False}[os.getenv("TROCR_SAFETENSORS", "auto")]
+low_cpu_mem_usage = os.getenv("TROCR_LOW_CPU_MEM", "1") == "1"
+# прогревочный прогон детектора и TrOCR при старте
+warmup = os.getenv("RECOGNIZER_WARMUP", "1") == "1"
+
+# бэкенд TrOCR: eager - обычный PyTorch, int8 - динамическое квантование (CPU),
+# compile - torch.compile, onnx - ONNX Runtime через optimum (экспорт сохраняется в onnx_dir)
+trocr_backend = os.getenv("TROCR_BACKEND", "eager")
+onnx_dir = os.getenv("TROCR_ONNX_DIR", os.path.join(models_dir, "trocr", "v7", "onnx"))
+compile_mode = os.getenv("TROCR_COMPILE_MODE") or None
+# декодирование: generate - model.generate, greedy - свой жадный цикл, из которого
+# завершённые строки выходят сразу; repeat_stop - остановка строки после N одинаковых токенов подряд
+trocr_decoder = os.getenv("TROCR_DECODER", "generate")
+repeat_stop = int(os.getenv("TROCR_REPEAT_STOP", "6"))
+
+# inprocess - модель YOLO загружается один раз и живёт в памяти сервиса,
+# subprocess - старый режим с запуском detect.py на каждый запрос
+yolo_mode = os.getenv("YOLO_MODE", "inprocess")
+yolo_conf = float(os.getenv("YOLO_CONF", "0.69"))
+
+# динамический батчинг кропов между запросами
+batch_max_size = int(os.getenv("TROCR_BATCH_SIZE", "32"))
+batch_max_wait_ms = float(os.getenv("TROCR_BATCH_WAIT_MS", "20"))
+
+# внутри батча кропы сортируются по соотношению сторон и идут в модель микробатчами:
+# размер микробатча ограничивает пиковую память, max_length считается по самому широкому кропу
+micro_batch_size = int(os.getenv("TROCR_MICRO_BATCH_SIZE", "8"))
+max_length = int(os.getenv("TROCR_MAX_LENGTH", "256"))
+# оценка max_length по ширине кропа (см. batching.max_length_for); 0 - всегда max_length
+tokens_per_aspect = float(os.getenv("TROCR_TOKENS_PER_ASPECT", "0"))
+# фильтр уменьшения кропов до 384x384 и предварительное быстрое уменьшение (0 - отключено)
+resample = os.getenv("TROCR_RESAMPLE", "lanczos")
+reducing_gap = float(os.getenv("TROCR_REDUCING_GAP", "3")) or None
+
+# пул инференса: thread для GPU, process для CPU-хостов
+worker_kind = os.getenv("INFERENCE_WORKER_KIND", "thread")
+worker_count = int(os.getenv("INFERENCE_WORKERS", "2"))
+worker_queue_size = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+
+# кэш результатов: memory, sqlite или none
+cache_backend = os.getenv("RESULT_CACHE", "memory")
+cache_max_items = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+cache_ttl = float(os.getenv("RESULT_CACHE_TTL", "86400")) or None
+cache_path = os.getenv("RESULT_CACHE_PATH", os.path.join(root_dir, "result_cache.sqlite3"))
+# поиск пережатых копий по перцептивному хэшу: выключен по умолчанию, т.к. кэш общий для всех
+# пользователей; совпадение принимается при различии отпечатков не больше чем в distance бит из 1024
+cache_perceptual = os.getenv("RESULT_CACHE_PERCEPTUAL", "0") == "1"
+cache_perceptual_distance = int(os.getenv("RESULT_CACHE_PERCEPTUAL_DISTANCE", "10"))
+
+# удаление дублирующихся рамок: порог перекрытия (0 - отключено) и способ его подсчёта (iou или min)
+# YOLOv5 уже делает NMS, поэтому по умолчанию выключено
+dedupe_threshold = float(os.getenv("BOX_DEDUPE_THRESHOLD", "0"))
+dedupe_mode = os.getenv("BOX_DEDUPE_MODE", "iou")
+
+# группировка рамок в строки: layout - с учётом наклона и колонок, simple - прежний порог по центрам
+layout_engine = os.getenv("LAYOUT_ENGINE", "layout")
+layout_columns = os.getenv("LAYOUT_COLUMNS", "1") == "1"
+
+# пакетная и многостраничная обработка: лимиты на файлы и страницы, разрешение рендера PDF
+# и сколько страниц одновременно находится между детекцией и распознаванием
+batch_max_files = int(os.getenv("BATCH_MAX_FILES", "20"))
+max_pages = int(os.getenv("BATCH_MAX_PAGES", "50"))
+pdf_dpi = int(os.getenv("PDF_DPI", "200"))
+pages_in_flight = int(os.getenv("PAGES_IN_FLIGHT", "2"))
+
+# изображения, у которых длинная сторона больше IMAGE_MAX_SIDE хотя бы вдвое, декодируются
+# уменьшенными в целое число раз, но не меньше IMAGE_MAX_SIDE (0 - не уменьшать)
+image_max_side = int(os.getenv("IMAGE_MAX_SIDE", "4096"))
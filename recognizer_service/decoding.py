@@ -0,0 +1,86 @@
+import torch
+
+
+def select_rows(past_key_values, index):
+    """Оставляет в KV-кэше только строки батча из index"""
+    if hasattr(past_key_values, "reorder_cache"):
+        past_key_values.reorder_cache(index)
+        return past_key_values
+    return tuple(tuple(state.index_select(0, index) for state in layer) for layer in past_key_values)
+
+
+def encode(model, pixel_values):
+    """Прогоняет энкодер один раз и приводит выход к размерности декодера"""
+    encoder_hidden_states = model.encoder(pixel_values=pixel_values).last_hidden_state
+    # так же, как в VisionEncoderDecoderModel.forward: проекция нужна, если размерности различаются
+    if (model.encoder.config.hidden_size != model.decoder.config.hidden_size
+            and model.decoder.config.cross_attention_hidden_size is None):
+        encoder_hidden_states = model.enc_to_dec_proj(encoder_hidden_states)
+    return encoder_hidden_states
+
+
+def is_repeating(tokens, step, repeat_stop):
+    """Строки, в которых последние repeat_stop токенов одинаковые - модель зациклилась"""
+    if not repeat_stop or step + 1 < repeat_stop:
+        return torch.zeros(tokens.shape[0], dtype=torch.bool, device=tokens.device)
+    window = tokens[:, step + 1 - repeat_stop:step + 1]
+    return (window == window[:, :1]).all(dim=1)
+
+
+def greedy_decode(model, pixel_values, max_length=256, row_max_lengths=None, repeat_stop=0):
+    """Жадное декодирование VisionEncoderDecoderModel.
+
+    Энкодер выполняется один раз, кросс-внимание берётся из KV-кэша декодера.
+    Строки, выдавшие EOS, дошедшие до своего row_max_lengths или зациклившиеся на одном
+    токене repeat_stop раз подряд, убираются из активного батча вместе с их кэшем,
+    поэтому короткие слова не занимают место до конца самого длинного.
+    Возвращает тензор идентификаторов, дополненный pad_token_id."""
+
+    config = model.config
+    eos_token_id = config.eos_token_id if config.eos_token_id is not None else config.decoder.eos_token_id
+    pad_token_id = config.pad_token_id if config.pad_token_id is not None else eos_token_id
+    device = pixel_values.device
+    batch_size = pixel_values.shape[0]
+
+    with torch.inference_mode():
+        encoder_hidden_states = encode(model, pixel_values)
+
+        tokens = torch.full((batch_size, max_length), pad_token_id, dtype=torch.long, device=device)
+        tokens[:, 0] = config.decoder_start_token_id
+        limits = torch.full((batch_size,), max_length, dtype=torch.long, device=device)
+        if row_max_lengths is not None:
+            limits = torch.as_tensor(row_max_lengths, dtype=torch.long, device=device).clamp(2, max_length)
+
+        active = torch.arange(batch_size, device=device)
+        input_ids = tokens[:, :1]
+        past_key_values = None
+        last_step = 0
+
+        for step in range(1, max_length):
+            outputs = model.decoder(
+                input_ids=input_ids,
+                encoder_hidden_states=encoder_hidden_states,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True,
+            )
+            next_tokens = outputs.logits[:, -1].argmax(dim=-1)
+            tokens[active, step] = next_tokens
+            last_step = step
+
+            finished = (next_tokens == eos_token_id) | (step + 1 >= limits[active])
+            finished |= is_repeating(tokens[active], step, repeat_stop)
+            if finished.all():
+                break
+
+            past_key_values = outputs.past_key_values
+            if finished.any():
+                keep = (~finished).nonzero(as_tuple=True)[0]
+                active = active[keep]
+                next_tokens = next_tokens[keep]
+                encoder_hidden_states = encoder_hidden_states[keep]
+                past_key_values = select_rows(past_key_values, keep)
+
+            input_ids = next_tokens[:, None]
+
+    return tokens[:, :last_step + 1]
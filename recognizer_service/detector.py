@@ -0,0 +1,92 @@
+import sys, os
+import tempfile
+import subprocess
+import logging
+import numpy as np
+from bot_utils import crop
+
+
+def run_yolo_subprocess(image_path, output_dir, yolo_weights, yolo_dir, conf=0.69):
+    python_executable = sys.executable
+
+    command = [
+        python_executable, "detect.py",
+        "--weights", yolo_weights,
+        "--source", image_path,
+        "--conf", str(conf),
+        "--save-txt",
+        "--save-conf",
+        "--project", output_dir,
+        "--name", "result",
+        "--exist-ok"
+    ]
+    try:
+        result = subprocess.run(
+            command,
+            cwd=yolo_dir,
+            check=True,
+            capture_output=True,
+            text=True
+        )
+        logging.info("[YOLO STDOUT]: %s", result.stdout)
+        logging.debug("[YOLO STDERR]: %s", result.stderr)
+    except subprocess.CalledProcessError as e:
+        logging.error("[ERROR] YOLOv5 subprocess failed:")
+        logging.error("STDOUT: %s", e.stdout)
+        logging.error("STDERR: %s", e.stderr)
+
+
+class InProcessDetector:
+    """YOLOv5, загруженная один раз через torch.hub и работающая в памяти сервиса.
+    Возвращает массив N×6 в том же формате, что и --save-txt --save-conf:
+    class, x_center, y_center, width, height, conf (нормализованные)"""
+
+    def __init__(self, yolo_dir, yolo_weights, conf=0.69, device=None):
+        import torch
+        self.model = torch.hub.load(yolo_dir, "custom", path=yolo_weights, source="local")
+        self.model.conf = conf
+        if device is not None:
+            self.model.to(device)
+        self.model.eval()
+
+    def detect(self, image):
+        import torch
+        with torch.inference_mode():
+            results = self.model(image)
+
+        # xywhn: x_center, y_center, width, height, conf, class
+        boxes = results.xywhn[0].cpu().numpy()
+        return boxes[:, [5, 0, 1, 2, 3, 4]]
+
+
+class SubprocessDetector:
+    """Запасной режим: запуск detect.py отдельным процессом с чтением файла меток"""
+
+    def __init__(self, yolo_dir, yolo_weights, conf=0.69):
+        self.yolo_dir = yolo_dir
+        self.yolo_weights = yolo_weights
+        self.conf = conf
+
+    def detect(self, image):
+        with tempfile.TemporaryDirectory() as base_dir:
+            image_path = os.path.join(base_dir, "input.jpg")
+            image.convert("RGB").save(image_path, format="JPEG")
+
+            bbox_dir = os.path.join(base_dir, "bbox")
+            run_yolo_subprocess(image_path, bbox_dir, self.yolo_weights, self.yolo_dir, self.conf)
+
+            label_path = os.path.join(bbox_dir, "result", "labels", "input.txt")
+            if not os.path.exists(label_path):
+                logging.error(f"[ERROR] Файл меток не найден: {label_path}")
+                return np.empty((0, 6), dtype=np.float32)
+
+            return np.asarray(crop.read_coords(label_path) or [], dtype=np.float32).reshape(-1, 6)
+
+
+def load_detector(mode, yolo_dir, yolo_weights, conf=0.69, device=None):
+    """Создаёт детектор по названию режима: inprocess или subprocess"""
+    if mode == "subprocess":
+        return SubprocessDetector(yolo_dir, yolo_weights, conf)
+    if mode == "inprocess":
+        return InProcessDetector(yolo_dir, yolo_weights, conf, device)
+    raise ValueError(f"Неизвестный режим YOLO: {mode}")
@@ -0,0 +1,89 @@
+from io import BytesIO
+from PIL import Image, ImageSequence, UnidentifiedImageError
+
+PDF_MAGIC = b"%PDF"
+
+
+class DocumentError(ValueError):
+    """Файл нельзя разобрать на страницы"""
+
+
+class TooManyPagesError(DocumentError):
+    pass
+
+
+def iter_pdf_pages(contents, dpi=200):
+    """Рендерит страницы PDF по одной; нужен pypdfium2"""
+    try:
+        import pypdfium2
+    except ImportError as e:
+        raise DocumentError("Обработка PDF недоступна: не установлен pypdfium2") from e
+
+    document = pypdfium2.PdfDocument(contents)
+    try:
+        for index in range(len(document)):
+            page = document[index]
+            try:
+                yield page.render(scale=dpi / 72).to_pil().convert("RGB")
+            finally:
+                page.close()
+    finally:
+        document.close()
+
+
+def fit_image(image, max_side=0):
+    """Декодирует изображение в RGB. Если длинная сторона больше max_side хотя бы вдвое,
+    изображение уменьшается в целое число раз так, чтобы она осталась не меньше max_side.
+    JPEG при этом декодируется в режиме draft: libjpeg сразу выдаёт растр в 1/2-1/8 размера
+    без полноразмерного промежуточного, остальные форматы сжимаются через reduce"""
+    factor = max(image.size) // max_side if max_side else 1
+    if factor >= 2:
+        width, height = image.size
+        image.draft("RGB", (width // factor, height // factor))
+        factor = max(image.size) // max_side
+        if factor >= 2:
+            image = image.reduce(factor)
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    image.load()
+    return image
+
+
+def open_image(contents, max_side=0):
+    """Одно изображение из байтов: единственное декодирование на весь запрос"""
+    try:
+        image = Image.open(BytesIO(contents))
+    except UnidentifiedImageError as e:
+        raise DocumentError("Файл не является изображением") from e
+    return fit_image(image, max_side)
+
+
+def iter_image_pages(contents, max_side=0):
+    """Кадры TIFF (и других многостраничных форматов) по одному, обычное изображение - одной страницей"""
+    try:
+        image = Image.open(BytesIO(contents))
+    except UnidentifiedImageError as e:
+        raise DocumentError("Файл не является изображением или PDF") from e
+
+    with image:
+        if getattr(image, "n_frames", 1) == 1:
+            yield fit_image(image, max_side)
+            return
+        for frame in ImageSequence.Iterator(image):
+            yield fit_image(frame.convert("RGB"), max_side)
+
+
+def iter_pages(files, max_pages=50, dpi=200, max_side=0):
+    """Страницы всех файлов по порядку. files - список пар (имя, содержимое).
+    Страницы декодируются по мере запроса, в памяти одновременно находится одна."""
+    count = 0
+    for _, contents in files:
+        if contents.startswith(PDF_MAGIC):
+            pages = iter_pdf_pages(contents, dpi)
+        else:
+            pages = iter_image_pages(contents, max_side)
+        for page in pages:
+            count += 1
+            if count > max_pages:
+                raise TooManyPagesError(f"Слишком много страниц, максимум {max_pages}")
+            yield page
@@ -1,19 +1,274 @@
-from fastapi import FastAPI, UploadFile, File
-from PIL import Image
-from io import BytesIO
-from recognizer_service.pipeline import process_image_pipeline
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI, UploadFile, File, Request, HTTPException
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest, multiprocess
+from recognizer_service import config
+from recognizer_service.workers import InferencePool
+from recognizer_service.cache import (make_result_cache, image_key, perceptual_key, fingerprint_distance,
+                                     result_dict, RESULT_FIELDS)
+from recognizer_service.documents import DocumentError, TooManyPagesError, open_image
+from bot_utils.speller import close_speller
+from bot_utils.grammar_pool import get_grammar_pool
+from bot_utils import metrics
+
+pool = InferencePool(config.worker_kind, config.worker_count, config.worker_queue_size, config.warmup)
+result_cache = make_result_cache(config.cache_backend, config.cache_max_items,
+                                 config.cache_ttl, config.cache_path)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # модели грузятся в фоне: /health отвечает сразу, /ready - после загрузки и прогрева
+    loading = asyncio.get_running_loop().run_in_executor(None, pool.start)
+    loading.add_done_callback(lambda future: future.cancelled() or future.exception())
+    yield
+    pool.shutdown()
+    close_speller()
+    get_grammar_pool().close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def wait_for_job(request, job):
+    """Ждёт результат задачи, отменяя её, если клиент отключился.
+    Возвращает пару (результат, замеры этапов в воркере) или None после отключения."""
+    waiter = asyncio.wrap_future(job.future)
+    while True:
+        done, _ = await asyncio.wait({waiter}, timeout=0.5)
+        if done:
+            return waiter.result()
+        if await request.is_disconnected():
+            job.cancel()
+            logging.info("Клиент отключился, задача распознавания отменена")
+            return None
+
+
+def cache_lookup(keys):
+    """keys - пары (ключ, отпечаток). Для перцептивного ключа в кэше лежит пара
+    (отпечаток, результат), и результат отдаётся, только если отпечатки близки"""
+    if result_cache is None:
+        return None
+    for key, fingerprint in keys:
+        result = result_cache.get(key)
+        if result is None:
+            continue
+        if fingerprint is None:
+            return result
+        stored, result = result
+        if fingerprint_distance(stored, fingerprint) <= config.cache_perceptual_distance:
+            return tuple(result)
+    return None
+
+
+def cache_store(keys, result):
+    # пустой результат может быть следствием сбоя, его не кэшируем
+    if result_cache is None or not result[0]:
+        return
+    for key, fingerprint in keys:
+        result_cache.set(key, result if fingerprint is None else (fingerprint, result))
+
+
+def submit_or_reject(name, *args):
+    if not pool.ready:
+        raise HTTPException(status_code=503, detail="Модели ещё загружаются, попробуйте позже",
+                            headers={"Retry-After": "5"})
+    job = pool.try_submit(name, *args)
+    if job is None:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, попробуйте позже",
+                            headers={"Retry-After": "1"})
+    return job
+
+
+def read_image(contents):
+    """Ищет результат в кэше, при промахе декодирует изображение.
+    Возвращает ключи кэша, найденный результат и изображение."""
+    keys = [(image_key(contents), None)]
+    result = cache_lookup(keys)
+    image = None
+
+    if result is None:
+        try:
+            image = open_image(contents, config.image_max_side)
+        except DocumentError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        if config.cache_perceptual and result_cache is not None:
+            keys.append(perceptual_key(image))
+            result = cache_lookup(keys[1:])
+
+    if result_cache is not None:
+        metrics.CACHE_LOOKUPS.labels("hit" if result is not None else "miss").inc()
+    return keys, result, image
+
+
+async def read_upload(request):
+    """Байты изображения: из поля file multipart-формы или всё тело запроса целиком.
+    Второй вариант (Content-Type image/* или application/octet-stream) не требует
+    разбора формы и временного файла"""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        file = (await request.form()).get("file")
+        if file is None or isinstance(file, str):
+            raise HTTPException(status_code=422, detail="Нет файла в поле file")
+        return await file.read()
+    contents = await request.body()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Пустое тело запроса")
+    return contents
+
+
+def timed_response(body, timings, start, endpoint):
+    """JSON-ответ с разбивкой времени по этапам в заголовке X-Timing"""
+    with metrics.stage("response"):
+        response = JSONResponse(body)
+    timings["total"] = time.perf_counter() - start
+    metrics.REQUEST_SECONDS.labels(endpoint).observe(timings["total"])
+    response.headers["X-Timing"] = metrics.timing_header(timings)
+    return response
+
+
+def ndjson(event):
+    return json.dumps(event, ensure_ascii=False) + "\n"
 
-app = FastAPI()
 
 @app.post("/process/")
-async def process_image(file: UploadFile = File(...)):
-    contents = await file.read()
-    image = Image.open(BytesIO(contents)).convert("RGB")
+async def process_image(request: Request):
+    """Одно изображение: multipart с полем file или байты файла в теле запроса"""
+    start = time.perf_counter()
+    with metrics.collect_timings() as timings:
+        contents = await read_upload(request)
+        with metrics.stage("decode"):
+            keys, result, image = await asyncio.to_thread(read_image, contents)
+
+        if result is None:
+            job = submit_or_reject("process_image_pipeline", image)
+            outcome = await wait_for_job(request, job)
+            if outcome is None:
+                return Response(status_code=499)
+            result, worker_timings = outcome
+            timings.update(worker_timings)
+            cache_store(keys, result)
+
+        return timed_response(result_dict(result), timings, start, "/process/")
+
+
+async def stream_events(request, job, events, keys, endpoint):
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    finished = False
+    try:
+        while True:
+            try:
+                event = await loop.run_in_executor(None, events.get, True, 0.5)
+            except queue.Empty:
+                if await request.is_disconnected():
+                    logging.info("Клиент отключился, задача распознавания отменена")
+                    return
+                continue
+
+            if event is None:
+                finished = True
+                return
+            if event["type"] == "result":
+                cache_store(keys, tuple(event[field] for field in RESULT_FIELDS))
+            yield ndjson(event)
+    finally:
+        metrics.REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+        if not finished:
+            job.cancel()
+
+
+@app.post("/process/stream")
+async def process_image_stream(request: Request):
+    """Потоковое распознавание: NDJSON с событием на каждую строку и итоговым результатом"""
+    contents = await read_upload(request)
+    keys, result, image = await asyncio.to_thread(read_image, contents)
+
+    if result is not None:
+        event = {"type": "result", **result_dict(result)}
+        return StreamingResponse(iter([ndjson(event)]), media_type="application/x-ndjson")
+
+    events = pool.make_event_queue()
+    job = submit_or_reject("stream_image_pipeline", events, image)
+    return StreamingResponse(stream_events(request, job, events, keys, "/process/stream"),
+                             media_type="application/x-ndjson")
+
+
+async def read_documents(files):
+    if len(files) > config.batch_max_files:
+        raise HTTPException(status_code=413, detail=f"Слишком много файлов, максимум {config.batch_max_files}")
+    return [(file.filename, await file.read()) for file in files]
+
+
+@app.post("/process/batch")
+async def process_batch(request: Request, files: List[UploadFile] = File(...)):
+    """Несколько изображений, PDF или многостраничных TIFF одним заданием:
+    текст по каждой странице и общий текст документа"""
+    start = time.perf_counter()
+    with metrics.collect_timings() as timings:
+        documents = await read_documents(files)
+        job = submit_or_reject("process_document_pipeline", documents)
+        try:
+            outcome = await wait_for_job(request, job)
+        except TooManyPagesError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except DocumentError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        if outcome is None:
+            return Response(status_code=499)
+        result, worker_timings = outcome
+        timings.update(worker_timings)
+        return timed_response(result, timings, start, "/process/batch")
+
+
+@app.post("/process/batch/stream")
+async def process_batch_stream(request: Request, files: List[UploadFile] = File(...)):
+    """Потоковый вариант /process/batch: события line и page по мере готовности, в конце result"""
+    documents = await read_documents(files)
+    events = pool.make_event_queue()
+    job = submit_or_reject("stream_document_pipeline", events, documents)
+    return StreamingResponse(stream_events(request, job, events, [], "/process/batch/stream"),
+                             media_type="application/x-ndjson")
+
+
+@app.get("/health")
+async def health():
+    """Liveness: процесс жив и отвечает на запросы"""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: модели загружены и прогреты, сервис принимает задачи"""
+    if pool.ready:
+        return {"status": "ready"}
+    status = "failed" if pool.error else "loading"
+    return JSONResponse({"status": status, "error": pool.error}, status_code=503)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Метрики Prometheus. В режиме process воркеры пишут метрики в PROMETHEUS_MULTIPROC_DIR,
+    здесь они собираются вместе"""
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
 
-    recognized_text, corrected_text, errors = process_image_pipeline(image)
 
-    return {
-        "recognized_text": recognized_text,
-        "corrected_text": corrected_text,
-        "errors": errors
-    }
+@app.get("/stats")
+async def stats():
+    result = {"pool": pool.stats()}
+    if pool.kind == "thread" and pool.ready:
+        from recognizer_service.pipeline import batcher
+        result["batching"] = batcher.stats()
+    if result_cache is not None:
+        result["cache"] = result_cache.stats()
+    return result
@@ -1,101 +1,283 @@
-import sys, os
-import torch
-import tempfile
-import subprocess
+import time
 import logging
-from PIL import Image
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
-from bot_utils.check_spelling import check_spelling_and_grammar
-from bot_utils import crop
+import threading
+import torch
+from collections import deque
+from concurrent.futures import CancelledError
+from PIL import Image, ImageDraw
+from transformers import TrOCRProcessor
+from bot_utils.check_spelling import correct_text
+from bot_utils.grammar_pool import get_grammar_pool
+from bot_utils import crop, layout, metrics
 from bot_utils.resize import resize_with_aspect_and_padding
-
-root_dir = os.getcwd()
-parent_root_dir = os.path.dirname(root_dir)
-yolo_dir = os.path.join(parent_root_dir, "yolo_v5", "yolov5")
-yolo_weights = os.path.join(root_dir, "models", "yolov5", "best.pt")
-model_dir = os.path.join(root_dir, "models", "trocr", "v7", "model")
-processor_dir = os.path.join(root_dir, "models", "trocr", "v7", "processor")
+from recognizer_service import config
+from recognizer_service.cache import RESULT_FIELDS
+from recognizer_service.detector import load_detector
+from recognizer_service.documents import iter_pages
+from recognizer_service.backends import load_backend
+from recognizer_service.batching import BatchingEngine, plan_micro_batches, max_length_for, batch_timings
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
-processor = TrOCRProcessor.from_pretrained(processor_dir)
-model = VisionEncoderDecoderModel.from_pretrained(model_dir).to(device)
-
-def run_yolo_subprocess(image_path, output_dir, yolo_weights):
-    python_executable = sys.executable
-
-    command = [
-        python_executable, "detect.py",
-        "--weights", yolo_weights,
-        "--source", image_path,
-        "--conf", "0.69",
-        "--save-txt",
-        "--save-conf",
-        "--project", output_dir,
-        "--name", "result",
-        "--exist-ok"
-    ]
+
+# модели загружаются не при импорте, а в load_models() из жизненного цикла пула
+processor = None
+recognizer = None
+detector = None
+batcher = None
+_load_lock = threading.Lock()
+
+
+def load_models():
+    """Загружает процессор, TrOCR и детектор, запускает батчер и пул LanguageTool.
+    Повторные вызовы ничего не делают."""
+    global processor, recognizer, detector, batcher
+    with _load_lock:
+        if batcher is not None:
+            return
+
+        start = time.perf_counter()
+        load_options = {"low_cpu_mem_usage": config.low_cpu_mem_usage}
+        if config.use_safetensors is not None:
+            load_options["use_safetensors"] = config.use_safetensors
+
+        processor = TrOCRProcessor.from_pretrained(config.processor_dir)
+        recognizer = load_backend(config.trocr_backend, config.model_dir, device, config.onnx_dir,
+                                  config.compile_mode, config.trocr_decoder, config.repeat_stop, load_options)
+        detector = load_detector(config.yolo_mode, config.yolo_dir, config.yolo_weights, config.yolo_conf, device)
+        try:
+            get_grammar_pool().start()
+        except Exception as e:
+            # без LanguageTool сервис работает, проверка грамматики попробует запустить его при запросе
+            logging.warning(f"LanguageTool не запущен: {e}")
+        batcher = BatchingEngine(recognize_crops, config.batch_max_size, config.batch_max_wait_ms)
+        logging.info(f"Модели загружены за {time.perf_counter() - start:.1f} с")
+
+
+def warm_up():
+    """Прогоняет детектор и TrOCR на синтетической странице, чтобы ленивые
+    инициализации (аллокаторы, компиляция, потоки) не достались первому запросу"""
+    start = time.perf_counter()
+    page = Image.new("RGB", (640, 480), (255, 255, 255))
+    ImageDraw.Draw(page).rectangle((100, 200, 300, 260), fill=(0, 0, 0))
+    detector.detect(page)
+    recognize_crops([page.crop((80, 180, 320, 280)), page.crop((80, 180, 160, 280))])
+    logging.info(f"Прогрев выполнен за {time.perf_counter() - start:.1f} с")
+
+
+def recognize_crops(crops):
+    """Распознаёт батч вырезанных слов. Кропы приводятся к 384x384 и идут в модель
+    микробатчами из слов близкой длины, у каждого микробатча свой max_length"""
+    aspects = [crop_image.width / max(crop_image.height, 1) for crop_image in crops]
+    texts = [None] * len(crops)
+
+    for micro_batch in plan_micro_batches(aspects, config.micro_batch_size):
+        with metrics.stage("resize"):
+            images = [
+                resize_with_aspect_and_padding(crops[i], resample=config.resample, reducing_gap=config.reducing_gap)
+                for i in micro_batch
+            ]
+        with metrics.stage("processor"):
+            pixel_values = processor(images=images, return_tensors="pt").pixel_values
+        if config.tokens_per_aspect:
+            row_max_lengths = [max_length_for(aspects[i], config.tokens_per_aspect, config.max_length)
+                               for i in micro_batch]
+        else:
+            row_max_lengths = [config.max_length] * len(micro_batch)
+        with metrics.stage("generate"):
+            generated_ids = recognizer.generate(pixel_values, max(row_max_lengths), row_max_lengths)
+
+        with metrics.stage("decode_tokens"):
+            decoded = processor.batch_decode(generated_ids, skip_special_tokens=True)
+        for i, text in zip(micro_batch, decoded):
+            texts[i] = text
+
+    return texts
+
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise CancelledError()
+
+
+NO_TEXT_ERROR = "⚠️ Не удалось распознать текст: YOLO не нашёл текст на изображении."
+
+
+def submit_page(image, cancel_event=None):
+    """Детекция и разбивка страницы на строки. Кропы всех строк сразу ставятся в батчер,
+    ожидания распознавания нет. Возвращает списки Future по строкам или None, если текста нет."""
+    width, height = image.size
+
+    with metrics.stage("detect"):
+        boxes = detector.detect(image)
+    metrics.CROPS_PER_PAGE.observe(len(boxes))
+    if not len(boxes):
+        return None
+
+    with metrics.stage("crop"):
+        lines = page_lines(boxes, width, height)
+        _check_cancelled(cancel_event)
+        crops = [crop.crop_images(image, line) for line in lines]
+    # все строки ставятся в очередь сразу, чтобы батчер мог собрать полные батчи
+    return [batcher.submit_nowait(line_crops, cancel_event) for line_crops in crops]
+
+
+def page_lines(boxes, width, height):
+    """Рамки детектора в пикселях, без вырожденных и дублей, сгруппированные в строки в порядке чтения"""
+    pixel_boxes = crop.to_pixel_boxes(boxes, width, height)
+    # рамки, целиком вышедшие за край изображения, после обрезки вырождаются
+    valid = (pixel_boxes[:, 2] > pixel_boxes[:, 0]) & (pixel_boxes[:, 3] > pixel_boxes[:, 1])
+    boxes, pixel_boxes = boxes[valid], pixel_boxes[valid]
+    if config.dedupe_threshold:
+        keep = crop.deduplicate_boxes(pixel_boxes, boxes[:, 5], config.dedupe_threshold, config.dedupe_mode)
+        pixel_boxes = pixel_boxes[keep]
+    if config.layout_engine == "layout":
+        line_indices = layout.analyze_layout(pixel_boxes, config.layout_columns).lines
+    else:
+        line_indices = crop.group_lines_array(pixel_boxes)
+    return [[tuple(pixel_boxes[i].tolist()) for i in line] for line in line_indices]
+
+
+def iter_page_events(line_futures, cancel_event=None, page=None):
+    """Дожидается строк страницы и выдаёт события line, в конце - итог страницы с проверкой орфографии"""
+    if line_futures is None:
+        yield {"type": "result", "recognized_text": "", "corrected_text": "", "errors": NO_TEXT_ERROR,
+               "corrections": []}
+        return
+
+    texts = []
+    waited = 0.0
+    for index, futures in enumerate(line_futures):
+        start = time.perf_counter()
+        line_text = " ".join(future.result() for future in futures).strip()
+        waited += time.perf_counter() - start
+        texts.append(line_text)
+        event = {"type": "line", "index": index, "text": line_text}
+        if page is not None:
+            event["page"] = page
+        yield event
+
+    # ожидание батчера: распознавание строк этого запроса вместе с очередью
+    metrics.record("recognize", waited)
+    # этапы TrOCR (resize, processor, generate, decode_tokens) батчей с кропами этой страницы
+    metrics.add_timings(batch_timings([future for futures in line_futures for future in futures]))
+    # строки страницы - отдельными строками текста, проверка орфографии тоже идёт по ним
+    recognized_text = "\n".join(text for text in texts if text).strip()
+
+    _check_cancelled(cancel_event)
+    with metrics.stage("spelling"):
+        corrected_text, corrections, errors = correct_text(recognized_text)
+
+    yield {
+        "type": "result",
+        "recognized_text": recognized_text,
+        "corrected_text": corrected_text,
+        "errors": errors,
+        # смещения исправлений - в recognized_text
+        "corrections": corrections
+    }
+
+
+def iter_image_pipeline(image_pil, cancel_event=None):
+    """Потоковый вариант пайплайна. Выдаёт события по мере готовности:
+    {"type": "line", ...} для каждой распознанной строки и в конце {"type": "result", ...}"""
+    # open_image уже отдаёт RGB, лишняя копия страницы не нужна
+    if image_pil.mode != "RGB":
+        image_pil = image_pil.convert("RGB")
+    line_futures = submit_page(image_pil, cancel_event)
+    yield from iter_page_events(line_futures, cancel_event)
+
+
+def combine_pages(pages):
+    """Общий текст документа из итогов страниц и исправления со смещениями в общем тексте"""
+    recognized = [page["recognized_text"] for page in pages if page["recognized_text"]]
+    corrections = []
+    offset = 0
+    for page in pages:
+        if page["recognized_text"]:
+            corrections += [dict(c, offset=c["offset"] + offset, page=page["index"])
+                            for c in page["corrections"]]
+            offset += len(page["recognized_text"]) + 2
+    corrected = [page["corrected_text"] for page in pages if page["corrected_text"]]
+    if len(pages) == 1:
+        errors = pages[0]["errors"]
+    else:
+        errors = "\n\n".join(f"📄 Страница {page['index'] + 1}:\n{page['errors']}"
+                              for page in pages if page["errors"])
+    return "\n\n".join(recognized), "\n\n".join(corrected), errors, corrections
+
+
+def iter_document_pipeline(files, cancel_event=None):
+    """Многостраничный вариант. files - список пар (имя, содержимое): изображения, PDF и TIFF.
+
+    Страницы декодируются по одной. Пока TrOCR распознаёт строки одной страницы, для
+    следующих уже идёт детекция, и их кропы попадают в тот же батчер; одновременно
+    в работе не больше config.pages_in_flight страниц. События: line (с номером страницы),
+    page - итог страницы и в конце result с общим текстом и списком страниц."""
+    page_images = iter_pages(files, config.max_pages, config.pdf_dpi, config.image_max_side)
+    pending = deque()
+    pages = []
+
+    while True:
+        while len(pending) < config.pages_in_flight:
+            image = next(page_images, None)
+            if image is None:
+                break
+            _check_cancelled(cancel_event)
+            pending.append(submit_page(image, cancel_event))
+        if not pending:
+            break
+
+        index = len(pages)
+        for event in iter_page_events(pending.popleft(), cancel_event, index):
+            if event["type"] == "result":
+                event = dict(event, type="page", index=index)
+                pages.append(event)
+            yield event
+
+    recognized_text, corrected_text, errors, corrections = combine_pages(pages)
+    yield {
+        "type": "result",
+        "recognized_text": recognized_text,
+        "corrected_text": corrected_text,
+        "errors": errors,
+        "corrections": corrections,
+        "pages": [{key: page[key] for key in ("index", "recognized_text", "corrected_text", "errors", "corrections")}
+                  for page in pages],
+    }
+
+
+def process_image_pipeline(image_pil, cancel_event=None):
+    for event in iter_image_pipeline(image_pil, cancel_event):
+        if event["type"] == "result":
+            return tuple(event[field] for field in RESULT_FIELDS)
+
+
+def process_document_pipeline(files, cancel_event=None):
+    for event in iter_document_pipeline(files, cancel_event):
+        if event["type"] == "result":
+            del event["type"]
+            return event
+
+
+def put_events(events, iterator):
+    """Складывает события из iterator в очередь events, в конце кладёт None"""
     try:
-        result = subprocess.run(
-            command,
-            cwd=yolo_dir,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        logging.info("[YOLO STDOUT]: %s", result.stdout)
-        logging.debug("[YOLO STDERR]: %s", result.stderr)
-    except subprocess.CalledProcessError as e:
-        logging.error("[ERROR] YOLOv5 subprocess failed:")
-        logging.error("STDOUT: %s", e.stdout)
-        logging.error("STDERR: %s", e.stderr)
-
-def convert_to_jpeg(image_pil, output_path):
-    image_pil.convert("RGB").save(output_path, format="JPEG")
-    return output_path
-
-
-def process_image_pipeline(image_pil):
-    with tempfile.TemporaryDirectory() as base_dir:
-        image_dir = os.path.join(base_dir, "input_images")
-        bbox_dir = os.path.join(base_dir, "bbox")
-        cropped_dir = os.path.join(base_dir, "crops")
-
-        for path in [image_dir, bbox_dir, cropped_dir]:
-            os.makedirs(path, exist_ok=True)
-
-        image_path = os.path.join(image_dir, "input.jpg")
-        image = image_pil.convert("RGB")
-        image.save(image_path, format="JPEG")
-        width, height = image.size
-
-        run_yolo_subprocess(image_path, bbox_dir, yolo_weights)
-
-        label_path = os.path.join(bbox_dir, "result", "labels", "input.txt")
-        if not os.path.exists(label_path):
-            logging.error(f"[ERROR] Файл меток не найден: {label_path}")
-            return "", "", "⚠️ Не удалось распознать текст: YOLO не нашёл текст на изображении."
-
-        normalized_coords = crop.read_coords(label_path)
-        pixel_coords = crop.convert_to_pixel_coords(normalized_coords, width, height)
-        sorted_coords = crop.sort_coords(pixel_coords)
-        crop.crop_and_save_images(image_path, sorted_coords, cropped_dir)
-
-        imgs = [
-            resize_with_aspect_and_padding(
-                Image.open(os.path.join(cropped_dir, f"cropped_image{i + 1}.jpg")).convert("RGB"))
-            for i in range(len(sorted_coords))
-        ]
-
-        pixel_values = processor(images=imgs, return_tensors="pt").pixel_values.to(device)
-        generated_ids = model.generate(
-            pixel_values,
-            max_length=256,
-            num_beams=1,
-            do_sample=False
-        )
-
-        texts = processor.batch_decode(generated_ids, skip_special_tokens=True)
-        recognized_text = " ".join(texts)
-        corrected_text, errors = check_spelling_and_grammar(recognized_text.strip())
-
-        return recognized_text.strip(), corrected_text.strip(), errors
\ No newline at end of file
+        for event in iterator:
+            if event["type"] == "result":
+                event["timing"] = dict(metrics.current_timings() or {})
+            events.put(event)
+    except CancelledError:
+        pass
+    except Exception as e:
+        events.put({"type": "error", "detail": str(e)})
+        raise
+    finally:
+        events.put(None)
+
+
+def stream_image_pipeline(events, image_pil, cancel_event=None):
+    put_events(events, iter_image_pipeline(image_pil, cancel_event))
+
+
+def stream_document_pipeline(events, files, cancel_event=None):
+    put_events(events, iter_document_pipeline(files, cancel_event))
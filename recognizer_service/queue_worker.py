@@ -0,0 +1,147 @@
+"""Воркер очереди заданий: забирает задания, поставленные ботом в режиме RECOGNIZER_MODE=queue,
+распознаёт их и записывает результат обратно в очередь.
+
+    python -m recognizer_service.queue_worker --threads 4
+    python -m recognizer_service.queue_worker --stats
+    python -m recognizer_service.queue_worker --dead
+    python -m recognizer_service.queue_worker --requeue 42
+
+Воркеров можно запустить сколько угодно. Бэкенд sqlite рассчитан на одну машину
+(общий файл JOB_QUEUE_PATH), для узлов на разных машинах нужен сетевой бэкенд
+с тем же интерфейсом в make_job_queue. Потоки одного воркера делят модели и батчер,
+поэтому кропы разных заданий распознаются общими батчами.
+"""
+import time
+import socket
+import signal
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from bot_utils.job_queue import get_job_queue, JOB_LEASE
+from bot_utils import metrics
+from recognizer_service import config
+from recognizer_service.cache import result_dict
+from recognizer_service.documents import DocumentError, open_image
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def run_job(job):
+    """Распознаёт задание и возвращает результат в формате ответов /process/ и /process/batch"""
+    from recognizer_service import pipeline
+    if job.kind == "image":
+        _, contents = job.files[0]
+        with metrics.stage("decode"):
+            image = open_image(contents, config.image_max_side)
+        return result_dict(pipeline.process_image_pipeline(image))
+    if job.kind == "document":
+        return pipeline.process_document_pipeline(job.files)
+    raise DocumentError(f"Неизвестный тип задания: {job.kind}")
+
+
+@contextmanager
+def heartbeat(queue, job, lease):
+    """Продлевает аренду задания, пока оно выполняется: длинный PDF или холодная модель
+    не должны приводить к повторной выдаче задания другому воркеру"""
+    done = threading.Event()
+
+    def beat():
+        while not done.wait(lease / 3):
+            if not queue.extend_lease(job, lease):
+                logging.warning(f"Задание {job.id}: аренда потеряна, результат этой попытки не будет записан")
+                return
+
+    thread = threading.Thread(target=beat, name=f"lease-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def work(queue, name, stop, lease, poll_interval):
+    while not stop.is_set():
+        job = queue.claim(name, lease)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+
+        start = time.perf_counter()
+        try:
+            with heartbeat(queue, job, lease), metrics.collect_timings() as timings:
+                result = run_job(job)
+        except DocumentError as e:
+            # повтор не поможет: файл битый или страниц слишком много
+            logging.warning(f"Задание {job.id}: {e}")
+            queue.fail(job, str(e), retry=False)
+        except Exception as e:
+            logging.exception(f"Задание {job.id}, попытка {job.attempts}: ошибка распознавания")
+            queue.fail(job, f"{type(e).__name__}: {e}")
+        else:
+            result["timing"] = timings
+            queue.complete(job, result)
+            logging.info(f"Задание {job.id} ({job.kind}) выполнено за {time.perf_counter() - start:.2f} с")
+
+
+def print_dead(queue):
+    for job in queue.dead_letters():
+        files = ", ".join(name for name, _ in job.files)
+        print(f"{job.id}\t{job.kind}\tпопыток {job.attempts}\t{job.meta}\t{files}\t{job.error}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=config.worker_count, help="параллельных заданий")
+    parser.add_argument("--lease", type=float, default=JOB_LEASE,
+                        help="через сколько секунд задание без отчёта выдаётся другому воркеру")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--name", default=socket.gethostname())
+    parser.add_argument("--metrics-port", type=int, help="порт для метрик Prometheus воркера")
+    parser.add_argument("--stats", action="store_true", help="показать число заданий по статусам")
+    parser.add_argument("--dead", action="store_true", help="показать dead letter")
+    parser.add_argument("--requeue", type=int, nargs="+", help="вернуть задания из dead letter в очередь")
+    parser.add_argument("--purge-dead", action="store_true", help="удалить доставленные dead letter")
+    args = parser.parse_args()
+
+    queue = get_job_queue()
+    if args.stats or args.dead or args.requeue or args.purge_dead:
+        if args.requeue:
+            for job_id in args.requeue:
+                print(f"{job_id}: {'в очереди' if queue.requeue(job_id) else 'не найдено в dead letter'}")
+        if args.purge_dead:
+            print(f"удалено: {queue.purge_dead()}")
+        if args.dead:
+            print_dead(queue)
+        if args.stats:
+            print(queue.stats())
+        return
+
+    if args.metrics_port:
+        from prometheus_client import start_http_server
+        start_http_server(args.metrics_port)
+
+    from recognizer_service import pipeline
+    pipeline.load_models()
+    if config.warmup:
+        pipeline.warm_up()
+
+    stop = threading.Event()
+    # задания, начатые до остановки, дорабатываются; не успевшие отчитаться вернутся по истечении аренды
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    threads = [threading.Thread(target=work, name=f"queue-worker-{i}",
+                                args=(queue, f"{args.name}/{i}", stop, args.lease, args.poll_interval))
+               for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    logging.info(f"Воркер очереди {args.name} запущен, потоков: {args.threads}")
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(0.5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from bot_utils import metrics
+
+
+def _init_process(torch_threads, warmup):
+    """Инициализация процесса-воркера: ограничивает потоки torch и загружает модели"""
+    import torch
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+
+    load_pipeline(warmup)
+
+
+def load_pipeline(warmup=False):
+    """Загружает модели пайплайна в текущем процессе и при необходимости прогревает их"""
+    from recognizer_service import pipeline
+    pipeline.load_models()
+    if warmup:
+        pipeline.warm_up()
+
+
+def run_pipeline(name, *args, **kwargs):
+    """Вызывает функцию из recognizer_service.pipeline по имени.
+    Модуль с моделями импортируется только внутри воркера.
+    Возвращает результат и замеры этапов {этап: секунды}."""
+    from recognizer_service import pipeline
+    pipeline.load_models()
+    with metrics.collect_timings() as timings:
+        result = getattr(pipeline, name)(*args, **kwargs)
+    return result, timings
+
+
+class InferenceJob:
+    def __init__(self, future, cancel_event):
+        self.future = future
+        self.cancel_event = cancel_event
+
+    def cancel(self):
+        """Снимает задачу из очереди, а уже запущенной сообщает об отмене"""
+        self.cancel_event.set()
+        self.future.cancel()
+
+
+class InferencePool:
+    """Пул воркеров для инференса с ограниченной очередью допуска.
+
+    thread - потоки в одном процессе (модели общие, подходит для GPU),
+    process - отдельные процессы со своими копиями моделей (для CPU-хостов).
+    Одновременно принимается не больше workers + max_queue задач,
+    остальные сразу получают отказ."""
+
+    def __init__(self, kind="thread", workers=2, max_queue=8, warmup=True):
+        self.kind = kind
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.warmup = warmup
+        # ready - модели загружены во всех воркерах, error - причина неудачной загрузки
+        self.ready = False
+        self.error = None
+
+        if kind == "process":
+            torch_threads = max(1, (os.cpu_count() or 1) // workers)
+            self._executor = ProcessPoolExecutor(
+                workers, initializer=_init_process, initargs=(torch_threads, warmup))
+        elif kind == "thread":
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix="inference")
+        else:
+            raise ValueError(f"Неизвестный тип пула: {kind}")
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._manager = None
+
+    def start(self):
+        """Загружает и прогревает модели заранее, чтобы первый запрос не ждал их загрузки.
+        Вызывается в фоне: пока загрузка идёт, сервис жив, но не готов принимать задачи."""
+        try:
+            if self.kind == "thread":
+                load_pipeline(self.warmup)
+            else:
+                futures = [self._executor.submit(os.getpid) for _ in range(self.workers)]
+                for future in futures:
+                    future.result()
+        except Exception as e:
+            self.error = str(e)
+            logging.exception(f"[ERROR] Не удалось загрузить модели: {e}")
+            raise
+        self.ready = True
+        logging.info(f"Пул инференса запущен: {self.kind} x{self.workers}")
+
+    def _get_manager(self):
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager
+
+    def make_event_queue(self):
+        """Очередь для потоковой передачи событий из воркера"""
+        if self.kind == "thread":
+            return queue.Queue()
+        return self._get_manager().Queue()
+
+    def make_cancel_event(self):
+        """Флаг отмены, видимый воркеру: в режиме process - через Manager,
+        иначе уже запущенная в другом процессе задача не узнала бы об отключении клиента"""
+        if self.kind == "thread":
+            return threading.Event()
+        return self._get_manager().Event()
+
+    def try_submit(self, name, *args, **kwargs):
+        """Ставит задачу в пул. Возвращает None, если очередь переполнена."""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                return None
+            self._in_flight += 1
+
+        cancel_event = self.make_cancel_event()
+        kwargs["cancel_event"] = cancel_event
+
+        future = self._executor.submit(run_pipeline, name, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return InferenceJob(future, cancel_event)
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "ready": self.ready,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()